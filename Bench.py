@@ -0,0 +1,791 @@
+#Benchmarks for RM2C internals. These don't need a rom unless noted.
+#usage: python Bench.py name [name ...] [arg=value ...]
+#args are passed to every benchmark that takes them, e.g. rom=baserom.us.z64
+#run with no args to see the list of benchmarks
+import sys
+import time
+import random
+
+def Timed(func,*args,reps=1):
+    t = time.perf_counter()
+    for i in range(reps):
+        res = func(*args)
+    return [(time.perf_counter()-t)/reps,res]
+
+#Random.randbytes is 3.9 and up, this gives the same bytes on older pythons
+def RandBytes(rng,n):
+    return rng.getrandbits(n*8).to_bytes(n,'little')
+
+#a levels='all' export of a typical RM hack does a few thousand label lookups
+#(one per object, geo asm node, behavior jump/call and jal). This replays that many.
+def BenchSymbols(lookups=5000):
+    import os
+    import MapIndex
+    name = 'sm64.us.map'
+    f = open(name,'r')
+    lines = f.readlines()
+    f.close()
+    def Scan(addr):
+        for l in lines:
+            if addr in l:
+                q = l.rfind(" ")
+                return l[q:-1]
+        return "0x"+addr
+    cache = name+'.pickle'
+    if os.path.exists(cache):
+        os.remove(cache)
+    [cold,index] = Timed(MapIndex.Load,name)
+    [warm,index] = Timed(MapIndex.Load,name)
+    rng = random.Random(0)
+    addrs = ["{:08x}".format(a[0]) for a in index.Addrs]
+    #roughly a third of lookups in a hack miss the map (custom behaviors/functions)
+    queries = [rng.choice(addrs) if rng.random()<0.66 else "{:08x}".format(rng.getrandbits(32)) for i in range(lookups)]
+    [scan,old] = Timed(lambda: [Scan(q) for q in queries])
+    [hashed,new] = Timed(lambda: [index.GetLabel(q) for q in queries])
+    assert old==new, 'index labels differ from the linear scan'
+    print('map index build {:.3f}s, cached load {:.3f}s'.format(cold,warm))
+    print('{} lookups: linear scan {:.3f}s, index {:.4f}s ({:.0f}x)'.format(lookups,scan,hashed,scan/max(hashed,1e-9)))
+
+#a synthetic 32 MB rom, decodes vertex blocks the old way (bytes + BitArray per vertex)
+#and through the mmap readers, then compares what a pool task has to pickle.
+def BenchRom(size=32*1024*1024,blocks=2000):
+    import os
+    import pickle
+    import tempfile
+    import Rom
+    from bitstring import BitArray
+    rng = random.Random(0)
+    fd,name = tempfile.mkstemp(suffix='.z64')
+    os.write(fd,RandBytes(rng,size))
+    os.close(fd)
+    try:
+        vbs = [(rng.randrange(0,size-16*64)&~15,rng.randint(4,64)) for i in range(blocks)]
+        def Old():
+            f = open(name,'rb')
+            rom = f.read()
+            f.close()
+            res = []
+            for start,num in vbs:
+                for i in range(num):
+                    V = BitArray(rom[start+i*16:start+i*16+16])
+                    res.append(V.unpack('3*int:16,uint:16,2*int:16,4*uint:8'))
+            return [rom,res]
+        def New():
+            rom = Rom.Rom(name)
+            res = []
+            for start,num in vbs:
+                res.extend(rom.Array('3hH2h4B',start,num))
+            return [rom,res]
+        [old,[orom,ores]] = Timed(Old)
+        [new,[nrom,nres]] = Timed(New)
+        assert [list(v) for v in ores]==[list(v) for v in nres], 'vertex decode differs'
+        verts = sum(v[1] for v in vbs)
+        print('{} vertices: bytes+BitArray {:.3f}s, mmap readers {:.3f}s ({:.0f}x)'.format(verts,old,new,old/max(new,1e-9)))
+        [po,p1] = Timed(pickle.dumps,orom)
+        [pn,p2] = Timed(pickle.dumps,nrom)
+        print('pickled per pool task: bytes {:.1f} MB in {:.3f}s, mmap {} bytes in {:.6f}s'.format(len(p1)/2**20,po,len(p2),pn))
+        del nrom,nres
+    finally:
+        os.remove(name)
+
+#Import cost of each run mode, measured in a fresh interpreter with -X importtime.
+#'eager' touches every deferred module, which is what importing RM2C used to cost.
+StartupModes = {
+    'import':[],
+    'Text=1':[],
+    'Misc=1':['map'],
+    'levels':['map','GW','F3D','ColParse','BinPNG','GD','BP','refdb','d_s'],
+    'eager':['map','GW','F3D','ColParse','BinPNG','GD','BP','refdb','d_s','capstone','cProfile','pstats'],
+}
+
+def BenchStartup(reps=5):
+    import subprocess
+    import os
+    root = os.path.dirname(os.path.abspath(__file__))
+    for mode,mods in StartupModes.items():
+        calls = {'map':'RM2C.GetMap()','refdb':'RM2C.RefDB.Get()'}
+        touch = [calls.get(m,'RM2C.%s.__dict__'%m) for m in mods]
+        code = '; '.join(['import RM2C',*touch])
+        walls = []
+        imps = []
+        for i in range(reps):
+            t = time.perf_counter()
+            res = subprocess.run([sys.executable,'-X','importtime','-c',code],cwd=root,capture_output=True,text=True)
+            walls.append(time.perf_counter()-t)
+            #top level imports only, their cumulative time includes everything below them
+            total = 0
+            for l in res.stderr.splitlines():
+                l = l.split('|')
+                if len(l)==3 and l[1].strip().isdigit() and not l[2].startswith('  '):
+                    total += int(l[1])
+            imps.append(total/1e6)
+        walls.sort()
+        imps.sort()
+        print('{:8} imports {:.3f}s, process {:.3f}s'.format(mode,imps[reps//2],walls[reps//2]))
+
+#vanilla comparisons: loading the data modules and scanning their lists
+#against loading the compiled db and doing set/fingerprint lookups
+def BenchRefDB():
+    import os
+    import importlib
+    import RefDB
+    if os.path.exists(RefDB.DBFile):
+        os.remove(RefDB.DBFile)
+    def Fresh():
+        for n in RefDB.Sources:
+            sys.modules.pop(n,None)
+        return [importlib.import_module(n) for n in RefDB.Sources]
+    [load,[ActorCHKSM,BehComp,ColComp]] = Timed(Fresh)
+    [cold,db] = Timed(RefDB.Get)
+    RefDB.DB = None
+    [warm,db] = Timed(RefDB.Get)
+    models = list(RefDB.Entries(ActorCHKSM).items())
+    bhvs = [(' '+k,['\t'+c.replace(',',', ') for c in v]) for k,v in RefDB.Entries(BehComp).items()]
+    def Old():
+        n = 0
+        for id,crcs in models:
+            cksm = ActorCHKSM.__dict__.get(id)
+            for c in crcs:
+                if c not in cksm:
+                    n += 1
+                    break
+        return n
+    def New():
+        return sum(db.NewModel(id,crcs) for id,crcs in models)+sum(db.NewBehavior(*b) for b in bhvs)
+    [old,a] = Timed(Old)
+    [new,b] = Timed(New)
+    assert a==b==0, 'vanilla data should all match itself'
+    print('data module import {:.3f}s, db build {:.3f}s, cached db load {:.4f}s'.format(load,cold,warm))
+    print('{} model checks with list scans {:.5f}s, {} model + {} behavior checks with the db {:.5f}s'.format(len(models),old,len(models),len(bhvs),new))
+
+#a synthetic level script: bank loads, model loads and objects with runs of cmds
+#that have no handler in between. Compares the old recursive PLC/ULC walk to LevelScript.
+def BenchLevelScript(objects=3000):
+    import os
+    import struct
+    import tempfile
+    import RM2C
+    import Rom
+    def Cmd(op,*args):
+        return bytes([op,len(args)+2,*args])
+    U32 = lambda x: list(struct.pack('>L',x))
+    rng = random.Random(0)
+    #texture scroll objects need real vertex data, leave them out
+    bhvs = [a for a,l in RM2C.GetMap().Addrs if a>>24==0x13]
+    bhvs = [a for a in bhvs if 'Scroll' not in RM2C.GetMap().GetLabel('{:08x}'.format(a))]
+    s = Cmd(0x17,0,0x19,*U32(0x100000),*U32(0x200000))+Cmd(0x1f,1,0,*U32(0x19000000))
+    for i in range(objects):
+        s += Cmd(0x32,0,0)*rng.randint(0,3)
+        s += Cmd(0x22,0,rng.randint(0,255),*U32(0x19000000+i*16))
+        s += Cmd(0x24,0x1f,rng.randint(0,255),*[rng.randint(0,255) for j in range(16)],*U32(rng.choice(bhvs)))
+    s += Cmd(0x20,0,0)+Cmd(0x0b,0,0,0,0,0,0)
+    fd,name = tempfile.mkstemp(suffix='.z64')
+    os.write(fd,bytes(0x1000)+s+bytes(0x1000))
+    os.close(fd)
+    rom = Rom.Rom(name)
+    def NewScript():
+        s = RM2C.Script(9)
+        s.Aoffset = 0
+        s.editor = 0
+        return s
+    #the old interpreter, one frame per cmd until the next handled one.
+    #Both use the current handlers.
+    def ULC(rom,start):
+        cmd = struct.unpack(">B",rom[start:start+1])[0]
+        len = struct.unpack(">B",rom[start+1:start+2])[0]
+        args = struct.unpack(">%dB"%(len-2),rom[start+2:start+len])
+        #the handlers now take a buffer
+        return [cmd,len,bytes(args)]
+    def PLC(rom,start):
+        (cmd,len,args) = ULC(rom,start)
+        start+=len
+        if cmd in RM2C.jumps:
+            return (cmd,len,args,start)
+        return PLC(rom,start)
+    def Old():
+        s = NewScript()
+        entry = 0x1000
+        while(entry):
+            q = PLC(rom,entry)
+            entry = RM2C.jumps[q[0]](rom,q,q[3],s)
+        return s
+    def New():
+        s = NewScript()
+        RM2C.LevelScript(rom,s).Run(0x1000)
+        return s
+    try:
+        [old,a] = Timed(Old)
+        [new,b] = Timed(New)
+        ao = a.levels[9][1].objects
+        bo = b.levels[9][1].objects
+        assert ao==bo and [m[:4] for m in a.models if m]==[m[:4] for m in b.models if m], 'scripts differ'
+        print('{} objects: PLC/ULC {:.3f}s, LevelScript {:.3f}s ({:.1f}x)'.format(len(ao),old,new,old/max(new,1e-9)))
+    finally:
+        del rom
+        os.remove(name)
+
+#Parses the level scripts of every level, with the entry script prefix ran per level
+#like before and restored from the snapshot. Uses rom= if given, otherwise a synthetic
+#rom with a long shared prefix and a small level script for each level.
+def BenchEntryState(rom=None,models=200,objects=20):
+    import os
+    import struct
+    import tempfile
+    import RM2C
+    import Rom
+    from RM2CData import Num2Name
+    entry = 0x108A10
+    name = None
+    if not rom:
+        def Cmd(op,*args):
+            return bytes([op,len(args)+2,*args])
+        U32 = lambda x: list(struct.pack('>L',x))
+        rng = random.Random(0)
+        bhvs = [a for a,l in RM2C.GetMap().Addrs if a>>24==0x13]
+        bhvs = [a for a in bhvs if 'Scroll' not in RM2C.GetMap().GetLabel('{:08x}'.format(a))]
+        #bank 0x15 maps to 0x200000, level scripts go after the entry script
+        s = Cmd(0x17,0,0x15,*U32(0x200000),*U32(0x300000))
+        for i in range(models):
+            s += Cmd(0x32,0,0)*rng.randint(0,2)
+            s += Cmd(0x22,0,i&0xFF,*U32(0x15000000+i*16))
+        levels = list(Num2Name.keys())
+        body = b''
+        for i,k in enumerate(levels):
+            body += Cmd(0x0c,0,0,*U32(k),*U32(0x15000000+i*0x1000))
+        body += Cmd(0x0b,0,0,0,0,0,0)
+        data = bytearray(0x300000)
+        data[entry:entry+len(s)+len(body)] = s+body
+        for i,k in enumerate(levels):
+            l = Cmd(0x17,0,0x19,*U32(0x280000),*U32(0x290000))+Cmd(0x1f,1,0,*U32(0x19000000))
+            for j in range(objects):
+                l += Cmd(0x24,0x1f,rng.randint(0,255),*[rng.randint(0,255) for j in range(16)],*U32(rng.choice(bhvs)))
+            l += Cmd(0x20,0,0)+Cmd(0x0b,0,0,0,0,0,0)
+            data[0x200000+i*0x1000:0x200000+i*0x1000+len(l)] = l
+        fd,name = tempfile.mkstemp(suffix='.z64')
+        os.write(fd,data)
+        os.close(fd)
+        rom = name
+    rom = Rom.Rom(rom)
+    #how ExportLevel used to parse a level
+    def OldParse(level):
+        s = RM2C.Script(level)
+        s.Seg2(rom)
+        s.Aoffset = 0
+        s.editor = 0
+        vm = RM2C.LevelScript(rom,s)
+        try:
+            vm.Run(entry)
+        except:
+            pass
+        return s
+    def State(s):
+        areas = [[a.geo,a.objects,a.warps,getattr(a,'col',None),getattr(a,'music',None)] if a else a for a in s.levels[s.Currlevel]]
+        return [s.banks,s.asm,[m[:4] if m else m for m in s.models],s.Stack,s.objects,getattr(s,'mStart',None),areas]
+    try:
+        [old,a] = Timed(lambda: [OldParse(k) for k in Num2Name.keys()])
+        RM2C.EntryStates.clear()
+        [new,b] = Timed(lambda: [RM2C.ParseLevel(rom,k,0,[])[0] for k in Num2Name.keys()])
+        assert [State(s) for s in a]==[State(s) for s in b], 'snapshot changes the parsed levels'
+        assert all(m[4] is s for s in b for m in s.models if m), 'models point at the wrong script'
+        print('{} levels: full entry script per level {:.3f}s, snapshot {:.3f}s ({:.1f}x)'.format(len(a),old,new,old/max(new,1e-9)))
+    finally:
+        del rom
+        if name:
+            os.remove(name)
+
+#a DL stream like a level's models decode, most cmds repeat (tris, loads, combiners)
+#across models. Decodes it with BitArray + unpack per cmd like Bin2C used to and
+#through the compiled extractors and the raw cmd cache.
+def BenchF3D(cmds=200000,distinct=5000):
+    import F3D
+    from bitstring import BitArray
+    rng = random.Random(0)
+    ops = [k for k in F3D.DecodeFmt if k not in (0xe4,0xe5)]
+    pool = [bytes([rng.choice(ops)])+RandBytes(rng,7) for i in range(distinct)]
+    stream = [rng.choice(pool) for i in range(cmds)]
+    ids = ['model_%d'%rng.randrange(64) for i in range(cmds)]
+    def Old():
+        out = []
+        for cmd in stream:
+            fmt,func,f = F3D.DecodeFmt[cmd[0]]
+            try:
+                out.append(BitArray(cmd)[8:].unpack(f))
+            except Exception as e:
+                out.append(type(e))
+        return out
+    def New():
+        out = []
+        for cmd in stream:
+            ext = F3D.DecodeTable[cmd[0]][2]
+            try:
+                out.append(tuple(ext(int.from_bytes(cmd,'big'))))
+            except Exception as e:
+                out.append(type(e))
+        return out
+    def Decode():
+        out = []
+        for cmd,id in zip(stream,ids):
+            try:
+                out.append(F3D.Bin2C(cmd,id)[0])
+            except Exception as e:
+                out.append(type(e))
+        return out
+    [old,a] = Timed(Old)
+    [new,b] = Timed(New)
+    assert [tuple(x) if type(x)==list else x for x in a]==b, 'extractors differ from bitstring'
+    F3D.gCycle = 1
+    F3D.Decoded.clear()
+    [cold,c] = Timed(Decode)
+    [warm,d] = Timed(Decode)
+    assert c==d, 'cached cmds decode differently'
+    print('{} cmds: BitArray unpack {:.3f}s ({:.0f}/s), extractors {:.3f}s ({:.0f}/s)'.format(cmds,old,cmds/old,new,cmds/new))
+    print('Bin2C {} distinct: cold cache {:.3f}s ({:.0f}/s), warm {:.3f}s ({:.0f}/s)'.format(distinct,cold,cmds/cold,warm,cmds/warm))
+
+#a level DL of a typical RM hack, mostly tris with a material change every few dozen
+#cmds. Times DecodeVDL against the per cmd loop it replaced, which read, decoded and
+#evaluated every cmd on its own, and checks both give the same DL and data.
+def BenchDL(cmds=50000):
+    import os
+    import struct
+    import tempfile
+    import F3D
+    import Rom
+    rng = random.Random(0)
+    def C(op,w0,w1):
+        return struct.pack('>LL',op<<24|w0&0xFFFFFF,w1)
+    dl = b''
+    while len(dl)<cmds*8:
+        dl += C(0xfd,0x100000,0x09000000+rng.randrange(0,0x8000,0x800))
+        dl += C(0xf5,0x100000,0x07000000)+C(0xe6,0,0)+C(0xf3,0,0x073FF100)+C(0xe7,0,0)
+        dl += C(0xf5,0x101000,0)+C(0xf2,0,0x7C07C)
+        dl += C(0xfc,0x127e24,0xfffff3f9)+C(0xb7,0,0x20000)
+        for i in range(rng.randint(2,8)):
+            dl += C(4,0xF0010,0x0E000000+rng.randrange(0,0x10000,16))
+            for j in range(rng.randint(4,20)):
+                dl += C(0xbf,0,rng.randrange(0,16)*10<<16|rng.randrange(0,16)*10<<8|rng.randrange(0,16)*10)
+    dl += C(0xb8,0,0)
+    n = len(dl)//8
+    fd,name = tempfile.mkstemp(suffix='.z64')
+    os.write(fd,dl+bytes(0x10000))
+    os.close(fd)
+    class Script():
+        banks = [None]*32
+        def B2P(self,B):
+            return B&0xFFFFFF
+    try:
+        rom = Rom.Rom(name)
+        def OneAtATime(opt):
+            s = Script()
+            dl, verts, textureptrs, amb, diffuse, ranges = [], [], [[0]*9], [], [], [[0]*6]
+            LastMat = F3D.Mat(F3D.Persist)
+            F3D.gCycle = 1
+            x = 0
+            while(True):
+                cmd = F3D.Bin2C(rom[x:x+8],'bench_')
+                x += 8
+                MSB = cmd[1]>>56
+                if opt==1:
+                    attr = str(MSB)+'7'*(MSB==0xF5 and (cmd[1]>>24)&0xFF==7)
+                    if hasattr(LastMat,attr):
+                        if getattr(LastMat,attr)==cmd[1]&0xFFFFFFFFFFFFFF:
+                            continue
+                        setattr(LastMat,attr,cmd[1]&0xFFFFFFFFFFFFFF)
+                if MSB==0xb8:
+                    dl.append(cmd[0])
+                    break
+                if dl and dl[-1].startswith('gsSP1Triangle') and cmd[0].startswith('gsSP1Triangle'):
+                    dl[-1] = 'gsSP2Triangles(' + dl[-1][14:-1] + ', ' + cmd[0][14:-1] + ')'
+                else:
+                    dl.append(cmd[0])
+                F3D.EvalMaterial(MSB, ranges, cmd[1], textureptrs, diffuse, amb, verts, s, len(dl))
+            F3D.EndDL(ranges, textureptrs, len(dl))
+            return (dl, verts, textureptrs, ranges)
+        for opt in (0,1):
+            [old,ref] = Timed(OneAtATime,opt)
+            F3D.ResetCache()
+            [t,res] = Timed(F3D.DecodeVDL,rom,[0,0x0E000000],Script(),'bench_',opt)
+            assert (res[0][0],res[1],res[2],res[5])==ref, 'DecodeVDL differs from decoding one cmd at a time'
+            print('{} cmds opt={}: one cmd at a time {:.3f}s, DecodeVDL {:.3f}s ({:.1f}x), {} lines'.format(n,opt,old,t,old/t,len(res[0][0])))
+            #the same DL in another area, only the model id differs
+            [t,res2] = Timed(F3D.DecodeVDL,rom,[0,0x0E000000],Script(),'other_',opt)
+            assert repr(res2)==repr(res).replace('bench_','other_'), 'cached DL differs'
+            print('{} cmds opt={}: already decoded {:.4f}s'.format(n,opt,t))
+        del rom
+    finally:
+        os.remove(name)
+
+#a level with thousands of vertex buffers and an actor group whose models share data.
+#Finds the dupes with list scans and with the dicts ModelWrite uses, then renames the
+#culled symbols in every DL cmd pair by pair and with F3D.Symbols.
+def BenchDedup(vbs=5000,cmds=20000):
+    import F3D
+    rng = random.Random(0)
+    verts = [(p,p+0x1000,p>>4&15) for p in (0x19000000+rng.randrange(0,vbs*2)*16 for i in range(vbs))]
+    def Scan():
+        seen, dupes = [], []
+        for vb in verts:
+            if vb in seen:
+                dupes.append(seen.index(vb))
+                continue
+            seen.append(vb)
+        return dupes
+    def Intern():
+        seen, idx, dupes = [], {}, []
+        for vb in verts:
+            q = idx.get(vb)
+            if q is not None:
+                dupes.append(q)
+                continue
+            idx[vb] = len(seen)
+            seen.append(vb)
+        return dupes
+    [old,a] = Timed(Scan)
+    [new,b] = Timed(Intern)
+    assert a==b, 'dicts find different dupes'
+    print('{} vertex buffers, {} dupes: list scans {:.3f}s, dicts {:.4f}s'.format(vbs,len(a),old,new))
+    ids = ['model_%d_'%i for i in range(40)]
+    Excess = [['VB_%s'%(rng.choice(ids)+hex(v[0])),'VB_%s'%(ids[0]+hex(v[0]))] for v in verts[:2000]]
+    lines = ['gsSPVertex(VB_%s, 16, 0)'%(rng.choice(ids)+hex(rng.choice(verts)[0])) for i in range(cmds)]
+    def Pairs():
+        out = []
+        for c in lines:
+            for e in Excess:
+                if e[0] in c:
+                    c = c.replace(e[0], e[1])
+            out.append(c)
+        return out
+    [old,a] = Timed(Pairs)
+    [new,b] = Timed(lambda: list(map(F3D.Symbols(Excess),lines)))
+    assert a==b, 'renames differ'
+    print('{} cmds, {} renames: pair by pair {:.3f}s, symbol table {:.4f}s'.format(cmds,len(Excess),old,new))
+
+#every vertex buffer of a large level area, 0x10 verts each like most exporters load.
+#Formats them one vert at a time from struct tuples, the way ModelWrite used to,
+#and all at once with F3D.VtxText.
+def BenchVerts(verts=200000):
+    import os
+    import tempfile
+    import F3D
+    import Rom
+    rng = random.Random(0)
+    fd,name = tempfile.mkstemp(suffix='.z64')
+    os.write(fd,bytes(rng.getrandbits(8) for i in range(verts*16)))
+    os.close(fd)
+    vbs = [(0x0E000000+p,p,min(16,verts-p//16)) for p in range(0,verts*16,0x100)]
+    names = ['Vtx VB_bench_%s[]'%hex(vb[0]) for vb in vbs]
+    try:
+        rom = Rom.Rom(name)
+        def PerVert():
+            out = []
+            for vb,n in zip(vbs,names):
+                out.append(n+' = {\n')
+                for q in rom.Array('3hH2h4B',vb[1],vb[2]):
+                    Vpos = q[0:3]
+                    UV = q[4:6]
+                    rgba = q[6:10]
+                    V="\t{{{ %d, %d, %d }, 0, { %d, %d }, { %d, %d, %d, %d}}}," % (*Vpos, *UV, *rgba)
+                    out.append(V+'\n')
+                out.append('};\n\n')
+            return ''.join(out)
+        [old,a] = Timed(PerVert)
+        [new,b] = Timed(F3D.VtxText,rom,vbs,names)
+        assert a==b, 'verts formatted differently'
+        print('{} verts in {} buffers: one at a time {:.3f}s ({:.0f}/s), VtxText {:.3f}s ({:.0f}/s)'.format(verts,len(vbs),old,verts/old,new,verts/new))
+        del rom
+    finally:
+        os.remove(name)
+
+#every texture format BinPNG decodes, as many 32x32 textures as a big level has.
+#Times decoding them into pngs in memory.
+def BenchTextures(textures=500):
+    import io
+    import BinPNG
+    rng = random.Random(0)
+    w,h = 32,32
+    formats = [('RGBA16',BinPNG.RGBA,16),('RGBA32',BinPNG.RGBA,32),('IA4',BinPNG.IA,4),('IA8',BinPNG.IA,8),
+        ('IA16',BinPNG.IA,16),('I4',BinPNG.I,4),('I8',BinPNG.I,8),('CI4',BinPNG.CI,4),('CI8',BinPNG.CI,8)]
+    for name,func,depth in formats:
+        bins = [RandBytes(rng,w*h*depth//8) for i in range(textures)]
+        if func==BinPNG.CI:
+            pals = [[RandBytes(rng,2**depth*2),'rgba16'] for i in range(textures)]
+            args = [(w,h,depth,p,b) for p,b in zip(pals,bins)]
+        else:
+            args = [(w,h,depth,b) for b in bins]
+        def Decode():
+            for a in args:
+                func(*a,io.BytesIO())
+        [t,res] = Timed(Decode)
+        print('{:6} {} textures {:.3f}s, {:.0f} texels/s'.format(name,textures,t,textures*w*h/t))
+
+#the pngs of BenchTextures encoded back into texture bins with BinPNG.Encode. Every
+#texture has to come back as the bin it was decoded from, and decode to the same png again.
+def BenchEncode(textures=500):
+    import io
+    import BinPNG
+    rng = random.Random(0)
+    w,h = 32,32
+    formats = [('RGBA',16),('RGBA',32),('IA',4),('IA',8),('IA',16),('I',4),('I',8),('CI',4),('CI',8)]
+    def Decode(fmt,depth,bin):
+        img = io.BytesIO()
+        if fmt=='CI':
+            BinPNG.CI(w,h,depth,[bin[1],'rgba16'],bin[0],img)
+        else:
+            getattr(BinPNG,fmt)(w,h,depth,bin,img)
+        return img.getvalue()
+    for fmt,depth in formats:
+        bins = [RandBytes(rng,w*h*depth//8) for i in range(textures)]
+        if fmt=='CI':
+            bins = [[b,RandBytes(rng,2**depth*2)] for b in bins]
+        pngs = [Decode(fmt,depth,b) for b in bins]
+        [t,res] = Timed(lambda: [BinPNG.Encode(io.BytesIO(p),fmt,depth) for p in pngs])
+        assert res==bins, '%s%d bins differ'%(fmt,depth)
+        assert [Decode(fmt,depth,b) for b in res]==pngs, '%s%d pngs differ'%(fmt,depth)
+        print('{:6} {} textures {:.3f}s, {:.0f} texels/s'.format(fmt+str(depth),textures,t,textures*w*h/t))
+
+#a collision about the size of rr or castle_inside, written with ColParse.ColWrite.
+#Checked against reading it one vertex and tri at a time.
+def BenchCol(verts=10000,tris=40000):
+    import os
+    import struct
+    import tempfile
+    import ColParse
+    import Output
+    import Rom
+    rng = random.Random(0)
+    V = [rng.randint(-8192,8192) for i in range(verts*3)]
+    blocks = [(0,3,tris//2),(1,3,tris//4),(0x2c,4,tris//4)]
+    data = struct.pack('>HH%dh'%len(V),0x40,verts,*V)
+    for t,w,n in blocks:
+        data += struct.pack('>HH%dH'%(n*w),t,n,*[rng.randrange(verts) for i in range(n*w)])
+    data += struct.pack('>HH',0x41,0x42)
+    fd,name = tempfile.mkstemp(suffix='.z64')
+    os.write(fd,data)
+    os.close(fd)
+    class Script:
+        banks = [None]*0x20
+        def B2P(self,B):
+            return B&0xFFFFFF
+    def OneAtATime():
+        out = ["const Collision col_bench0x0[] = {\nCOL_INIT(),\n","COL_VERTEX_INIT({}),\n".format(verts)]
+        for i in range(verts):
+            out.append("COL_VERTEX( {}, {}, {}),\n".format(*rom.Unpack('3h',4+i*6)))
+        b = 4+verts*6
+        for t,w,n in blocks:
+            out.append("COL_TRI_INIT( {}, {}),\n".format(t,n))
+            for j in range(n):
+                tri = rom.Unpack('%dH'%w,b+4+j*w*2)
+                out.append(("COL_TRI_SPECIAL( {}, {}, {}, {}),\n" if w==4 else "COL_TRI( {}, {}, {}),\n").format(*tri))
+            b += 4+n*w*2
+        out.append("COL_TRI_STOP(),\nCOL_END(),\n};\n")
+        return ''.join(out)
+    def Write():
+        f = Output.Open(name+'.c','w')
+        [b,x,r,f,CD] = ColParse.ColWriteGeneric(name+'.c',Script(),rom,0,'bench')
+        ColParse.ColWriteLevelSpecial(b,x,rom,f)
+        return f.getvalue()
+    try:
+        rom = Rom.Rom(name)
+        [old,a] = Timed(OneAtATime)
+        [new,b] = Timed(Write)
+        assert a==b, 'collision written differently'
+        print('{} verts {} tris: one at a time {:.3f}s, ColWrite {:.3f}s ({:.1f}x)'.format(verts,tris,old,new,old/new))
+        del rom
+    finally:
+        os.remove(name)
+
+#death planes made of big tris crossing the axes, split with ColDat.SplitCrossQuadrant.
+#No tri may cross an axis afterwards and the planes have to keep their area.
+def BenchDeathPlane(planes=2000):
+    import io
+    import numpy as np
+    import ColParse
+    rng = random.Random(0)
+    V = []
+    for i in range(planes):
+        [x,z,y,w] = [rng.randint(-4000,4000),rng.randint(-4000,4000),rng.randint(-8000,0),rng.randint(12000,16000)]
+        V += [(x-w,y,z-w),(x+w,y,z-w),(x+w,y,z+w),(x-w,y,z+w)]
+    V = np.array(V,dtype='>i2')
+    tris = np.array([[a,a+2,a+1] for a in range(0,len(V),4)]+[[a,a+3,a+2] for a in range(0,len(V),4)],dtype='>u2')
+    CD = ColParse.ColDat(io.StringIO())
+    CD.V = V
+    CD.verts = list(map(tuple,V.tolist()))
+    CD.Tris[10] = tris
+    [t,res] = Timed(CD.SplitCrossQuadrant)
+    P = np.concatenate((V.astype(np.int64),np.array(CD.DPV,dtype=np.int64).reshape(-1,3)))[CD.Tris[10]]
+    Area = (lambda P: (P[:,1,2]-P[:,0,2])*(P[:,2,0]-P[:,0,0])-(P[:,1,0]-P[:,0,0])*(P[:,2,2]-P[:,0,2]))
+    for d in (0,2):
+        assert not ((P[:,:,d].max(axis=1)>0) & (P[:,:,d].min(axis=1)<0)).any(), 'tri crosses an axis'
+    assert (Area(P)>0).all(), 'tri faces down'
+    before = Area(V.astype(np.int64)[tris]).sum()
+    assert abs(Area(P).sum()-before)<before*1e-4, 'area changed'
+    print('{} death plane tris split into {} in {:.3f}s, {} new verts'.format(len(tris),len(P),t,len(CD.DPV)))
+
+#the surface partition of a big level's collision with ColParse.Partition, checked against
+#adding the tris to cells one at a time like surface_load.c does
+def BenchPartition(tris=30000):
+    import numpy as np
+    import ColParse
+    rng = random.Random(0)
+    V = np.array([[rng.randint(-9000,9000),rng.randint(-3000,3000),rng.randint(-9000,9000)] for i in range(tris)],dtype=np.int64)
+    #mostly small tris, like real collision
+    T = np.array([[i,rng.randrange(max(0,i-20),min(tris,i+20)),rng.randrange(max(0,i-20),min(tris,i+20))] for i in range(tris)])
+    for c in (1,2):
+        V[T[:,c]] = V[T[:,0]]+[[rng.randint(-900,900),rng.randint(-300,300),rng.randint(-900,900)] for i in range(tris)]
+    #some out near the top of the s16 range, where the game's cell math wraps
+    V[::50,0] += 0x5000
+    V = V.clip(-0x8000,0x7fff)
+    def Cell(c,upper):
+        c = (c+ColParse.LevelBoundaryMax+0x8000)%0x10000-0x8000
+        c = max(c,0)
+        i = c//ColParse.CellSize
+        if upper:
+            return min(i+(c%ColParse.CellSize>ColParse.CellSize-50),ColParse.NumCells-1)
+        return max(i-(c%ColParse.CellSize<50),0)
+    def OneAtATime():
+        cells = np.zeros((3,ColParse.NumCells,ColParse.NumCells),dtype=np.int64)
+        n = 0
+        for t in T.tolist():
+            [[x1,y1,z1],[x2,y2,z2],[x3,y3,z3]] = [V[i].tolist() for i in t]
+            nx = (y2-y1)*(z3-z2)-(z2-z1)*(y3-y2)
+            ny = (z2-z1)*(x3-x2)-(x2-x1)*(z3-z2)
+            nz = (x2-x1)*(y3-y2)-(y2-y1)*(x3-x2)
+            mag = (nx*nx+ny*ny+nz*nz)**.5
+            if mag<0.0001:
+                continue
+            n += 1
+            ny /= mag
+            kind = 0 if ny>0.01 else 2 if ny<-0.01 else 1
+            for z in range(Cell(min(z1,z2,z3),0),Cell(max(z1,z2,z3),1)+1):
+                for x in range(Cell(min(x1,x2,x3),0),Cell(max(x1,x2,x3),1)+1):
+                    cells[kind,z,x] += 1
+        return [cells,n]
+    [old,a] = Timed(OneAtATime)
+    [new,b] = Timed(ColParse.Partition,V,T)
+    assert a[1]==b[1] and (a[0]==b[0]).all(), 'partitions differ'
+    print('{} tris, {} surface nodes: one at a time {:.3f}s, Partition {:.4f}s'.format(tris,int(b[0].sum()),old,new))
+
+#editor style collision, every tri with its own verts and long edges cut into slivers,
+#cleaned up with ColDat.Optimize. The area of every type has to stay the same.
+def BenchOptimize(fans=2000,slivers=8):
+    import io
+    import numpy as np
+    import ColParse
+    rng = random.Random(0)
+    V = []
+    T = {0:[],1:[],0x2c:[]}
+    for i in range(fans):
+        [x,z] = [rng.randint(-7000,7000),rng.randint(-7000,7000)]
+        apex = [x,rng.randint(-500,500),z+rng.randint(300,900)]
+        step = [rng.randint(20,80),0,0]
+        base = [[x+step[0]*j,apex[1],z] for j in range(slivers+1)]
+        k = rng.choice(list(T))
+        for j in range(slivers):
+            T[k].append([len(V),len(V)+2,len(V)+1]+([i%4] if k==0x2c else []))
+            V += [apex,base[j],base[j+1]]
+    V = np.array(V,dtype='>i2')
+    CD = ColParse.ColDat(io.StringIO())
+    CD.V = V
+    CD.verts = list(map(tuple,V.tolist()))
+    for k,t in T.items():
+        CD.AddTris(k,np.array(t))
+    Area = (lambda V,t: np.linalg.norm(np.cross(V[t[:,1]]-V[t[:,0]],V[t[:,2]]-V[t[:,0]]),axis=1).sum())
+    before = {k:Area(V.astype(np.int64),v) for k,v in CD.Tris.items()}
+    [t,[a,b]] = Timed(CD.Optimize)
+    for k,v in CD.Tris.items():
+        assert abs(Area(CD.V,v)-before[k])<=before[k]*1e-9, 'area changed'
+    print('{} tris, {} verts optimized to {} tris, {} verts in {:.3f}s'.format(a,len(V),b,len(CD.V),t))
+
+#an actor geo layout with a few linked sublayouts, parsed by GeoActParse for every model
+#using it. The first parse decodes it, the rest only format the cached layout.
+def BenchGeo(cmds=3000,models=50):
+    import os
+    import struct
+    import tempfile
+    import GeoWrite
+    import Rom
+    rng = random.Random(0)
+    def Sub(ops):
+        geo = b''
+        for i in range(ops):
+            op = rng.choice([4,5,0x13,0x15,0x11,0x1D])
+            if op in (4,5):
+                geo += bytes([op,0,0,0])
+            elif op==0x13:
+                geo += struct.pack('>BB3hL',0x13,1,*[rng.randint(-300,300) for i in range(3)],0x0E000000+rng.randrange(0,0x10000,8))
+            elif op==0x15:
+                geo += struct.pack('>BBHL',0x15,rng.choice([1,4]),0,0x0E000000+rng.randrange(0,0x10000,8))
+            elif op==0x11:
+                geo += struct.pack('>BB3h',0x11,0,*[rng.randint(-300,300) for i in range(3)])
+            else:
+                geo += struct.pack('>BBHL',0x1D,0,0,0x10000)
+        return geo
+    subs = [0x1000*(i+2) for i in range(8)]
+    data = bytearray(0x10000)
+    geo = b''
+    for a in subs:
+        body = Sub(cmds//10)+bytes([3,0,0,0])
+        data[a:a+len(body)] = body
+        geo += Sub(cmds//50)+struct.pack('>BBHL',0,0,0,0x0E000000+a)
+    geo += bytes([1,0,0,0])
+    data[0x100:0x100+len(geo)] = geo
+    fd,name = tempfile.mkstemp(suffix='.z64')
+    os.write(fd,bytes(data))
+    os.close(fd)
+    class Script():
+        banks = [None]*32
+        banks[0x0E] = [0,0x10000]
+        def B2P(self,B):
+            return B&0xFFFFFF
+    try:
+        rom = Rom.Rom(name)
+        GeoWrite.ResetCache()
+        model = [0,'bench_geo',0,0x100,0,Script()]
+        [first,res] = Timed(GeoWrite.GeoActParse,rom,model)
+        n = sum(len(g[0]) for g in res[0])
+        def Rest():
+            for i in range(models-1):
+                GeoWrite.GeoActParse(rom,[0,'bench_geo%d'%i,0,0x100,0,Script()])
+            return GeoWrite.GeoActParse(rom,model)
+        [rest,res2] = Timed(Rest)
+        assert res2==res, 'cached layout formats differently'
+        print('{} geo cmds: decoded {:.4f}s, {} more models from the cache {:.4f}s ({:.4f}s each)'.format(n,first,models-1,rest,rest/models))
+        del rom
+    finally:
+        os.remove(name)
+
+Benches = {
+    'symbols':BenchSymbols,
+    'rom':BenchRom,
+    'startup':BenchStartup,
+    'refdb':BenchRefDB,
+    'levelscript':BenchLevelScript,
+    'entry':BenchEntryState,
+    'f3d':BenchF3D,
+    'dl':BenchDL,
+    'dedup':BenchDedup,
+    'verts':BenchVerts,
+    'textures':BenchTextures,
+    'encode':BenchEncode,
+    'col':BenchCol,
+    'deathplane':BenchDeathPlane,
+    'partition':BenchPartition,
+    'optimize':BenchOptimize,
+    'geo':BenchGeo,
+}
+
+if __name__=='__main__':
+    import inspect
+    names = [a for a in sys.argv[1:] if '=' not in a]
+    args = dict(a.split('=',1) for a in sys.argv[1:] if '=' in a)
+    #numbers are passed as numbers, anything else as a string
+    for k,v in args.items():
+        try:
+            args[k] = int(v,0)
+        except ValueError:
+            pass
+    if not names:
+        print('available benchmarks: '+', '.join(Benches.keys()))
+    for n in names:
+        print('--- '+n)
+        params = inspect.signature(Benches[n]).parameters
+        Benches[n](**{k:v for k,v in args.items() if k in params})
@@ -1,21 +1,22 @@
-import struct
+import numpy as np
 import png
-import math
-from bitstring import *
 from PIL import Image #for skyboxes
 import zlib
+import os
+import Output
+import Workers
 from functools import lru_cache
 #convert bin to png
 
-def InitSkybox(name):
-	return Image.new("RGB",(248,248),None)
-
-def TileSkybox(FullBox,x,y,tilepath):
-	t = Image.open(tilepath)
-	FullBox.paste(t,(x,y))
+#skyboxes are 8x8 tiles of 32x32 rgba16, each one overlapping the next by a pixel.
+#The tiles are decoded all at once and cropped to 31x31 into a 248x248 rgb image.
+def Skybox(file,image):
+	px = np.frombuffer(file,dtype='>u2',count=64*32*32).reshape(8,8,32,32)[:,:,:31,:31]
+	rgb = np.stack([C5[px>>11],C5[px>>6&31],C5[px>>1&31]],axis=-1)
+	Image.fromarray(rgb.transpose(0,2,1,3,4).reshape(248,248,3),'RGB').save(image,'PNG')
 
 def MakeImage(name):
-	return open(name+'.png','wb')
+	return Output.Open(name+'.png','wb')
 
 def GetCHKSM(filename):
 	f = open(filename,'rb')
@@ -25,23 +26,36 @@ def GetCHKSM(filename):
 
 #file is bin, image is png
 #Alpha changed to true because N64 graphics does not like PNGS with no alpha YES!!!
+#Texels are decoded a whole texture at a time, every n bit channel is expanded
+#to 8 bits with the lookup tables below.
 def I(width,height,depth,file,image):
-	if depth>4:
-		w = png.Writer(width,height,greyscale=True,bitdepth=depth,alpha=True)
-		rows = CreateIRows(width,height,depth//2,2,file)
+	w = png.Writer(width,height,greyscale=True,bitdepth=8,alpha=True)
+	if depth==4:
+		rows = I4[Rows(file,width//2,(np.arange(height)*width)//2)]
+	elif depth==8:
+		rows = I8[Rows(file,width,np.arange(height)*width)]
 	else:
-		w = png.Writer(width,height,greyscale=True,bitdepth=8,alpha=True)
-		rows = EditIFile(file,width,height,[4,4],2,1)
-	w.write(image,rows)
+		raise ValueError('there are no I%d textures'%depth)
+	w.write(image,rows.reshape(height,-1))
 
 def IA(width,height,depth,file,image):
-	if depth>4:
+	if depth==8:
+		#png has no 4 bit grey+alpha, pypng writes it as 8 bit so the channels are expanded here
+		w = png.Writer(width,height,greyscale=True,bitdepth=4,alpha=True)
+		rows = IA8[Packed(file,width,height,4,2)]
+		w.write_packed(image,rows.reshape(height,-1))
+	elif depth==16:
+		w = png.Writer(width,height,greyscale=True,bitdepth=8,alpha=True)
+		w.write_packed(image,Packed(file,width,height,8,2))
+	elif depth>4:
+		#not a real format, only the low byte of each channel is kept
 		w = png.Writer(width,height,greyscale=True,bitdepth=depth//2,alpha=True)
-		rows = CreateRows(width,height,depth//2,2,file)
+		rows = Packed(file,width,height,depth//2,2).view('>u2')&0xFF
+		w.write(image,rows.tolist())
 	else:
 		w = png.Writer(width,height,greyscale=True,bitdepth=8,alpha=True)
-		rows = EditFile(file,width,height,[5,8,5,8],2,1)
-	w.write(image,rows)
+		rows = IA4[Rows(file,width//2,(np.arange(height)*width)//2)]
+		w.write(image,rows.reshape(height,-1))
 
 def RGBA(width,height,depth,file,image):
 	if depth==16:
@@ -51,207 +65,153 @@ def RGBA(width,height,depth,file,image):
 
 def RGBA32(width,height,file,image):
 	w = png.Writer(width,height,greyscale=False,bitdepth=8,alpha=True)
-	rows = CreateRows(width,height,8,4,file)
-	w.write(image,rows)
+	w.write_packed(image,Packed(file,width,height,8,4))
 
 def RGBA16(width,height,file,image):
 	w = png.Writer(width,height,greyscale=False,bitdepth=8,alpha=True)
-	rows = EditFile(file,width,height,[3,3,3,8],1,2)
-	w.write(image,rows)
+	rows = Rows(file,width*2,np.arange(height)*width*2).astype(np.uint16)
+	rows = RGBA5551[rows[:,0::2]<<8|rows[:,1::2]]
+	w.write(image,rows.reshape(height,-1))
 
 def CI(width,height,depth,p,file,image):
 	p = GetPalette(p,depth,2)
 	w = png.Writer(width,height,palette=p,bitdepth=depth)
-	rows = CreateRows(width,height,depth,1,file)
-	w.write(image,rows)
+	w.write_packed(image,Packed(file,width,height,depth,1))
 
-def CreateIRows(width,height,depth,Channels,file):
-	rows=[]
-	for r in range(height):
-		L=int((depth/8)*Channels*width)#bytes per row
-		bin = BitArray(file[L*r:L*r+L])
-		a=bin.unpack('%d*uint:%d'%(width*Channels,depth))
-		a = [b&0xFF for b in a]
-		AlphaAdd = [0xFF]*(len(a)*2)
-		AlphaAdd[0::2] = a
-		rows.append(AlphaAdd)
-	return rows
+#the bytes of each row of a texture, n bytes from each of starts
+def Rows(file,n,starts):
+	return np.frombuffer(file,dtype=np.uint8)[starts[:,None]+np.arange(n)]
 
-def CreateRows(width,height,depth,Channels,file):
-	rows=[]
-	for r in range(height):
-		L=int((depth/8)*Channels*width)#bytes per row
-		bin = BitArray(file[L*r:L*r+L])
-		a=bin.unpack('%d*uint:%d'%(width*Channels,depth))
-		a = [b&0xFF for b in a]
-		rows.append(a)
-	return rows
-	
-#change I4 to IA88
-def EditIFile(file,width,height,shifts,PpB,b):
-	newfile=[]
-	for x in range(height):
-		row=[]
-		for pixel in range(0,width//PpB):
-			pixel=pixel+x*width//PpB
-			bin=file[b*pixel:b*pixel+b]
-			bin=pack('>%dB'%b,*bin)
-			upack = ['uint:%d'%(8-a) if a!=8 else 'uint:1' for a in shifts]
-			channels=bin.unpack(','.join(upack))
-			channels=[CB(c,8-s) if s<8 else OBA(c) for c,s in zip(channels,shifts)]
-			AlphaAdd = [0xFF]*(len(channels)*2)
-			AlphaAdd[0::2] = channels
-			p = struct.pack('>%dB'%len(AlphaAdd),*AlphaAdd)
-			row.extend(p)
-		newfile.append(row)
-	return newfile
-	
-#change IA31 to IA88 or rgba5551 to rgba8888
-def EditFile(file,width,height,shifts,PpB,b):
-	newfile=[]
-	for x in range(height):
-		row=[]
-		for pixel in range(0,width//PpB):
-			pixel=pixel+x*width//PpB
-			bin=file[b*pixel:b*pixel+b]
-			bin=pack('>%dB'%b,*bin)
-			upack = ['uint:%d'%(8-a) if a!=8 else 'uint:1' for a in shifts]
-			channels=bin.unpack(','.join(upack))
-			channels=[CB(c,8-s) if s<8 else OBA(c) for c,s in zip(channels,shifts)]
-			p = struct.pack('>%dB'%len(channels),*channels)
-			row.extend(p)
-		newfile.append(row)
-	return newfile
+#the rows of a texture whose rows are packed back to back, as png packs them.
+#Each row is width*channels values of depth bits.
+def Packed(file,width,height,depth,channels):
+	L=int((depth/8)*channels*width)#bytes per row
+	if L*8!=depth*channels*width:
+		raise ValueError('rows of %d bytes do not have %d values'%(L,width*channels))
+	return Rows(file,L,np.arange(height)*L)
 
 #convert bits
 @lru_cache(maxsize=255)
 def CB(val,bits):
 	return int(((val*255)+(2**(bits-1))-1)/(2**(bits)-1))
 
-#one bit alpha
-def OBA(val):
-	if val:
-		return 255
-	else:
-		return 0
+#n bit channels to 8 bit
+C3 = np.array([CB(c,3) for c in range(8)],dtype=np.uint8)
+C4 = np.array([CB(c,4) for c in range(16)],dtype=np.uint8)
+C5 = np.array([CB(c,5) for c in range(32)],dtype=np.uint8)
+#every texel of the formats that aren't a whole byte per channel as 8 bit channels,
+#the 4 bit formats have two texels in each entry
+b = np.arange(0x100)
+a = np.full(0x100,0xFF)
+I4 = np.stack([C4[b>>4],a,C4[b&15],a],axis=-1).astype(np.uint8)
+I8 = np.stack([b,a],axis=-1).astype(np.uint8)
+IA8 = np.stack([C4[b>>4],C4[b&15]],axis=-1).astype(np.uint8)
+IA4 = np.stack([C3[b>>5],(b>>4&1)*0xFF,C3[b>>1&7],(b&1)*0xFF],axis=-1).astype(np.uint8)
+b = np.arange(0x10000)
+RGBA5551 = np.stack([C5[b>>11],C5[b>>6&31],C5[b>>1&31],(b&1)*0xFF],axis=-1).astype(np.uint8)
+del a,b
 
 #Palette is [Binary Region,format],every palette uses either IA16 or RGBA16
 def GetPalette(palette,depth,bpp):
-	bin = palette[0]
-	shifts = [3,3,3,8]
-	o=[]
-	for p in range(2**depth):
-		b = BitArray(bin[p*2:p*2+2])
-		a=b.unpack('3*uint:5,uint:1')
-		a = *(CB(c,8-s) if s<8 else OBA(c) for c,s in zip(a,shifts)),
-		o.append(a)
-	return o
+	pal = np.frombuffer(palette[0],dtype='>u2',count=2**depth)
+	return list(map(tuple,RGBA5551[pal].tolist()))
+
+#png to bin. file is anything png.Reader takes. The png is read as 8 bit rgba and every
+#texel is packed at once, channels are cut down to n bits by dropping the low bits,
+#which undoes the bit expansion of the decoders above.
+def ReadRGBA(r):
+	r.preamble()
+	#8 bit rgb(a) and grey(+alpha) are expanded here, anything else by pypng
+	if r.plte or r.bitdepth!=8:
+		w,h,rows,info = r.asRGBA8()
+	else:
+		w,h,rows,info = r.read()
+	px = np.array(list(rows),dtype=np.uint8).reshape(h,w,info['planes'])
+	if info['greyscale']:
+		px = px[...,[0,0,0,1]] if info['alpha'] else px[...,[0,0,0]]
+	if not info['alpha']:
+		px = np.concatenate([px,np.full((h,w,1),0xFF,dtype=np.uint8)],axis=-1)
+	return px
+
+#texels packed back to back, two to a byte for 4 bit formats
+def Pack(px,depth):
+	px = px.astype(np.uint8).ravel()
+	if depth==4:
+		if len(px)&1:
+			px = np.append(px,np.uint8(0))
+		px = px[0::2]<<4|px[1::2]
+	return px.tobytes()
+
+def RGBA5551Words(rgba):
+	rgba = rgba.astype(np.uint16)
+	return rgba[...,0]>>3<<11|rgba[...,1]>>3<<6|rgba[...,2]>>3<<1|rgba[...,3]>>7
+
+#fmt and depth are the same as the decoders, returns the bin, or [bin,palette bin] for CI
+def Encode(file,fmt,depth):
+	if fmt=='CI':
+		return EncodeCI(file,depth)
+	px = ReadRGBA(png.Reader(file))
+	if fmt=='RGBA':
+		if depth==16:
+			return RGBA5551Words(px).astype('>u2').tobytes()
+		return px.tobytes()
+	i = px[...,0]
+	a = px[...,3]
+	if fmt=='IA':
+		if depth==4:
+			return Pack(i>>5<<1|a>>7,4)
+		if depth==8:
+			return Pack(i>>4<<4|a>>4,8)
+		if depth==16:
+			return np.stack([i,a],axis=-1).tobytes()
+	if fmt=='I' and depth in (4,8):
+		return Pack(i>>(8-depth),depth)
+	raise ValueError('can not encode %s%d'%(fmt,depth))
+
+#the palette is taken from the png if it has one, otherwise it's made from its colors
+def EncodeCI(file,depth):
+	r = png.Reader(file)
+	r.preamble()
+	if r.plte:
+		w,h,rows,info = r.read()
+		idx = np.array(list(rows),dtype=np.uint8)
+		pal = np.array([p if len(p)==4 else (*p,0xFF) for p in info['palette']],dtype=np.uint8)
+	else:
+		pal,idx = np.unique(RGBA5551Words(ReadRGBA(r)),return_inverse=True)
+		pal = RGBA5551[pal]
+	if idx.max(initial=0)>=2**depth:
+		raise ValueError('png has more than %d colors'%2**depth)
+	return [Pack(idx,depth),RGBA5551Words(pal).astype('>u2').tobytes()]
 
+#old interface, these return the bins as a list of chunks
 def MakeRGBA(file,Bpp,Alpha):
-    r = png.Reader(file)
-    re = r.read()
-    depth = re[3]['bitdepth']
-    channels = re[3]['planes']
-    if channels==3:
-        shifts = [3,3,3]
-    else:
-        shifts = [3,3,3,7]
-    if depth==8 and Bpp==16:
-        #two bytes per pixel, need to convert to rgba5551
-        rows = []
-        for r in re[2]:
-            for W in range(0,len(r),channels):
-                b = r[W:W+channels]
-                a = [c>>s for c,s in zip(b,shifts)]
-                if len(shifts)==3:
-                    a.append(1)
-                b = pack('3*uint:5,uint:1',*a)
-                rows.append(b.bytes)
-        return rows
-    else:
-        if channels==3:
-            solid = bytes([0xff])
-        else:
-            solid = bytes()
-        bin = []
-        for r in re[2]:
-            for W in range(0,len(r),channels):
-                bin.append(r[W:W+channels]+solid)
-        return bin
+	return [Encode(file,'RGBA',Bpp)]
 
 def MakeCI(file,Bpp,Alpha):
-    r = png.Reader(file)
-    re = r.read()
-    Pal = re[3]['palette']
-    Pbin = []
-    shifts = [3,3,3,7]
-    for p in Pal:
-        b = [a>>s for a,s in zip(p,shifts)]
-        if len(p)==4:
-            b = pack('3*uint:5,uint:1',*b)
-        else:
-            b = pack('3*uint:5,uint:1',*b,1)
-        Pbin.append(b.bytes)
-    bin = []
-    for p in re[2]:
-        for w in range(0,re[0],(8//Bpp)):
-            b = p[w:w+(8//Bpp)]
-            b = pack('%d*uint:%d'%((8//Bpp),Bpp),*b)
-            bin.append(b.bytes)
-    return [bin,Pbin]
+	[bin,pal] = Encode(file,'CI',Bpp)
+	return [[bin],[pal]]
 
 def MakeIntensity(file,Bpp,Alpha):
-    r = png.Reader(file)
-    re = r.read()
-    depth = re[3]['bitdepth']
-    channels = re[3]['planes']
-    if channels-Alpha>1:
-        #This means it has an alpha channel we must ignore
-        bin = []
-        for r in re[2]:
-            last = 0
-            for W in range(0,len(r),channels*depth//8):
-                b = r[W:W+(max(1,Bpp//8))]
-                b = [a for a in b]
-                if last==0 and Bpp==4:
-                    last = ((b[0]>>(depth-4))&0xF)<<(depth-4)
-                    continue
-                elif (8-Bpp)>0:
-                    a = b[0]>>(depth-4)
-                else:
-                    a = b[0]>>(depth-Bpp)
-                bin.append(bytes([a+last]))
-                last = 0
-        return bin
-    else:
-        #This should mean its all ready to go
-        if Bpp==4:
-            shifts = [4,7]
-        else:
-            shifts = [0,0]
-        bin = []
-        for r in re[2]:
-            last = 0
-            for W in range(0,len(r),channels*depth//8):
-                b = r[W:W+(max(1,Bpp//8))*channels]
-                b = [a for a in b]
-                if last==0 and Bpp==4:
-                    if Alpha:
-                        last = ((b[0]>>(depth-4))&0xE)<<(depth-4)
-                        last += ((b[1]>>(depth-1))&0xF)<<(depth-4)
-                    else:
-                        last = ((b[0]>>(depth-4))&0xF)<<(depth-4)
-                    continue
-                elif Bpp==4:
-                    if Alpha:
-                        a = (b[0]>>(depth-4))&0xE
-                        a += b[1]>>(depth-1)
-                    else:
-                        a = b[0]>>(depth-4)
-                else:
-                    a = b[0]>>(depth-Bpp)
-                    if Alpha:
-                        a = ((b[0]>>(depth-Bpp//2))<<(Bpp//2))+(b[1]>>(depth-Bpp//2))
-                bin.append(bytes([a+last]))
-                last = 0
-        return bin
\ No newline at end of file
+	if Alpha:
+		return [Encode(file,'IA',Bpp)]
+	return [Encode(file,'I',Bpp)]
+
+#formats by the suffix decomp gives texture pngs, e.g. name.rgba16.png
+Suffixes = {'rgba16':('RGBA',16),'rgba32':('RGBA',32),'ia4':('IA',4),'ia8':('IA',8),'ia16':('IA',16),
+	'i4':('I',4),'i8':('I',8),'ci4':('CI',4),'ci8':('CI',8)}
+
+def EncodeFile(name):
+	fmt = Suffixes[name.split('.')[-2]]
+	return Encode(name,*fmt)
+
+#every texture png in dir and the folders in it, encoded by the format in their names.
+#returns {png path: bin} with [bin,palette bin] for CI
+def EncodeDir(dir):
+	names = []
+	for root,dirs,files in os.walk(dir):
+		dirs.sort()
+		for n in sorted(files):
+			n = n.split('.')
+			if n[-1]=='png' and len(n)>2 and n[-2] in Suffixes:
+				names.append(os.path.join(root,'.'.join(n)))
+	return dict(zip(names,Workers.Map(EncodeFile,names)))
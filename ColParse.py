@@ -1,8 +1,7 @@
 import struct
-from bitstring import *
-from numpy import cross, linalg
-from pyhull.delaunay import DelaunayTri
+import numpy as np
 import os
+import Output
 
 def TcH(bytes):
 	a = struct.pack(">%dB"%len(bytes),*bytes)
@@ -14,17 +13,22 @@ def TcH(bytes):
 		return struct.unpack(">B",a)[0]
 
 def Halfs(start,len,rom):
-	return struct.unpack(">%dh"%len,rom[start:start+len*2])
+	return rom.Unpack("%dh"%len,start)
 
 def HalfsU(start,len,rom):
-	return struct.unpack(">%dH"%len,rom[start:start+len*2])
+	return rom.Unpack("%dH"%len,start)
 
 def Bytes(start,len,rom):
-	return struct.unpack(">%dB"%len,rom[start:start+len])
+	return rom.Unpack("%dB"%len,start)
 
-def ColWrite(name,s,rom,start,id):
-	[b,x,rom,f,CD] = ColWriteGeneric(name,s,rom,start,id)
+#num verts of collision as an (num,3) array
+def ColVerts(rom,start,num):
+	return np.frombuffer(rom.View(start,num*6),'>i2').reshape(-1,3)
+
+def ColWrite(name,s,rom,start,id,Optimize=0):
+	[b,x,rom,f,CD] = ColWriteGeneric(name,s,rom,start,id,Optimize)
 	ColWriteLevelSpecial(b,x,rom,f)
+	return CD
 
 def ColWriteActor(name,s,rom,start,id):
 	[b,x,rom,f,CD] = ColWriteGeneric(name,s,rom,start,id)
@@ -34,15 +38,60 @@ def ColWriteActor(name,s,rom,start,id):
 	L2 = len(CD.verts)+len(CD.DPV)
 	return [start,L,L2]
 
-diff = (lambda x,y: [a-b for a,b in zip(x,y)])
+#Flips the tris whose normal points down, V is the vertex array the tris index
+def CheckNorm(V,tris):
+	[v1,v2,v3] = [V[tris[:,a]].astype(np.int64) for a in range(3)]
+	CP = np.cross(v2-v1,v3-v1)
+	flip = CP[:,1]<=0
+	tris = tris.copy()
+	tris[flip,1],tris[flip,2] = tris[flip,2],tris[flip,1]
+	return tris
 
-def CheckNorm(verts,start,rom):
-	[v1,v2,v3] = [Halfs(start+a*6,3,rom) for a in verts]
-	CP = cross(diff(v2,v1),diff(v3,v1))
-	if CP[1]>0:
-		return verts
-	else:
-		return [verts[0],verts[2],verts[1]]
+#One line per row of rows, formatted in a single % instead of per line
+def Lines(fmt,rows,w):
+	rows = np.asarray(rows,dtype=np.int64).reshape(-1,w)
+	return (fmt*len(rows))%tuple(rows.ravel().tolist())
+
+#The game's static surface partition (surface_load.c). Level collision is put in a grid of
+#cells over the level bounds, one surface node for every cell a surface's bounding box is in
+#(plus a cell when it's within 50 units of one). Vanilla bounds, extended_bounds.h can change them.
+LevelBoundaryMax = 0x2000
+CellSize = 0x400
+NumCells = 2*LevelBoundaryMax//CellSize
+
+#coord + LEVEL_BOUNDARY_MAX is done in s16 by the game, so coords from 0x6000 up wrap
+#around negative and end up in the first cell
+def Shift(c):
+	c = ((c+LevelBoundaryMax+0x8000)&0xFFFF)-0x8000
+	return np.maximum(c,0)
+
+def LowerCell(c):
+	c = Shift(c)
+	return np.maximum(c//CellSize-(c%CellSize<50),0)
+
+def UpperCell(c):
+	c = Shift(c)
+	return np.minimum(c//CellSize+(c%CellSize>CellSize-50),NumCells-1)
+
+#Surface nodes per cell for the surfaces made from tris, as floor, wall and ceiling
+#grids indexed [z][x], and the number of surfaces. Tris with no normal aren't loaded.
+def Partition(V,tris):
+	P = V.astype(np.int64)[tris]
+	N = np.cross(P[:,1]-P[:,0],P[:,2]-P[:,1])
+	mag = np.linalg.norm(N,axis=1)
+	P = P[mag>=0.0001]
+	ny = N[mag>=0.0001,1]/mag[mag>=0.0001]
+	kind = np.where(ny>0.01,0,np.where(ny<-0.01,2,1))
+	[x0,x1] = [LowerCell(P[:,:,0].min(axis=1)),UpperCell(P[:,:,0].max(axis=1))]
+	[z0,z1] = [LowerCell(P[:,:,2].min(axis=1)),UpperCell(P[:,:,2].max(axis=1))]
+	#count each box at its corners and sum them up over the grid
+	ok = (x1>=x0) & (z1>=z0)
+	[kind,x0,x1,z0,z1] = [a[ok] for a in (kind,x0,x1,z0,z1)]
+	cells = np.zeros((3,NumCells+1,NumCells+1),dtype=np.int64)
+	for z,x,n in ((z0,x0,1),(z0,x1+1,-1),(z1+1,x0,-1),(z1+1,x1+1,1)):
+		np.add.at(cells,(kind,z,x),n)
+	cells = cells.cumsum(axis=1).cumsum(axis=2)[:,:NumCells,:NumCells]
+	return [cells,len(P)]
 
 #This will just be a data storage class for formatter strings of collision data.
 #Each attr will be an array that is one section of collision data structure
@@ -51,196 +100,239 @@ class ColDat():
 	def __init__(self,file):
 		self.Vcount=0
 		self.verts=[]
-		self.Tris={} #key is type, value is list of tris
+		self.V=None #vertex array, verts holds the same as tuples
+		self.Tris={} #key is type, value is array of tris
 		self.file=file
 		self.specials = [0xe,0x24,0x25,0x27,0x2c,0x2D]
 		self.DPV = []
-	def initType(self,type):
-		if self.Tris.get(type):
-			return
+		#[tris before,after] once Optimize has run
+		self.Optimized = None
+	def AddTris(self,type,tris):
+		if type in self.Tris:
+			self.Tris[type] = np.concatenate((self.Tris[type],tris))
 		else:
-			self.Tris[type] = []
+			self.Tris[type] = tris
 	def writeCol(self):
 		f = self.file
 		self.SplitCrossQuadrant()
 		f.write(self.Vcount.format(len(self.verts)+len(self.DPV)))
-		[f.write("COL_VERTEX( {}, {}, {}),\n".format(*v)) for v in self.verts]
-		[f.write("COL_VERTEX( {}, {}, {}),\n".format(*v)) for v in self.DPV]
+		f.write(Lines("COL_VERTEX( %d, %d, %d),\n",self.V,3))
+		f.write(Lines("COL_VERTEX( %d, %d, %d),\n",self.DPV,3))
 		for k,v in self.Tris.items():
 			f.write("COL_TRI_INIT( {}, {}),\n".format(k,len(v)))
 			if k in self.specials:
-				[f.write("COL_TRI_SPECIAL( {}, {}, {}, {}),\n".format(*t)) for t in v]
+				f.write(Lines("COL_TRI_SPECIAL( %d, %d, %d, %d),\n",v,4))
 			else:
-				[f.write("COL_TRI( {}, {}, {}),\n".format(*t)) for t in v]
+				f.write(Lines("COL_TRI( %d, %d, %d),\n",v,3))
 		f.write("COL_TRI_STOP(),\n")
+	#Death planes that cross the x or z axis are cut into pieces that each stay in one quadrant
 	def SplitCrossQuadrant(self):
-		if not self.Tris.get(10):
+		tris = self.Tris.get(10)
+		if tris is None or not len(tris):
+			return
+		V = self.V.astype(np.int64)
+		P = np.stack([V[tris[:,a]] for a in range(3)],axis=1)
+		#there are some hackers who have reasonably sized tris
+		#don't split them up. This value is the area of a death plane tri.
+		area = np.linalg.norm(np.cross(P[:,1]-P[:,0],P[:,2]-P[:,0]),axis=1)
+		CQ = (lambda d: (P[:,:,d].max(axis=1)>0) & (P[:,:,d].min(axis=1)<0))
+		split = (area>=536838144) & (CQ(0)|CQ(2))
+		if not split.any():
 			return
-		NewTri=[]
-		offset=len(self.verts)
-		#Only check death plane for now
-		for tri in self.Tris[10]:
-			#This is inefficient
-			NewV=[]
-			verts = [self.verts[t] for t in tri]
-			area=self.TriArea(verts)
-			#there are some hackers who have reasonably sized tris
-			#don't split them up. This value is half the area of a death plane tri.
-			if area<268419072:
+		#original verts keep their index, new ones go in DPV
+		index = {}
+		def Index(v):
+			if v not in index:
+				index[v] = len(self.verts)+len(self.DPV)
+				self.DPV.append(v)
+			return index[v]
+		NewTri = []
+		for tri in tris[split]:
+			poly = [self.verts[t] for t in tri]
+			for t,v in zip(tri,poly):
+				index.setdefault(v,int(t))
+			for sx in (1,-1):
+				for sz in (1,-1):
+					piece = Clip(Clip(poly,0,sx),2,sz)
+					NewTri.extend(Fan([Index(v) for v in piece],piece))
+		V = np.concatenate((V,np.array(self.DPV,dtype=np.int64).reshape(-1,3)))
+		NewTri = CheckNorm(V,np.array(NewTri,dtype=np.int64).reshape(-1,3))
+		self.Tris[10] = np.concatenate((tris[~split],NewTri))
+	#Welds vertices at the same spot, drops tris with no area and merges pairs of tris of the
+	#same type (and param) that share an edge and together make a triangle, then drops the
+	#vertices nothing uses anymore. Returns the number of tris before and after.
+	def Optimize(self):
+		before = sum(len(v) for v in self.Tris.values())
+		V = self.V.astype(np.int64)
+		#tris indexing past the vertices read garbage from the rom, leave them alone
+		if not before or max(int(np.max(v[:,:3])) for v in self.Tris.values() if len(v))>=len(V):
+			return [before,before]
+		[V,first,weld] = np.unique(V,axis=0,return_index=True,return_inverse=True)
+		#unique sorts the verts, keep them in the order they came in
+		order = np.argsort(first)
+		weld = np.argsort(order)[weld.ravel()]
+		V = V[order]
+		keys = list(self.Tris)
+		blocks = [np.asarray(self.Tris[k],dtype=np.int64).reshape(-1,4 if k in self.specials else 3) for k in keys]
+		tris = np.concatenate([t[:,:3] for t in blocks])
+		#tris only merge with tris of the same type and param
+		group = np.concatenate([(k<<16)+(t[:,3] if t.shape[1]==4 else np.zeros(len(t),dtype=np.int64)) for k,t in zip(keys,blocks)])
+		tris = weld[tris]
+		P = V[tris]
+		keep = np.linalg.norm(np.cross(P[:,1]-P[:,0],P[:,2]-P[:,0]),axis=1)>0
+		[tris,group] = [tris[keep],group[keep]]
+		while(True):
+			[tris,merged] = MergeTris(V,tris,np.unique(group,return_inverse=True)[1].ravel())
+			if not merged.any():
+				break
+			[tris,group] = [tris[~merged],group[~merged]]
+		#drop unused verts, the ones left keep their order
+		used = np.unique(tris)
+		remap = np.zeros(len(V),dtype=np.int64)
+		remap[used] = np.arange(len(used))
+		self.V = V[used]
+		self.verts = list(map(tuple,self.V.tolist()))
+		tris = remap[tris]
+		self.Tris = {}
+		for k in keys:
+			sel = (group>>16)==k
+			if not sel.any():
 				continue
-			Edges = [[verts[0],verts[1]],[verts[1],verts[2]],[verts[2],verts[0]]] #yee
-			CQ = (lambda e,d: max([a[d] for a in e])>0 and min([a[d] for a in e])<0)
-			CondApp = (lambda arr,x: arr.append(x) if x not in arr else 0)
-			for e in Edges:
-				#Split X edge
-				if CQ(e,0):
-					for i,v in enumerate(e):
-						one=e[(i+1)%2]
-						if ((one[0]-v[0]))!=0:
-							Lerp=int((v[2]*(one[0]-0)+one[2]*(0-v[0]))/((one[0]-v[0])))
-						else:
-							Lerp=0
-						if v[0]>0:
-							CondApp(NewV,v)
-						else:
-							CondApp(NewV,(0,v[1],Lerp))
-						if v[0]<0:
-							CondApp(NewV,v)
-						else:
-							CondApp(NewV,(0,v[1],Lerp))
-				#Split Z edge
-				if CQ(e,2):
-					for i,v in enumerate(e):
-						one=e[(i+1)%2]
-						if ((one[2]-v[2]))!=0:
-							Lerp=int((v[0]*(one[2]-0)+one[0]*(0-v[2]))/((one[2]-v[2])))
-						else:
-							Lerp=0
-						if v[2]>0:
-							CondApp(NewV,v)
-						else:
-							CondApp(NewV,(Lerp,v[1],0))
-						if v[2]<0:
-							CondApp(NewV,v)
-						else:
-							CondApp(NewV,(Lerp,v[1],0))
-			if NewV:
-				self.DPV.extend(NewV)
-				NewTri.extend(self.MakeNewTris(NewV,offset))
-				offset+=len(NewV)
-			else:
-				NewTri.append(tri)
-		if NewTri:
-			self.Tris[10] = NewTri
-	#Checks to see if any point is inside the tri
-	def TriInterior(self,verts,tri):
-		dot = (lambda x,y: sum([a+b for a,b in zip(x,y)]))
-		for v in verts:
-			P1 = diff(tri[2],tri[0])
-			P2 = diff(tri[1],tri[0])
-			P3 = diff(v,tri[0])
-			dot00=dot(P1,P1)
-			dot01=dot(P1,P2)
-			dot02=dot(P1,P3)
-			dot11=dot(P2,P2)
-			dot12=dot(P2,P3)
-			inv = 1/(dot00*dot11 - dot01*dot01)
-			u = (dot11 * dot02 - dot01 * dot12) * inv
-			v = (dot00 * dot12 - dot01 * dot02) * inv
-			if ((u >= 0) and (v >= 0) and (u + v < 1)):
-				return True
-		return False
-	def TriArea(self,Tri):
-		sides = [diff(Tri[i],Tri[(i+1)%3]) for i in range(3)]
-		sides = [linalg.norm(s) for s in sides]
-		s = sum(sides)/2
-		area = (s*(s-sides[0])*(s-sides[1])*(s-sides[2]))**.5
-		return area
-	def MakeNewTris(self,NewV,offset):
-		#use delaunay triangulation via module (would be faster than code I wrote anyway
-		#because its written as a C dll)
-		pts = [[v[0],v[2]] for v in NewV] #2d projection
-		triD=DelaunayTri(pts,joggle=True)
-		tris=[]
-		add = (lambda x,y: [a+y for a in x])
-		for tri in triD.vertices:
-			[v1,v2,v3] = [NewV[i] for i in tri]
-			CP = cross(diff(v2,v1),diff(v3,v1))
-			if CP[1]>0:
-				tris.append(add(tri,offset))
+			if k in self.specials:
+				self.Tris[k] = np.concatenate((tris[sel],(group[sel]&0xFFFF)[:,None]),axis=1)
 			else:
-				tris.append(add([tri[0],tri[2],tri[1]],offset))
-		return tris
-	def VecAngle(self,Vec):
-		x=Vec[0]
-		z=Vec[2]
-		if x!=0:
-			ang=arctan(abs(z/x))
-		else:
-			ang=math.pi/2
-		if x<0:
-			ang=math.pi-ang
-		if z<0:
-			ang=2*math.pi-ang
-		return math.degrees(ang)
+				self.Tris[k] = tris[sel]
+		return [before,len(tris)]
+	#Partition of everything written, run after writeCol
+	def Partition(self):
+		V = np.concatenate((self.V.reshape(-1,3),np.array(self.DPV,dtype=np.int64).reshape(-1,3)))
+		tris = np.concatenate([np.asarray(v,dtype=np.int64).reshape(-1,4 if k in self.specials else 3)[:,:3] for k,v in self.Tris.items()]+[np.zeros((0,3),dtype=np.int64)])
+		#the game would read garbage past the vertices, leave those out
+		return Partition(V,tris[tris.max(axis=1,initial=0)<len(V)])
+
+#One pass of merging tris (rows of vertex indices in V) that share an edge with a tri of
+#the same group when a vertex of that edge is on the line between their other two
+#vertices, the pair is then one triangle. Every tri merges at most once per pass.
+#Returns the tris, with each merged one replaced, and which of them were merged away.
+#group has to be small ids, it goes in the edge keys above the two vertex indices.
+def MergeTris(V,tris,group):
+	n = len(tris)
+	merged = np.zeros(n,dtype=bool)
+	if not n:
+		return [tris,merged]
+	#edge i of a tri goes from vertex i to vertex i+1, c is the vertex not on it
+	E = np.stack([tris,np.roll(tris,-1,axis=1),np.roll(tris,-2,axis=1)],axis=2).reshape(-1,3)
+	G = np.repeat(group,3)
+	key = (G<<32)+(E[:,0]<<16)+E[:,1]
+	rev = (G<<32)+(E[:,1]<<16)+E[:,0]
+	sort = np.argsort(key,kind='stable')
+	pos = np.searchsorted(key[sort],rev)
+	found = pos<len(key)
+	found[found] = key[sort[pos[found]]]==rev[found]
+	#edge e of tri e//3 is a->b with c opposite, the matching edge is b->a with d opposite
+	e = np.nonzero(found)[0]
+	o = sort[pos[e]]
+	[a,b,c,d] = [E[e,0],E[e,1],E[e,2],E[o,2]]
+	#each pair once
+	pair = e//3<o//3
+	[e,o,a,b,c,d] = [x[pair] for x in (e,o,a,b,c,d)]
+	Between = (lambda m: (np.cross(V[c]-V[m],V[d]-V[m])==0).all(axis=1) & (np.einsum('ij,ij->i',V[c]-V[m],V[d]-V[m])<0))
+	[onA,onB] = [Between(a),Between(b)]
+	cand = np.nonzero(onA|onB)[0]
+	tris = tris.copy()
+	used = np.zeros(n,dtype=bool)
+	for i in cand.tolist():
+		[t1,t2] = [e[i]//3,o[i]//3]
+		if used[t1] or used[t2]:
+			continue
+		used[t1] = used[t2] = True
+		#the pair is b,c,a,d going around, drop whichever of a or b is on the line
+		tris[t1] = [b[i],c[i],d[i]] if onA[i] else [c[i],a[i],d[i]]
+		merged[t2] = True
+	return [tris,merged]
+
+#The part of the convex polygon poly on the sign side of the plane where axis d is 0.
+#Crossings are worked out from the edge's lower end so both sides get the same vertex.
+def Clip(poly,d,sign):
+	out = []
+	for i,p in enumerate(poly):
+		q = poly[(i+1)%len(poly)]
+		if sign*p[d]>=0:
+			out.append(p)
+		if (p[d]>0 and q[d]<0) or (p[d]<0 and q[d]>0):
+			[a,b] = sorted((p,q))
+			t = a[d]/(a[d]-b[d])
+			out.append(tuple(0 if k==d else int(a[k]+(b[k]-a[k])*t) for k in range(3)))
+	return out
 
+#Triangle fan of a convex polygon, ids are the vertex indices of its points.
+#Tris with no area seen from above are left out.
+def Fan(ids,poly):
+	tris = []
+	for i in range(1,len(poly)-1):
+		[a,b,c] = [poly[0],poly[i],poly[i+1]]
+		if (b[2]-a[2])*(c[0]-a[0])-(b[0]-a[0])*(c[2]-a[2]):
+			tris.append([ids[0],ids[i],ids[i+1]])
+	return tris
 
-def ColWriteGeneric(name,s,rom,start,id):
+def ColWriteGeneric(name,s,rom,start,id,Optimize=0):
 	if os.path.exists(name):
-		f = open(name,'a')
+		f = Output.Open(name,'a')
 	else:
-		f = open(name,'w')
+		f = Output.Open(name,'w')
 	f.write("const Collision col_%s[] = {\nCOL_INIT(),\n"%(id+hex(start)))
 	b=s.B2P(start)
+	#tri blocks past the end of the segment (or rom) are garbage, stop there
+	end = len(rom)
+	seg = s.banks[start>>24] if start>>24 else None
+	if seg and b<seg[1]<end:
+		end = seg[1]
 	vnum=HalfsU(b+2,1,rom)[0]
 	CD = ColDat(f)
 	CD.Vcount="COL_VERTEX_INIT({}),\n"
 	b+=4
-	for i in range(vnum):
-		q=Halfs(b+i*6,3,rom)
-		CD.verts.append(q)
+	V = ColVerts(rom,b,vnum)
+	CD.V = V
+	CD.verts = list(map(tuple,V.tolist()))
 	x=0
 	b+=vnum*6
 	specials = [0xe,0x24,0x25,0x27,0x2c,0x2D]
-	while(True):
+	while(b+x+4<=end):
 		Tritype=HalfsU(x+b,2,rom)
-		if Tritype[0]==0x41 or x>132000:
+		if Tritype[0]==0x41:
 			break
-		CD.initType(Tritype[0])
 		#special tri with param
-		if Tritype[0] in specials:
-			for j in range(Tritype[1]):
-				verts=HalfsU(x+b+4+j*8,4,rom)
-				CD.Tris[Tritype[0]].append(verts)
-			x+=Tritype[1]*8+4
-		else:
-			for j in range(Tritype[1]):
-				verts=HalfsU(x+b+4+j*6,3,rom)
-				if Tritype[0]==10:
-					#Normals for death planes aren't proper thanks editor
-					verts=CheckNorm(verts,s.B2P(start)+4,rom)
-				CD.Tris[Tritype[0]].append(verts)
-			x+=Tritype[1]*6+4
+		w = 4 if Tritype[0] in specials else 3
+		if b+x+4+Tritype[1]*w*2>end:
+			print("collision {} runs past the end of its segment at {}".format(hex(start),hex(b+x)))
+			break
+		tris = np.frombuffer(rom.View(x+b+4,Tritype[1]*w*2),'>u2').reshape(-1,w)
+		if Tritype[0]==10 and len(tris):
+			#Normals for death planes aren't proper thanks editor
+			#tris can index past the vertex block, the old reads went straight to the rom
+			n = int(tris.max())+1
+			tris = CheckNorm(V if n<=vnum else ColVerts(rom,b-vnum*6,n),tris)
+		CD.AddTris(Tritype[0],tris)
+		x+=Tritype[1]*w*2+4
+	if Optimize:
+		CD.Optimized = CD.Optimize()
+		print("collision {} optimized, {} tris to {}".format(hex(start),*CD.Optimized))
 	CD.writeCol()
 	return [b,x,rom,f,CD]
 
 def ColWriteLevelSpecial(b,x,rom,f):
 	b+=x+2
-	while(True):
+	while(b+4<=len(rom)):
 		special=Halfs(b,2,rom)
-		#end
-		if special[0]==0x42:
-			f.write("COL_END(),\n};\n")
-			break
 		#water
-		elif special[0]==0x44:
+		if special[0]==0x44:
 			b+=4
 			f.write("COL_WATER_BOX_INIT({}),\n".format(special[1]))
 			for i in range(special[1]):
 				water=Halfs(b,6,rom)
 				f.write("COL_WATER_BOX({}, {}, {}, {}, {}, {}),\n".format(*water))
 				b+=12
-		#if its neither of these something is wrong, just exit
+		#0x42 is the end, if its neither of these something is wrong, just exit
 		else:
-			f.write("COL_END(),\n};\n")
-			break
\ No newline at end of file
+			break
+	f.write("COL_END(),\n};\n")
@@ -1,13 +1,12 @@
 import re
-from bitstring import *
+import numpy as np
 import math
 import time
 import struct
 import BinPNG
 import os
-import multiprocessing as mp
-import Log
-from functools import lru_cache
+import Output
+import Workers
 #typedef struct {
 #  unsigned char	col[3];		/* diffuse light value (rgba) */
 #  char 		pad1;
@@ -146,11 +145,15 @@ def OptimizeModeldata(ModelData):
 		ModelData[k][1] = [OptNewMats]
 	return ModelData
 
-def ExportTexture(rom, GetNID, Excess, txt, pos, Trackers, refs, tdir, textures, ImgTypes, t, id, k):
+#textureptrs and lights are lists, this makes them dict keys
+def Hashable(t):
+	return tuple(tuple(x) if type(x)==list else x for x in t)
+
+def ExportTexture(rom, GetNID, Excess, txt, txtIdx, pos, Trackers, refs, tdir, textures, ImgTypes, t, id, k):
 	if t[0]:
 		#textureptrs = raw ptr, bank ptr, length, width, height, imgtype, bitdepth, palette, tile
-		if t in txt:
-			q = txt.index(t)
+		q = txtIdx.get(Hashable(t))
+		if q is not None:
 			Excess.append(['{}_texture_{:08X}'.format(id,t[1]),'{}_texture_{:08X}'.format(GetNID(pos,id,q),txt[q][1])])
 			return
 		texn = 'u8 {}_texture_{:08X}[]'.format(id,t[1])
@@ -161,6 +164,7 @@ def ExportTexture(rom, GetNID, Excess, txt, pos, Trackers, refs, tdir, textures,
 		dex = (Findex(tdir.parts,'actors')|Findex(tdir.parts,'levels'))
 		inc = "/".join(tdir.parts[dex:])+"/"
 		if t[5]=='CI':
+			txtIdx.setdefault(Hashable(t),len(txt)-1)
 			texnp = 'u8 {}_texture_{:08X}[]'.format(id,t[7][1])
 			#export a include of a png file
 			textures.write('ALIGNED8 '+texn+' = {\n')
@@ -184,12 +188,15 @@ def ExportTexture(rom, GetNID, Excess, txt, pos, Trackers, refs, tdir, textures,
 			if t[3]==0 or t[4]==0:
 				t[3]=32
 				t[4]=32
+			txtIdx.setdefault(Hashable(t),len(txt)-1)
 			return (ImgTypes[t[5]],(t[3],t[4],t[6],bin,png))
 
 def ModelWrite(rom, ModelData, nameG, id, tdir, opt, level):
 	#ModelData = start, dl, verts, textureptrs, amb/diff lights, ranges, ids
 	#create redundancy trackers for each data type
 	S, dl, vbs, txt, amb, diffs, refs = [], [], [], [], [], [], []
+	#first index of each one in the lists above, so dupes are found without scanning them
+	SIdx, vbIdx, txtIdx, ambIdx, diffIdx = {}, {}, {}, {}, {}
 	#indices of which model data they are so I can get IDs backwards while replacing
 	Trackers = [[], [], [], [], [], []]
 	#keep track of which symbols are rejected to replace later.
@@ -207,16 +214,18 @@ def ModelWrite(rom, ModelData, nameG, id, tdir, opt, level):
 	Pngs = []
 	name = nameG/'custom.model.inc.c'
 	if os.path.isfile(tdir/'textureNew.inc.c'):
-		textures = open(tdir/'textureNew.inc.c','a')
+		textures = Output.Open(tdir/'textureNew.inc.c','a')
 	else:
-		textures = open(tdir/'textureNew.inc.c','w')
-	f = open(name,'w')
+		textures = Output.Open(tdir/'textureNew.inc.c','w')
+	f = Output.Open(name,'w')
 	f.write('#include "%s"\n'%('custom.model.inc.h'))
 	#For editor levels, do not use on actors or RM unless explicitly told flagged
 	#depends on all data being in the same display list.
 	if opt:
 		Modeldata = OptimizeModeldata(ModelData)
-	CheckFog = (lambda l,md,id: (l,'DL_{}'.format(id+hex(md[0][0][1]))) in Log.LastFog)
+	#refs joined for finding texture names in them, and the symbol renames, both are
+	#remade when their lists grow
+	RefLen, RefText, ExLen, Rename = -1, '', -1, None
 	#Write vertices first so that they're all in a row in ram so vert scrolls work better
 	#Have to put all verts in same array, as individual display lists aren't in order
 	Verts=[]
@@ -231,27 +240,19 @@ def ModelWrite(rom, ModelData, nameG, id, tdir, opt, level):
 		verts = md[pos]
 		Verts.extend(verts)
 	Verts.sort(key=(lambda x: x[0]))
+	names=[]
 	for vb in Verts:
-		if vb in vbs:
-			q = vbs.index(vb)
+		q = vbIdx.get(vb)
+		if q is not None:
 			Eapp((id+hex(vb[0])),(GetNID(pos,id,q)+hex(vbs[q][0])),'VB_%s')
 			continue
+		vbIdx[vb] = len(vbs)
 		vbs.append(vb)
 		Trackers[pos].append(k)
 		VBn = 'Vtx VB_%s[]' % (id + hex(vb[0]))
 		refs.append(VBn)
-		f.write(VBn+' = {\n')
-		for i in range(vb[2]):
-			V = rom[vb[1]+i*16:vb[1]+i*16+16]
-			V = BitArray(V)
-			q = V.unpack('3*int:16,uint:16,2*int:16,4*uint:8')
-			#feel there should be a better way to do this
-			Vpos = q[0:3]
-			UV = q[4:6]
-			rgba = q[6:10]
-			V="\t{{{ %d, %d, %d }, 0, { %d, %d }, { %d, %d, %d, %d}}}," % (*Vpos, *UV, *rgba)
-			f.write(V+'\n')
-		f.write('};\n\n')
+		names.append(VBn)
+	f.write(VtxText(rom,vbs,names))
 	for k, md in enumerate(ModelData):
 		if md[-1]:
 			id = md[-1]
@@ -261,7 +262,7 @@ def ModelWrite(rom, ModelData, nameG, id, tdir, opt, level):
 		#textures
 		pos=3
 		for t in md[pos]:
-			img = ExportTexture(rom, GetNID, Excess, txt, pos, Trackers, refs, tdir, textures, ImgTypes, t, id, k)
+			img = ExportTexture(rom, GetNID, Excess, txt, txtIdx, pos, Trackers, refs, tdir, textures, ImgTypes, t, id, k)
 			if img:
 				Pngs.append(img)
 		#lights
@@ -269,14 +270,16 @@ def ModelWrite(rom, ModelData, nameG, id, tdir, opt, level):
 		#This happens with certain importers or if someone wanted to lazily remove shading
 		pos=5
 		for a in md[pos]:
-			if a in amb:
-				q = amb.index(a)
+			h = Hashable(a)
+			q = ambIdx.get(h)
+			if q is not None:
 				Eapp((id+hex(a[1])),(GetNID(pos,id,q)+hex(amb[q][1])),'Light_%s')
 				continue
-			if a in diffs:
-				q = diffs.index(a)
+			q = diffIdx.get(h)
+			if q is not None:
 				Eapp((id+hex(a[1])),(GetNID(pos,id,q)+hex(diffs[q][1])),'Light_%s')
 				continue
+			ambIdx[h] = len(amb)
 			amb.append(a)
 			Trackers[pos].append(k)
 			lig = 'Light_t Light_%s'%(id+hex(a[1]))
@@ -290,14 +293,16 @@ def ModelWrite(rom, ModelData, nameG, id, tdir, opt, level):
 		#Since both lights overlap excess detection, both will use pos=5
 		pos=4
 		for a in md[pos]:
-			if a in diffs:
-				q = diffs.index(a)
+			h = Hashable(a)
+			q = diffIdx.get(h)
+			if q is not None:
 				Eapp((id+hex(a[1])),(GetNID(5,id,q)+hex(diffs[q][1])),'Light_%s')
 				continue
-			if a in amb:
-				q = amb.index(a)
+			q = ambIdx.get(h)
+			if q is not None:
 				Eapp((id+hex(a[1])),(GetNID(5,id,q)+hex(amb[q][1])),'Light_%s')
 				continue
+			diffIdx[h] = len(diffs)
 			diffs.append(a)
 			Trackers[5].append(k)
 			lig = 'Ambient_t Light_%s'%(id+hex(a[1]))
@@ -312,19 +317,21 @@ def ModelWrite(rom, ModelData, nameG, id, tdir, opt, level):
 		#because symbols can exist inside DLs and as DLs themselves
 		#I have to create trackers and excess before writing any DL
 		#because DLs can be completely non linear and even recursive
-		twice=[]
+		twice=set()
 		#this exists because I lose track of which DLs to skip
 		for s,d in zip(md[pos],md[1]):
-			if s in S:
-				q = S.index(s)
+			h = Hashable(s)
+			q = SIdx.get(h)
+			if q is not None:
 				Eapp((id+hex(s[1])),(GetNID(pos,id,q)+hex(S[q][1])),'DL_%s')
-				twice.append(s)
+				twice.add(h)
 				continue
 			else:
+				SIdx[h] = len(S)
 				S.append(s)
 				Trackers[pos].append(k)
 		for s,d in zip(md[pos], md[1]):
-			if s in twice:
+			if Hashable(s) in twice:
 				continue
 			DLn = 'Gfx DL_'+id+hex(s[1])+'[]'
 			f.write(DLn+' = {')
@@ -341,10 +348,10 @@ def ModelWrite(rom, ModelData, nameG, id, tdir, opt, level):
 					if c.startswith('gsDPSetTextureImage'):
 						args = c.split(',')
 						tex = args[-1][:-1]
-						for ref in refs:
-							if tex in ref:
-								break
-						else:
+						if len(refs)!=RefLen:
+							RefLen = len(refs)
+							RefText = '\n'.join(refs)
+						if tex not in RefText:
 							continue
 					#Just always have combiners repeat first cycle
 					if c.startswith('gsDPSetCombineLERP'):
@@ -368,47 +375,162 @@ def ModelWrite(rom, ModelData, nameG, id, tdir, opt, level):
 						elif 'G_RM_FOG_SHADE_A, G_RM_AA_ZB_OPA_SURF2' in c:
 							SetFogRMO=1
 				#replace culled data refs with first instance of data
-				for e in Excess:
-					if e[0] in c:
-						c = c.replace(e[0], e[1])
+				if len(Excess)!=ExLen:
+					ExLen = len(Excess)
+					Rename = Symbols(Excess)
+				c = Rename(c)
 				f.write("\t" + c + ',\n')
 			f.write('};\n\n')
 	f.close()
-	p = mp.Pool(mp.cpu_count()-1)
-	crcs = p.map(WriteTex,Pngs)
-	p.close()
+	crcs = Workers.WriteImages(Pngs)
 	return [refs,crcs]
 
-def WriteTex(Pngs):
-	func=Pngs[0]
-	args=Pngs[1]
-	img = BinPNG.MakeImage(args[-1])
-	func(*args[:-1],img)
-	img.close()
-	crc = BinPNG.GetCHKSM(img.name)
-	del img
-	return crc
+#regex matching any of words, as a trie so it doesn't try every word at every spot.
+#The longest word is matched where several start at the same spot.
+def TriePattern(words):
+	trie = {}
+	for w in words:
+		t = trie
+		for ch in w:
+			t = t.setdefault(ch,{})
+		t[''] = 1
+	def Pattern(t):
+		alts = [re.escape(ch)+Pattern(sub) for ch,sub in t.items() if ch]
+		if not alts:
+			return ''
+		p = alts[0] if len(alts)==1 else '(?:%s)'%'|'.join(alts)
+		if '' in t:
+			return '(?:%s)?'%p
+		return p
+	return Pattern(trie)
+
+#Rename the culled symbols in Excess to their first instance. Same as applying every pair
+#to the cmd one after the other, but only the pairs whose name is in the cmd are looked at.
+#They're found with one regex scan, and again after each rename since it can make new names.
+def Symbols(Excess):
+	#indices of the pairs for each culled name, renaming a symbol to itself does nothing
+	pairs = {}
+	for j,e in enumerate(Excess):
+		if e[0]!=e[1]:
+			pairs.setdefault(e[0],[]).append(j)
+	if not pairs:
+		return (lambda c: c)
+	#the scan finds the longest name at each spot, names it starts with are there too
+	exp = re.compile('(?=(%s))'%TriePattern(pairs))
+	pre = {k:[q for i in range(1,len(k)+1) for q in pairs.get(k[:i],[])] for k in pairs}
+	def Rename(c):
+		j = 0
+		while(True):
+			found = [q for m in exp.finditer(c) for q in pre[m.group(1)] if q>=j]
+			if not found:
+				return c
+			j = min(found)
+			c = c.replace(Excess[j][0], Excess[j][1])
+			j += 1
+	return Rename
+
+#Vtx as it is in the rom, pos, flag, tex coords, color or normal+alpha
+Vtx=np.dtype([('pos','>i2',3),('flag','>u2'),('uv','>i2',2),('rgba','u1',4)])
+#the C initializer of a Vtx split around its numbers
+VtxFmt=np.array("\t{{{ %d, %d, %d }, 0, { %d, %d }, { %d, %d, %d, %d}}},\n".split('%d'),dtype=object)
+#the text of every value a field can have, s16 fields are looked up as u16
+VtxNums=np.array(list(map(str,range(0x8000)))+list(map(str,range(-0x8000,0))),dtype=object)
+
+#the verts of every vb = (seg ptr, rom ptr, num verts) in vbs as one array of Vtx
+def Vertices(rom, vbs):
+	raw=b''.join([rom.View(vb[1],vb[2]*Vtx.itemsize) for vb in vbs])
+	return np.frombuffer(raw,dtype=Vtx,count=sum([vb[2] for vb in vbs]))
+
+#C arrays of the verts of every vb in vbs, named by names. The verts are formatted
+#with table lookups into one array of strings that is joined once.
+def VtxText(rom, vbs, names):
+	if not vbs:
+		return ''
+	v=Vertices(rom,vbs)
+	out=np.empty((len(v),len(VtxFmt)*2-1),dtype=object)
+	out[:,0::2]=VtxFmt
+	out[:,1:6:2]=VtxNums[v['pos'].astype(np.uint16)]
+	out[:,7:10:2]=VtxNums[v['uv'].astype(np.uint16)]
+	out[:,11::2]=VtxNums[v['rgba']]
+	#array heads go before the first vert of each vb and the closing brace after the last
+	ends=np.cumsum([vb[2] for vb in vbs])
+	out[ends-[vb[2] for vb in vbs],0]=['%s = {\n%s'%(n,VtxFmt[0]) for n in names]
+	out[ends-1,-1]=VtxFmt[-1]+'};\n\n'
+	return ''.join(out.ravel().tolist())
 
 #f3d binary start
 #takes bin, and returns tuple with C macro
 
-class F3D_decode():
-	def __init__(self,cmd):
-		self.fmt=DecodeFmt[cmd][0]
-		self.func=DecodeFmt[cmd][1]
+#Each decoder gets the fields of the 56 bits after the opcode, laid out by the bitstring
+#style format next to it in DecodeFmt. The formats are compiled once into shift/mask
+#extractors on the cmd as a 64 bit int, so no BitArray is built per cmd.
+def CompileFmt(fmt):
+	fields=[]
+	pos=8
+	for f in fmt.split(','):
+		if not f:
+			continue
+		n=1
+		if '*' in f:
+			n,f=f.split('*')
+		t,w=f.split(':')
+		for i in range(int(n)):
+			pos+=int(w)
+			fields.append((64-pos,(1<<int(w))-1,t=='int'))
+	#G_TEXRECT is longer than one cmd, same as bitstring this can't be unpacked
+	if pos>64:
+		def Overrun(c):
+			raise ValueError('format %s is longer than one cmd'%fmt)
+		return Overrun
+	ext=[]
+	for shift,mask,signed in fields:
+		e='((c>>%d)&%d)'%(shift,mask)
+		if signed:
+			e='(%s^%d)-%d'%(e,(mask+1)>>1,(mask+1)>>1)
+		ext.append(e)
+	return eval('lambda c: (%s,)'%(','.join(ext))) if ext else (lambda c: ())
+
+#the model id is only put into the C macro after the cache, so one entry works for every model
+IdMark='@id@'
+
+#raw cmd -> [C macro, cmd as int]
+Decoded={}
 
-	def decode(self,cmd,*args):
-		return [self.fmt,*args]
+#cycle type from the last setothermode_h, reset for every DL in DecodeVDL
+gCycle=1
 
-#give cmd as binary.
-#should return cmd as string, and args as tuple
-@lru_cache(maxsize=32) #will save lots of time with repeats of tri calls
+#give cmd as bytes.
+#returns cmd as C macro string, and the cmd as a 64 bit int
 def Bin2C(cmd,id):
-	cmd = BitArray(cmd)
-	c = F3D_decode(cmd[0:8].uint)
-	V= c.func(cmd[8:],id)
-	q = c.decode(c.fmt,V)
-	if len(q[1])<4 and (cmd[:8].uint==0xb9 or cmd[:8].uint==0xbA):
+	res=Decode(cmd)
+	if IdMark in res[0]:
+		return [res[0].replace(IdMark,id),res[1]]
+	return res
+
+#Bin2C with IdMark left in the C macro
+def Decode(cmd):
+	op=cmd[0]
+	key=cmd
+	#combiner output depends on the cycle type set by earlier cmds
+	if op==0xfc:
+		key=cmd+bytes([gCycle])
+	res=Decoded.get(key)
+	if not res:
+		res=DecodeCmd(cmd)
+		#setothermode_h sets the cycle type, so it always has to be decoded
+		if op!=0xba:
+			if len(Decoded)>0x20000:
+				Decoded.clear()
+			Decoded[key]=res
+	return res
+
+def DecodeCmd(cmd):
+	c=int.from_bytes(cmd,'big')
+	op=c>>56
+	fmt,func,ext=DecodeTable[op]
+	V=func(ext(c),IdMark)
+	q=[fmt,V]
+	if len(q[1])<4 and (op==0xb9 or op==0xbA):
 		q[0]=q[1][0]
 		if q[1][0]=='gsDPSetRenderMode':
 			q[1]=q[1][1:]
@@ -419,10 +541,49 @@ def Bin2C(cmd,id):
 	#hardcoded cringe thanks gbi
 	if len(q[1])==1:
 		ags=ags.replace(',','')
-	if cmd[:8].uint==6:
-		if cmd[8:16].uint!=1:
+	if op==6:
+		if (c>>48)&0xFF!=1:
 			q[0]='gsSPDisplayList'
-	return [q[0]+ags,cmd]
+	return [q[0]+ags,c]
+
+#Decoded DLs, so a DL shared by models, areas or actors is only decoded once. Keyed on
+#the DL's address, opt and the cycle type it starts with. Each key has a list of
+#[banks, mats read, mats set, entry], banks and mats read are the bank mappings and opt=1
+#material state the decode depended on, mats set is the material state it left behind.
+#entry is [dls, starts, events, cycle type after, rom pages read], the C macros in dls
+#have IdMark in place of the model id and events replay what EvalMaterial did.
+DLCache={}
+
+#[hits, misses] of DLCache
+CacheStats=[0,0]
+
+#start a new export, the rom might have changed since the last one
+def ResetCache():
+	DLCache.clear()
+	CacheStats[:]=[0,0]
+
+def FindDL(key, s, LastMat):
+	for c in DLCache.get(key, []):
+		if all(s.banks[g]==b for g,b in c[0].items()) and all(getattr(LastMat,a)==v for a,v in c[1].items()):
+			return c
+	return None
+
+def SaveDL(key, s, reads, writes, entry):
+	#banks of the DLs it called and the verts, lights and textures it loaded
+	segs = {p[1]>>24 for p in entry[1]}|{(cmd>>24)&0xFF for MSB,cmd,n in entry[2] if MSB in (3,4,0xfd)}
+	banks = {g:s.banks[g] and list(s.banks[g]) for g in segs}
+	if len(DLCache)>0x4000:
+		DLCache.clear()
+	variants = DLCache.setdefault(key, [])
+	variants.append([banks, reads, writes, entry])
+	del variants[:-8]
+
+#material state a frame depends on and sets, after a DL it called read and set some
+def Depend(f, reads, writes):
+	for a,v in reads.items():
+		if a not in f[6] and a not in f[7]:
+			f[6][a] = v
+	f[7].update(writes)
 
 def DecodeVDL(rom, start, s, id, opt):
 	dl=[[]]
@@ -434,7 +595,6 @@ def DecodeVDL(rom, start, s, id, opt):
 	amb=[]
 	#neess ptr
 	diffuse=[]
-	x=0
 	ranges = [[0, 0, 0, 0, 0, 0]]
 	LastMat = Mat(Persist)
 	global gCycle
@@ -442,76 +602,216 @@ def DecodeVDL(rom, start, s, id, opt):
 	global gFog
 	gFog = 0
     
-	return DecodeDL(rom, s, id, dl, verts, textureptrs, amb, diffuse, ranges, x, [start], LastMat, 0, opt)
+	return DecodeDL(rom, s, id, dl, verts, textureptrs, amb, diffuse, ranges, [start], LastMat, opt)
 
-#recursively get DLs
-def DecodeDL(rom, s, id, dl, verts, textureptrs, amb, diffuse, ranges, x, start, LastMat, dlStack, opt):
-	global gFog
-    
-	while(True):
-		cmd = rom[start[dlStack][0] + x:start[dlStack][0]+x+8]
-		cmd = Bin2C(cmd, id)
-		#check if cmd is not needed and can be skipped
-		MSB = cmd[1][:8].uint
-		tile = cmd[1][32:40].uint
-		#separate case for set tile since its special
-		if opt==1:
-			if MSB==0xF5 and tile==7:
-				if hasattr(LastMat,str(MSB)+'7'):
-					attr = getattr(LastMat,str(MSB)+'7')
-					if attr == cmd[1][8:].uint:
-						x+=8
-						continue
-					else:
-						setattr(LastMat,str(MSB)+'7',cmd[1][8:].uint)
-			elif hasattr(LastMat,str(MSB)):
-				attr = getattr(LastMat,str(MSB))
-				if attr == cmd[1][8:].uint:
-					x+=8
-					continue
+#Decode the DL in start and every DL it calls. DLs are decoded depth first off a stack
+#of frames instead of recursing, a DL that calls one of the DLs it was called from is not
+#followed again since that would never end.
+def DecodeDL(rom, s, id, dl, verts, textureptrs, amb, diffuse, ranges, start, LastMat, opt):
+	global gCycle
+	#everything EvalMaterial was called with, for the cache entries
+	log = []
+	#[dl index, offset, cache key, log start, pages before, cacheable, mats read, mats set]
+	stack = []
+	active = set()
+	i = 0
+	try:
+		while(True):
+			#enter the DL at dl[i]
+			if i is not None:
+				key = (rom.name, *start[i], opt, gCycle)
+				c = FindDL(key, s, LastMat)
+				if c:
+					CacheStats[0] += 1
+					[dls, starts, events, gCycle, pages] = c[3]
+					dl[i] = list(dls[0])
+					dl.extend(list(l) for l in dls[1:])
+					start.extend(starts[1:])
+					Replay(events, s, ranges, textureptrs, diffuse, amb, verts)
+					log.extend(events)
+					LastMat.__dict__.update(c[2])
+					rom.Touch(pages)
+					if stack:
+						Depend(stack[-1], c[1], c[2])
 				else:
-					setattr(LastMat,str(MSB),cmd[1][8:].uint)
-		#g dl
-		if (MSB==6):
-			ptr = cmd[1][32:64].uint
-			x += 8
-			dl[dlStack].append(cmd[0])
-			dl.append([])
-			start.append([s.B2P(ptr), ptr])
-			(dl, verts, textureptrs, amb, diffuse, ranges, start, gFog) = DecodeDL(rom, s, id, dl, verts, textureptrs, amb, diffuse, ranges, 0, start, LastMat, len(dl)-1, opt)
-			if cmd[1][8:16].uint == 1:
+					CacheStats[1] += 1
+					stack.append([i, 0, key, len(log), rom.Track(), 1, {}, set()])
+					active.add(start[i][0])
+				i = None
+			if not stack:
 				break
-		#end dl
-		elif (MSB==0xb8):
-			dl[dlStack].append(cmd[0])
-			break
-		#check for fog to print error msg.
-		elif (MSB==0xb9) and 'G_RM_FOG_SHADE_A' in cmd[0]:
-			if not gFog:
-				gFog = 1
-			dl[dlStack].append(cmd[0])
-			x += 8
-		else:
-			x += 8
-			#concat 2 tri ones to a tri2
-			q = 1
-			if dl[dlStack]:
-				if dl[dlStack][-1].startswith('gsSP1Triangle') and cmd[0].startswith('gsSP1Triangle'):
-					old = dl[dlStack][-1][14:-1]
-					new = cmd[0][14:-1]
-					dl[dlStack][-1] = "gsSP2Triangles(" + old + ', ' + new + ')'
-					q = 0
-			if q:
-				dl[dlStack].append(cmd[0])
-		[ranges, textureptrs, diffuse, amb, verts] = EvalMaterial(MSB, ranges, cmd, textureptrs, diffuse, amb, verts, s, dl[dlStack])
-	ranges[-1][2] = len(dl[dlStack]) - 1
-	ranges[-1][4] = len(dl[dlStack]) - 1
+			f = stack[-1]
+			#branched to a DL that is done, so this one is too
+			if f[1] is not None:
+				[MSB, cmd, size] = DecodeRun(rom, s, dl[f[0]], start[f[0]][0] + f[1], LastMat, opt, f[6], f[7], log, ranges, textureptrs, diffuse, amb, verts)
+				f[1] += size
+				#g dl
+				if MSB==6:
+					ptr = cmd&0xFFFFFFFF
+					Rptr = s.B2P(ptr)
+					if Rptr in active:
+						#the DLs on the stack aren't finished, so none of them can be cached
+						for g in stack:
+							g[5] = 0
+					else:
+						dl.append([])
+						start.append([Rptr, ptr])
+						i = len(dl)-1
+					if (cmd>>48)&0xFF == 1:
+						f[1] = None
+					continue
+			#end dl
+			n = len(dl[f[0]])
+			EndDL(ranges, textureptrs, n)
+			log.append((None, 0, n))
+			stack.pop()
+			active.discard(start[f[0]][0])
+			pages = rom.Untrack(f[4])
+			writes = {a:getattr(LastMat,a) for a in f[7]}
+			if stack:
+				Depend(stack[-1], f[6], writes)
+			if f[5]:
+				SaveDL(f[2], s, f[6], writes, [[list(l) for l in dl[f[0]:]], start[f[0]:], log[f[3]:], gCycle, pages])
+	except:
+		#put the rom page tracking back how it was
+		while stack:
+			rom.Untrack(stack.pop()[4])
+		raise
+	dl = [[c.replace(IdMark, id) for c in l] for l in dl]
+	return (dl, verts, textureptrs, amb, diffuse, ranges, start, gFog)
+
+#ranges of a DL once it ends, n is its len
+def EndDL(ranges, textureptrs, n):
+	ranges[-1][2] = n - 1
+	ranges[-1][4] = n - 1
 	ranges[-1][1] = textureptrs[-1].copy()
 	ranges[-1][3] = 1
-	return (dl, verts, textureptrs, amb, diffuse, ranges, start, gFog)
 
-#based on the f3d cmd, add things to data objects
-def EvalMaterial(MSB, ranges, cmd, textureptrs, diffuse, amb, verts, s, dl):
+#do what decoding a cached DL did to the data arrays
+def Replay(events, s, ranges, textureptrs, diffuse, amb, verts):
+	global gFog
+	for MSB, cmd, n in events:
+		if MSB is None:
+			EndDL(ranges, textureptrs, n)
+		elif MSB<0:
+			gFog = 1
+		else:
+			EvalMaterial(MSB, ranges, cmd, textureptrs, diffuse, amb, verts, s, n)
+
+#opcodes EvalMaterial does something with, besides tris
+MatOps=np.array([0x03,0x04,0xb6,0xb7,0xbb]+list(range(0xf0,0x100)),dtype=np.uint8)
+
+#read the linear run of cmds at addr, up to and including the first DL or end DL cmd.
+#returns the raw cmds and the cmds as an array of 64 bit ints
+def ReadRun(rom, addr):
+	n=0x800
+	while(True):
+		raw=rom.view[addr:addr+n].tobytes()
+		cmds=np.frombuffer(raw,dtype='>u8',count=len(raw)>>3).astype(np.uint64)
+		ops=cmds>>56
+		end=np.flatnonzero((ops==6)|(ops==0xb8))
+		if end.size:
+			end=int(end[0])+1
+			rom.Read(addr,end*8)
+			return [raw[:end*8],cmds[:end]]
+		if len(raw)<n:
+			raise ValueError('DL at 0x%x runs past the end of the rom'%addr)
+		n*=4
+
+#format every row of fields with fmt in one go
+def Format(fmt, fields):
+	if not len(fields):
+		return []
+	return ((fmt+'\n')*len(fields) % tuple(fields.ravel().tolist())).split('\n')[:-1]
+
+#Decode the run of cmds at addr into dl. The run is read and sorted out as arrays, tris and
+#verts are formatted from their fields in bulk and only the other C macros and material changes
+#are done per cmd. Every EvalMaterial call goes into log, material state that was read before
+#this DL set it goes into reads and what it set into writes.
+#returns the opcode and the last cmd as an int, and the len of the run in bytes
+def DecodeRun(rom, s, dl, addr, LastMat, opt, reads, writes, log, ranges, textureptrs, diffuse, amb, verts):
+	global gFog
+	[raw,cmds] = ReadRun(rom, addr)
+	ops = (cmds>>56).astype(np.uint8)
+	keep = np.ones(len(cmds),dtype=bool)
+	#check if cmd is not needed and can be skipped, which is when
+	#it sets the same thing the last cmd like it did
+	if opt==1:
+		#separate case for set tile since its special
+		keys = ops.astype(np.uint16)
+		keys[(ops==0xF5)&(((cmds>>24)&0xFF)==7)] |= 0x100
+		for k in np.unique(keys).tolist():
+			attr = str(k&0xFF)+'7'*(k>>8)
+			if not hasattr(LastMat,attr):
+				continue
+			if attr not in writes and attr not in reads:
+				reads[attr] = getattr(LastMat,attr)
+			writes.add(attr)
+			i = np.flatnonzero(keys==k)
+			v = cmds[i]&0xFFFFFFFFFFFFFF
+			keep[i] = v!=np.concatenate((np.array([getattr(LastMat,attr)],dtype=np.uint64),v[:-1]))
+			setattr(LastMat,attr,int(v[-1]))
+	kept = np.flatnonzero(keep)
+	kcmds = cmds[kept]
+	kops = ops[kept]
+	#concat 2 tri ones to a tri2, every second tri in a row of them goes into the one before it
+	tri = kops==0xbf
+	vtx = kops==4
+	n = np.arange(len(kept))
+	first = np.maximum.accumulate(np.where(tri,-1,n))+1
+	row = n-first
+	if dl and dl[-1].startswith('gsSP1Triangle'):
+		row[first==0] += 1
+	merge = tri&(row&1==1)
+	#tris whose next tri goes into them
+	pair = np.append(merge[1:],False)
+	#len of the dl after each cmd
+	size = len(dl)+np.cumsum(~merge)
+	#only the first tri in a row can change the material state
+	ev = np.isin(kops,MatOps)|(tri&(n==first))
+	lines = np.empty(len(kept),dtype=object)
+	v = (kcmds[:,None]>>np.array([16,8,0],dtype=np.uint64))&0xFF
+	v //= 10
+	t = np.flatnonzero(tri&~merge&~pair)
+	lines[t] = Format('gsSP1Triangle(%d, %d, %d, 0)', v[t])
+	t = np.flatnonzero(tri&pair)
+	lines[t] = Format('gsSP2Triangles(%d, %d, %d, 0, %d, %d, %d, 0)', np.hstack((v[t],v[t+1])))
+	#the first tri goes into the last one of the run before
+	if len(merge) and merge[0]:
+		dl[-1] = "gsSP2Triangles(" + dl[-1][14:-1] + ', %d, %d, %d, 0)' % tuple(v[0].tolist())
+	t = np.flatnonzero(vtx)
+	p = kcmds[t]
+	lines[t] = Format('gsSPVertex(VB_'+IdMark+'%#x, %d, %d)', np.stack((p&0xFFFFFFFF,((p>>52)&0xF)+1,(p>>48)&0xF),1))
+	#the rest are decoded one at a time, skipped setothermode_h cmds still set the cycle type
+	pos = np.cumsum(keep)-1
+	for i in np.flatnonzero((keep&(ops!=0xbf)&(ops!=4))|(ops==0xba)).tolist():
+		cmd = Decode(raw[i*8:i*8+8])
+		if not keep[i]:
+			continue
+		lines[pos[i]] = cmd[0]
+		#check for fog to print error msg.
+		if ops[i]==0xb9 and 'G_RM_FOG_SHADE_A' in cmd[0]:
+			gFog = 1
+			log.append((-1, 0, 0))
+	dl.extend(lines[~merge].tolist())
+	e = np.flatnonzero(ev)
+	log.extend(zip(kops[e].tolist(), kcmds[e].tolist(), size[e].tolist()))
+	#verts only need the len of the dl at the last one before each material change
+	last = np.maximum.accumulate(np.where(vtx,size-1,-1))
+	at = -1
+	e = np.flatnonzero(ev&~vtx)
+	for MSB, cmd, k, l in zip(kops[e].tolist(), kcmds[e].tolist(), size[e].tolist(), last[e].tolist()):
+		if l!=at:
+			ranges[-1][5] = at = l
+		EvalMaterial(MSB, ranges, cmd, textureptrs, diffuse, amb, verts, s, k)
+	if len(last) and last[-1]!=at:
+		ranges[-1][5] = int(last[-1])
+	p = (p&0xFFFFFFFF).tolist()
+	verts.extend(zip(p, map(s.B2P,p), (((kcmds[t]>>52)&0xF)+1).tolist()))
+	return [int(kops[-1]), int(kcmds[-1]), len(raw)]
+
+#based on the f3d cmd, add things to data objects, n is the len of the dl with the cmd in it
+def EvalMaterial(MSB, ranges, cmd, textureptrs, diffuse, amb, verts, s, n):
 	types = {
 	0:'RGBA',
 	2:'CI',
@@ -520,11 +820,11 @@ def EvalMaterial(MSB, ranges, cmd, textureptrs, diffuse, amb, verts, s, dl):
 	}
 	#adding stuff to data arrays
 	if (MSB==0x4):
-		ranges[-1][5]=len(dl)-1
-		ptr=cmd[1][32:64]
-		length=cmd[1][8:12]
-		Rptr=s.B2P(ptr.uint)
-		verts.append((ptr.uint,Rptr,length.uint+1))
+		ranges[-1][5]=n-1
+		ptr=cmd&0xFFFFFFFF
+		length=(cmd>>52)&0xF
+		Rptr=s.B2P(ptr)
+		verts.append((ptr,Rptr,length+1))
 	#if a triangle is drawn and there is a texture, assume a new one is loaded next
 	elif(MSB==0xBF):
 		ranges[-1][3]=1
@@ -547,41 +847,41 @@ def EvalMaterial(MSB, ranges, cmd, textureptrs, diffuse, amb, verts, s, dl):
 			ranges[-1][1] = textureptrs[-1].copy()
 			#I subtract 1 because len goes ones over the index, and then I subtract another one because I already appended
 			#the mat cmd to the dl.
-			ranges[-1][2] = len(dl)-2
+			ranges[-1][2] = n-2
 			if ranges[-1][5]==0:
-				ranges.append([len(dl)-1,0,0,0,ranges[-1][4],0])
+				ranges.append([n-1,0,0,0,ranges[-1][4],0])
 			else:
-				ranges.append([len(dl)-1,0,0,0,ranges[-1][5],0])
+				ranges.append([n-1,0,0,0,ranges[-1][5],0])
 	#textureptrs = raw ptr, bank ptr, length, width, height, imgtype, bitdepth, palette, tile
 	#implementing a very naive alg because I'm lazy and no one hand writes stuff
 	#so I will just assume it follows nice structure, if you want to make it better then PR
 	#set tile
 	if(MSB==0xf5):
-		tile = cmd[1][32:40].uint
+		tile = (cmd>>24)&0xFF
 		if tile!=7:
-			type=cmd[1][8:11].uint
+			type=(cmd>>53)&7
 			textureptrs[-1][5]=types[type]
-			bpp=4*2**(cmd[1][11:13].uint)
+			bpp=4*2**((cmd>>51)&3)
 			textureptrs[-1][6]=bpp
 			textureptrs[-1][8]=tile
 	#tlut
 	elif(MSB==0xf0):
-		tile = cmd[1][32:40].uint
+		tile = (cmd>>24)&0xFF
 		if textureptrs[-1][8]==tile:
 			textureptrs[-1][7]=textureptrs[-1][:2]
 	#set tile size
 	elif(MSB==0xf2):
 		f2 = (lambda x: (x>>2)+1)
-		textureptrs[-1][3] = f2(cmd[1][40:52].uint)
-		textureptrs[-1][4] = f2(cmd[1][52:64].uint)
+		textureptrs[-1][3] = f2((cmd>>12)&0xFFF)
+		textureptrs[-1][4] = f2(cmd&0xFFF)
 	#load tex
 	elif(MSB==0xfd):
-		ptr=cmd[1][32:64]
-		type=cmd[1][8:11].uint
-		bpp=4*2**(cmd[1][11:13].uint)
+		ptr=cmd&0xFFFFFFFF
+		type=(cmd>>53)&7
+		bpp=4*2**((cmd>>51)&3)
 		try:
-			textureptrs[-1][0]=s.B2P(ptr.uint)
-			textureptrs[-1][1]=ptr.uint
+			textureptrs[-1][0]=s.B2P(ptr)
+			textureptrs[-1][1]=ptr
 			textureptrs[-1][2]=bpp
 			textureptrs[-1][5]=types[type]
 			textureptrs[-1][6]=bpp
@@ -592,17 +892,17 @@ def EvalMaterial(MSB, ranges, cmd, textureptrs, diffuse, amb, verts, s, dl):
 	#load block
 	elif (MSB==0xf3):
 		if textureptrs:
-			texels=cmd[1][40:52]
+			texels=(cmd>>12)&0xFFF
 			bpp=textureptrs[-1][2]
-			textureptrs[-1][2]=((texels.uint+1)*bpp)//16
+			textureptrs[-1][2]=((texels+1)*bpp)//16
 	elif (MSB==3):
-		ptr=cmd[1][32:64]
-		if cmd[1][8:16].uint==0x88:
+		ptr=cmd&0xFFFFFFFF
+		if (cmd>>48)&0xFF==0x88:
 			#ambient
-			amb.append([s.B2P(ptr.uint),ptr.uint])
+			amb.append([s.B2P(ptr),ptr])
 		else:
 			#diffuse
-			diffuse.append([s.B2P(ptr.uint),ptr.uint])
+			diffuse.append([s.B2P(ptr),ptr])
 	return [ranges,textureptrs,diffuse,amb,verts]
 
 #take argument bits and make tuple of args
@@ -611,19 +911,19 @@ def G_SNOOP_Decode(bin,id):
 	return ()
 
 def G_VTX_Decode(bin,id):
-	num,start,len,segment=bin.unpack('uint:4,uint:4,uint:16,uint:32')
+	num,start,len,segment=bin
 	return ('VB_%s'%(id+hex(segment)),num+1,start)
 
 def G_TRI1_Decode(bin,id):
-	pad,v1,v2,v3=bin.unpack('int:32,3*uint:8')
+	pad,v1,v2,v3=bin
 	return (int(v1/10),int(v2/10),int(v3/10),0)
 
 def G_TEXTURE_Decode(bin,id):
-	pad,mip,tile,state,Sscale,Tscale=bin.unpack('int:10,2*uint:3,uint:8,2*uint:16')
+	pad,mip,tile,state,Sscale,Tscale=bin
 	return (Sscale,Tscale,mip,tile,state)
 
 def G_POPMTX_Decode(bin,id):
-	pad,num=bin.unpack('int:24,uint:32')
+	pad,num=bin
 	return (int(num/64),)
 
 GeoMacros={
@@ -648,25 +948,25 @@ def CheckGeoMacro(set):
 	return str[:-1]
 
 def G_CLEARGEOMETRYMODE_Decode(bin,id):
-	pad,set=bin.unpack('uint:24,uint:32')
+	pad,set=bin
 	if set==0:
 		return (0,0)
 	set=CheckGeoMacro(set)
 	return (set,0)
 
 def G_SETGEOMETRYMODE_Decode(bin,id):
-	pad,set=bin.unpack('uint:24,uint:32')
+	pad,set=bin
 	if set==0:
 		return (0,0)
 	set=CheckGeoMacro(set)
 	return (0,set)
 
 def G_MTX_Decode(bin,id):
-	pad,param,seg=bin.unpack('int:16,uint:8,uint:32')
+	pad,param,seg=bin
 	return (param,seg)
 
 def G_MOVEWORD_Decode(bin,id):
-	offset,index,value=bin.unpack('uint:16,uint:8,uint:32')
+	offset,index,value=bin
 	indices={0:'G_MW_MATRIX',
 	2:'G_MW_NUMLIGHT',
 	4:'G_MW_CLIP',
@@ -682,7 +982,7 @@ def G_MOVEWORD_Decode(bin,id):
 	return (index,offset,value)
 
 def G_MOVEMEM_Decode(bin,id):
-	index,size,seg=bin.unpack('uint:8,uint:16,uint:32')
+	index,size,seg=bin
 	fuckgbi=1
 	if index==0x88:
 		fuckgbi=2
@@ -693,18 +993,18 @@ def G_LOAD_UCODE_Decode(bin,id):
 	return (data,size,text)
 	
 def G_DL_Decode(bin,id):
-	store,pad,seg=bin.unpack('uint:8,int:16,uint:32')
+	store,pad,seg=bin
 	return ('DL_'+id+hex(seg),)
 
 def G_ENDDL_Decode(bin,id):
 	return ()
 
 def G_RDPHALF_1_Decode(bin,id):
-	pad,bits=bin.unpack('int:24,uint:32')
+	pad,bits=bin
 	return (bits,)
 
 def G_SETOTHERMODE_L_Decode(bin,id):
-	pad,shift,bits,value=bin.unpack('3*uint:8,uint:32')
+	pad,shift,bits,value=bin
 	enums={
 		0:'gsDPSetAlphaCompare',
 		2:'gsDPSetDepthSource',
@@ -728,7 +1028,7 @@ def G_SETOTHERMODE_L_Decode(bin,id):
 	return (0xb9,shift,bits,value)
 
 def G_SETOTHERMODE_H_Decode(bin,id):
-	pad,shift,bits,value=bin.unpack('3*uint:8,uint:32')
+	pad,shift,bits,value=bin
 	enums={
 		4:'gsDPSetAlphaDither',
 		6:'gsDPSetColorDither',
@@ -812,23 +1112,23 @@ def G_SETOTHERMODE_H_Decode(bin,id):
 	return (0xba,shift,bits,value)
 
 def G_TEXRECT_Decode(bin,id):
-	Xstart,Ystart,pad,tile,Xend,Yend,pad1,Sstart,Tstart,pad2,dsdx,dtdy=bin.unpack('2*uint:12,2*int:4,2*uint:12,uint:32,2*uint:16,uint:32,2*uint:16')
+	Xstart,Ystart,pad,tile,Xend,Yend,pad1,Sstart,Tstart,pad2,dsdx,dtdy=bin
 	return (Xstart,Ystart,tile,Xend,Yend,Sstart,Tstart,dsdx,dtdy)
 
 def G_SETKEYGB_Decode(bin,id):
-	Gwidth,Bwidth,Gint,Grecip,Bint,Brecip=bin.unpack('2*uint:12,4*uint:8')
+	Gwidth,Bwidth,Gint,Grecip,Bint,Brecip=bin
 	return (Gwidth,Bwidth,Gint,Grecip,Bint,Brecip)
 
 def G_SETKEYR_Decode(bin,id):
-	pad,Rwidth,Rint,Rrecip=bin.unpack('int:28,uint:12,2*uint:8')
+	pad,Rwidth,Rint,Rrecip=bin
 	return (Rwidth,Rint,Rrecip)
 
 def G_SETCONVERT_Decode(bin,id):
-	p,k0,k1,k2,k3,k4,k5=bin.unpack('int:2,6*int:9')
+	p,k0,k1,k2,k3,k4,k5=bin
 	return (k0,k1,k2,k3,k4,k5)
 	
 def G_SETSCISSOR_Decode(bin,id):
-	Xstart,Ystart,pad,mode,Xend,Yend=bin.unpack('2*uint:12,2*uint:4,2*uint:12')
+	Xstart,Ystart,pad,mode,Xend,Yend=bin
 	try:
 		modes={0:'G_SC_NON_INTERLACE',
 		2:'G_SC_EVEN_INTERLACE',
@@ -839,52 +1139,52 @@ def G_SETSCISSOR_Decode(bin,id):
 	return (Xstart,Ystart,mode,Xend,Yend)
 
 def G_SETPRIMDEPTH_Decode(bin,id):
-	pad,zval,depth=bin.unpack('int:24,2*uint:16')
+	pad,zval,depth=bin
 	return (zval,depth)
 
 def G_RDPSETOTHERMODE_Decode(bin,id):
-	hi,lo=bin.unpack('uint:24,uint:32')
+	hi,lo=bin
 	return (hi,lo)
 
 def G_LOADTLUT_Decode(bin,id):
-	pad,tile,color,pad1=bin.unpack('int:28,uint:4,2*uint:12')
+	pad,tile,color,pad1=bin
 	return (tile,(((color>>2)&0x3ff)+1))
 	
 def G_RDPHALF_2_Decode(bin,id):
-	pad,bits=bin.unpack('int:24,uint:32')
+	pad,bits=bin
 	return (bits,)
 	
 def G_SETTILESIZE_Decode(bin,id):
-	Sstart,Tstart,pad,tile,width,height=bin.unpack('2*uint:12,2*uint:4,2*uint:12')
+	Sstart,Tstart,pad,tile,width,height=bin
 	return (tile,Sstart,Tstart,width,height)
 
 def G_LOADBLOCK_Decode(bin,id):
-	Sstart,Tstart,pad,tile,texels,dxt=bin.unpack('2*uint:12,2*uint:4,2*uint:12')
+	Sstart,Tstart,pad,tile,texels,dxt=bin
 	return (tile,Sstart,Tstart,texels,dxt)
 
 def G_LOADTILE_Decode(bin,id):
-	Sstart,Tstart,pad,tile,Send,Tend=bin.unpack('2*uint:12,2*uint:4,2*uint:12')
+	Sstart,Tstart,pad,tile,Send,Tend=bin
 	return (tile,Sstart,Tstart,Send,Tend)
 
 def G_SETTILE_Decode(bin,id):
-	fmt,bitsize,pad,numrows,offset,pad1,tile,palette,Tflag,Tmask,Tshift,Sflag,Smask,Sshift=bin.unpack('uint:3,uint:2,int:1,2*uint:9,int:5,uint:3,uint:4,uint:2,2*uint:4,uint:2,2*uint:4')
+	fmt,bitsize,pad,numrows,offset,pad1,tile,palette,Tflag,Tmask,Tshift,Sflag,Smask,Sshift=bin
 	return (fmt,bitsize,numrows,offset,tile,palette,Tflag,Tmask,Tshift,Sflag,Smask,Sshift)
 
 def G_FILLRECT_Decode(bin,id):
-	Xstart,Ystart,pad,Xend,Yend=bin.unpack('2*uint:12,uint:8,2*uint:12')
+	Xstart,Ystart,pad,Xend,Yend=bin
 	return (Xstart,Ystart,Xend,Yend)
 
 #fog,env,blend,fill
 def G_COLOR_Decode(bin,id):
-	pad,r,g,b,a=bin.unpack('int:24,4*uint:8')
+	pad,r,g,b,a=bin
 	return (r,g,b,a)
 
 def G_SETPRIMCOLOR_Decode(bin,id):
-	pad,min,fraction,r,g,b,a=bin.unpack('7*uint:8')
+	pad,min,fraction,r,g,b,a=bin
 	return (min/256,fraction/256,r,g,b,a)
 
 def G_SETCOMBINE_Decode(bin,id):
-	a,b,c,d,e,f,g,h,i,j,k,l,m,n,o,p=bin.unpack('uint:4,uint:5,2*uint:3,uint:4,uint:5,2*uint:4,8*uint:3')
+	a,b,c,d,e,f,g,h,i,j,k,l,m,n,o,p=bin
 	Basic={
 	1:'TEXEL0',
 	2:'TEXEL1',
@@ -999,67 +1299,70 @@ def G_SETCOMBINE_Decode(bin,id):
 	return (a,g,b,k,c,l,d,m,e,h,f,n,i,o,j,p)
 
 def G_SETTIMG_Decode(bin,id):
-	fmt,bit,pad,seg=bin.unpack('uint:3,uint:2,uint:19,uint:32')
+	fmt,bit,pad,seg=bin
 	return (fmt,bit,1,'{}_texture_{:08X}'.format(id,seg))
 
 def G_SETZIMG_Decode(bin,id):
-	pad,addr=bin.unpack('int:24,uint:32')
+	pad,addr=bin
 	return (addr,)
 
 def G_SETCIMG_Decode(bin,id):
-	fmt,bit,pad,width,addr=bin.unpack('uint:3,uint:2,int:7,uint:12,uint:32')
+	fmt,bit,pad,width,addr=bin
 	return (fmt,bit,width,addr)
 
 
 Persist={
-0xef:('G_RDPSETOTHERMODE',G_RDPSETOTHERMODE_Decode),
-0xb9:('gsSPSetOtherMode',G_SETOTHERMODE_L_Decode),
-0xba:('gsSPSetOtherMode',G_SETOTHERMODE_H_Decode),
-0xbc:('gsMoveWd',G_MOVEWORD_Decode),
-0x03:('gsSPLight',G_MOVEMEM_Decode),
-0xb6:('gsSPGeometryMode',G_CLEARGEOMETRYMODE_Decode),
-0xb7:('gsSPGeometryMode',G_SETGEOMETRYMODE_Decode),
-0xbb:('gsSPTexture',G_TEXTURE_Decode),
-0xf7:('gsDPSetFillColor',G_COLOR_Decode),
-0xf8:('gsDPSetFogColor',G_COLOR_Decode),
-0xf9:('gsDPSetBlendColor',G_COLOR_Decode),
-0xfa:('gsDPSetPrimColor',G_SETPRIMCOLOR_Decode),
-0xfb:('gsDPSetEnvColor',G_COLOR_Decode),
-0xfc:('gsDPSetCombineLERP',G_SETCOMBINE_Decode),
-0xfe:('gsDPSetDepthImage',G_SETZIMG_Decode),
-
-0xff:('gsDPSetColorImage',G_SETCIMG_Decode)
+0xef:('G_RDPSETOTHERMODE',G_RDPSETOTHERMODE_Decode,'uint:24,uint:32'),
+0xb9:('gsSPSetOtherMode',G_SETOTHERMODE_L_Decode,'3*uint:8,uint:32'),
+0xba:('gsSPSetOtherMode',G_SETOTHERMODE_H_Decode,'3*uint:8,uint:32'),
+0xbc:('gsMoveWd',G_MOVEWORD_Decode,'uint:16,uint:8,uint:32'),
+0x03:('gsSPLight',G_MOVEMEM_Decode,'uint:8,uint:16,uint:32'),
+0xb6:('gsSPGeometryMode',G_CLEARGEOMETRYMODE_Decode,'uint:24,uint:32'),
+0xb7:('gsSPGeometryMode',G_SETGEOMETRYMODE_Decode,'uint:24,uint:32'),
+0xbb:('gsSPTexture',G_TEXTURE_Decode,'int:10,2*uint:3,uint:8,2*uint:16'),
+0xf7:('gsDPSetFillColor',G_COLOR_Decode,'int:24,4*uint:8'),
+0xf8:('gsDPSetFogColor',G_COLOR_Decode,'int:24,4*uint:8'),
+0xf9:('gsDPSetBlendColor',G_COLOR_Decode,'int:24,4*uint:8'),
+0xfa:('gsDPSetPrimColor',G_SETPRIMCOLOR_Decode,'7*uint:8'),
+0xfb:('gsDPSetEnvColor',G_COLOR_Decode,'int:24,4*uint:8'),
+0xfc:('gsDPSetCombineLERP',G_SETCOMBINE_Decode,'uint:4,uint:5,2*uint:3,uint:4,uint:5,2*uint:4,8*uint:3'),
+0xfe:('gsDPSetDepthImage',G_SETZIMG_Decode,'int:24,uint:32'),
+
+0xff:('gsDPSetColorImage',G_SETCIMG_Decode,'uint:3,uint:2,int:7,uint:12,uint:32')
 }
 NonPersist={
-0xf5:('gsDPSetTile',G_SETTILE_Decode),
-0xf2:('gsDPSetTileSize',G_SETTILESIZE_Decode),
-0x04:('gsSPVertex',G_VTX_Decode),
-0xbf:('gsSP1Triangle',G_TRI1_Decode),
-0xbd:('gsSPPopMatrix',G_POPMTX_Decode),
-0x01:('gsSPMatrix',G_MTX_Decode),
-0x06:('gsSPBranchList',G_DL_Decode),
-0xb8:('gsSPEndDisplayList',G_ENDDL_Decode),
-0xb4:('G_RDPHALF_1',G_RDPHALF_1_Decode),
-0xe4:('G_TEXRECT',G_TEXRECT_Decode),
-0xe5:('G_TEXRECTFLIP',G_TEXRECT_Decode),
-0xe6:('gsDPLoadSync',G_SNOOP_Decode),
-0xe7:('gsDPPipeSync',G_SNOOP_Decode),
-0xe8:('gsDPTileSync',G_SNOOP_Decode),
-0xe9:('gsDPFullSync',G_SNOOP_Decode),
-0xea:('G_SETKEYGB',G_SETKEYGB_Decode),
-0xeb:('G_SETKEYR',G_SETKEYR_Decode),
-0xec:('G_SETCONVERT',G_SETCONVERT_Decode),
-0xed:('G_SETSCISSOR',G_SETSCISSOR_Decode),
-0xee:('gsDPSetPrimDepth',G_SETPRIMDEPTH_Decode),
-0xf0:('gsDPLoadTLUTCmd',G_LOADTLUT_Decode),
-0xb3:('G_RDPHALF_2',G_RDPHALF_2_Decode),
-0xf3:('gsDPLoadBlock',G_LOADBLOCK_Decode),
-0xf4:('gsDPLoadTile',G_LOADTILE_Decode),
-0xf6:('G_FILLRECT',G_FILLRECT_Decode),
-0xfd:('gsDPSetTextureImage',G_SETTIMG_Decode),
+0xf5:('gsDPSetTile',G_SETTILE_Decode,'uint:3,uint:2,int:1,2*uint:9,int:5,uint:3,uint:4,uint:2,2*uint:4,uint:2,2*uint:4'),
+0xf2:('gsDPSetTileSize',G_SETTILESIZE_Decode,'2*uint:12,2*uint:4,2*uint:12'),
+0x04:('gsSPVertex',G_VTX_Decode,'uint:4,uint:4,uint:16,uint:32'),
+0xbf:('gsSP1Triangle',G_TRI1_Decode,'int:32,3*uint:8'),
+0xbd:('gsSPPopMatrix',G_POPMTX_Decode,'int:24,uint:32'),
+0x01:('gsSPMatrix',G_MTX_Decode,'int:16,uint:8,uint:32'),
+0x06:('gsSPBranchList',G_DL_Decode,'uint:8,int:16,uint:32'),
+0xb8:('gsSPEndDisplayList',G_ENDDL_Decode,''),
+0xb4:('G_RDPHALF_1',G_RDPHALF_1_Decode,'int:24,uint:32'),
+0xe4:('G_TEXRECT',G_TEXRECT_Decode,'2*uint:12,2*int:4,2*uint:12,uint:32,2*uint:16,uint:32,2*uint:16'),
+0xe5:('G_TEXRECTFLIP',G_TEXRECT_Decode,'2*uint:12,2*int:4,2*uint:12,uint:32,2*uint:16,uint:32,2*uint:16'),
+0xe6:('gsDPLoadSync',G_SNOOP_Decode,''),
+0xe7:('gsDPPipeSync',G_SNOOP_Decode,''),
+0xe8:('gsDPTileSync',G_SNOOP_Decode,''),
+0xe9:('gsDPFullSync',G_SNOOP_Decode,''),
+0xea:('G_SETKEYGB',G_SETKEYGB_Decode,'2*uint:12,4*uint:8'),
+0xeb:('G_SETKEYR',G_SETKEYR_Decode,'int:28,uint:12,2*uint:8'),
+0xec:('G_SETCONVERT',G_SETCONVERT_Decode,'int:2,6*int:9'),
+0xed:('G_SETSCISSOR',G_SETSCISSOR_Decode,'2*uint:12,2*uint:4,2*uint:12'),
+0xee:('gsDPSetPrimDepth',G_SETPRIMDEPTH_Decode,'int:24,2*uint:16'),
+0xf0:('gsDPLoadTLUTCmd',G_LOADTLUT_Decode,'int:28,uint:4,2*uint:12'),
+0xb3:('G_RDPHALF_2',G_RDPHALF_2_Decode,'int:24,uint:32'),
+0xf3:('gsDPLoadBlock',G_LOADBLOCK_Decode,'2*uint:12,2*uint:4,2*uint:12'),
+0xf4:('gsDPLoadTile',G_LOADTILE_Decode,'2*uint:12,2*uint:4,2*uint:12'),
+0xf6:('G_FILLRECT',G_FILLRECT_Decode,'2*uint:12,uint:8,2*uint:12'),
+0xfd:('gsDPSetTextureImage',G_SETTIMG_Decode,'uint:3,uint:2,uint:19,uint:32'),
 }
 Useless={
-0x0:('gsDPNoOp',G_SNOOP_Decode),
-0xc0:('gsDPNoOp',G_SNOOP_Decode)
+0x0:('gsDPNoOp',G_SNOOP_Decode,''),
+0xc0:('gsDPNoOp',G_SNOOP_Decode,'')
 }
-DecodeFmt={**Persist,**NonPersist,**Useless}
\ No newline at end of file
+DecodeFmt={**Persist,**NonPersist,**Useless}
+
+#opcode -> (macro, decoder, field extractor)
+DecodeTable={k:(v[0],v[1],CompileFmt(v[2])) for k,v in DecodeFmt.items()}
\ No newline at end of file
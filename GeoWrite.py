@@ -1,75 +1,141 @@
 import struct
+import Output
 
-def B2I(bytes):
-    return int(bytes.hex(),16)
-
-#X will be bytes object
-#cmd,length,(optionals):action,var,'ext'
+#Geo layout commands decoded with struct into records, the C macros are only made when a
+#layout is written. op:[fields, length, pointer, text]
+#fields is a big endian struct format over the command, all unsigned. length is
+#[bytes, extra bytes with a DL (x[1]>>4==8) or 'flag' (x[1]!=0)]. pointer is
+#[kind, offset of the u32], kind PUSH/POP follow the layout, CVASM is a function
+#that gets a label, STOREDL a DL to export and DL one that is only named.
+#text gets the fields, the id and the GeoCmd for its pointer and rom address.
+DLArg = (lambda f,y,c: ","+'DL_'+y+hex(c.ptr) if f[0]>>4==8 else "")
 Cmds={
-    0:(lambda x,y,s:['GEO_BRANCH_AND_LINK(%s)'%('Geo_'+y+hex(B2I(x[4:8]))),8,'PUSH',x[4:8],'ext']),
-    1:(lambda x,y,s:['GEO_END()',4]),
-    2:(lambda x,y,s:['GEO_BRANCH(%d, %s)'%(x[1],'Geo_'+y+hex(s.B2P(B2I(x[4:8])))),8,'PUSH',x[4:8],'ext']),
-    3:(lambda x,y,s:['GEO_RETURN()',4,'POP',0,'ext']),
-    4:(lambda x,y,s:['GEO_OPEN_NODE()',4]),
-    5:(lambda x,y,s:['GEO_CLOSE_NODE()',4]),
-    6:(lambda x,y,s:['GEO_ASSIGN_AS_VIEW(%d)'%((B2I(x[2:4]))),4]),
-    7:(lambda x,y,s:['GEO_UPDATE_NODE_FLAGS(%d, %d)'%(x[1],(B2I(x[2:4]))),4]),
-    8:(lambda x,y,s:['GEO_NODE_SCREEN_AREA(%d, %d, %d, %d, %d)'%(x[3],(B2I(x[4:6])),(B2I(x[6:8])),(B2I(x[8:10])),(B2I(x[10:12]))),12]),
-    9:(lambda x,y,s:['GEO_NODE_ORTHO(%d)'%((B2I(x[2:4]))),4]),
-    10:(lambda x,y,s:['GEO_CAMERA_FRUSTUM{}({}, {}, {}{}{})'
-    .format("_WITH_FUNC" if x[1] else "",
-    (B2I(x[2:4])),(B2I(x[4:6])),(B2I(x[6:8])),
-    "," if x[1] else "",
-    (B2I(x[8:12])) if x[1] else ""),
-    (8+min(x[1]*4,4)),'CVASM',x[8:12],'ext']),
-    11:(lambda x,y,s:['GEO_NODE_START()',4]),
-    12:(lambda x,y,s:['GEO_ZBUFFER(%d)' %(x[1]),4]),
-    13:(lambda x,y,s:['GEO_RENDER_RANGE(%d, %d)'%((B2I(x[4:6])),(B2I(x[6:8]))),8]),
-    14:(lambda x,y,s:['GEO_SWITCH_CASE(%d, %d)'%(x[3],(B2I(x[4:8]))),8,'CVASM',x[4:8],'ext']),
-    15:(lambda x,y,s:['GEO_CAMERA(%d, %d, %d, %d, %d, %d, %d, %d)'%((B2I(x[2:4])),(B2I(x[4:6])),(B2I(x[6:8])),
-    (B2I(x[8:10])),(B2I(x[10:12])),(B2I(x[12:14])),
-    (B2I(x[14:16])),(B2I(x[16:20]))),20,'CVASM',x[16:20],'ext']),
-    16:(lambda x,y,s:['GEO_TRANSLATE_ROTATE{}({}, {}, {},{}, {}, {}, {}{}{})'.format("_WITH_DL" if x[1]>>4==8 else "",(B2I(x[2:4])),(B2I(x[4:6])),(B2I(x[6:8])),(B2I(x[8:10])),(B2I(x[10:12])),(B2I(x[12:14])),(B2I(x[14:16])),"," if x[1]>>4==8 else "",'DL_'+y+hex(B2I(x[8:12])) if x[1]>>4==8 else ""),16+min(4,(x[1]>>4==8)*4)]),
-    17:(lambda x,y,s:['GEO_TRANSLATE_NODE{}({}, {}, {}, {}{}{})'.format("_WITH_DL" if x[1]>>4==8 else "",
-    x[1]&0xF,(B2I(x[2:4])),(B2I(x[4:6])),(B2I(x[6:8])),
-    "," if x[1]>>4==8 else "",'DL_'+y+hex(B2I(x[8:12])) if x[1]>>4==8 else ""),
-    8+min(4,(x[1]>>4==8)*4)]),
-    18:(lambda x,y,s:['GEO_ROTATION_NODE{}({}, {}, {}, {}{}{})'.format("_WITH_DL" if x[1]>>4==8 else "",
-    x[1]&0xF,(B2I(x[2:4])),(B2I(x[4:6])),(B2I(x[6:8])),
-    "," if x[1]>>4==8 else "",'DL_'+y+hex(B2I(x[8:12])) if x[1]>>4==8 else ""),
-    8+min(4,(x[1]>>4==8)*4)]),
-    19:(lambda x,y,s:['GEO_ANIMATED_PART(%d, %d, %d, %d, %s)'%(x[1],(B2I(x[2:4])),(B2I(x[4:6])),(B2I(x[6:8])),'DL_'+y+hex(B2I(x[8:12])) if B2I(x[8:12])>0 else '0'),12,'STOREDL',x[8:12],'ext']),
-    20:(lambda x,y,s:['GEO_BILLBOARD_WITH_PARAMS{}({}, {}, {}, {}{}{})'.format("_AND_DL" if x[1]>>4==8 else "",
-    x[1]&0xF,(B2I(x[2:4])),(B2I(x[4:6])),(B2I(x[6:8])),
-    "," if x[1]>>4==8 else "",'DL_'+y+hex(B2I(x[8:12])) if x[1]>>4==8 else ""),
-    8+min(4,(x[1]>>4==8)*4)]),
-    21:(lambda x,y,s:['GEO_DISPLAY_LIST(%d, %s)'%(x[1],'DL_'+y+hex(B2I(x[4:8])) if B2I(x[4:8])>0 else '0'),8,'STOREDL',x[4:8],'ext']),
-    22:(lambda x,y,s:['GEO_SHADOW(%d, %d, %d)'%(x[3],x[5],
-    (B2I(x[6:8]))),8]),
-    23:(lambda x,y,s:['GEO_RENDER_OBJ()',4]),
-    24:(lambda x,y,s:['GEO_ASM(%d, %d)' % ((B2I(x[2:4])),(B2I(x[4:8]))),8,'CVASM',x[4:8],'ext']),
-    25:(lambda x,y,s:['GEO_BACKGROUND{}({}{}{})'.format("_COLOR" if not (B2I(x[4:8])) else "",(B2I(x[2:4])),"," if (B2I(x[4:8])) else "",
-    (B2I(x[4:8])) if (B2I(x[4:8])) else ""),8,'CVASM',x[4:8],'ext']),
-    26:(lambda x,y,s:['GEO_NOP_1A()',8]),
-    0x1D:(lambda x,y,s:['GEO_SCALE{}({}, {}{}{})'.format("_WITH_DL" if x[1]>>4==8 else "",
-    x[1]&0xF,(B2I(x[4:8])),
-    "," if x[1]>>4==8 else "",(B2I(x[8:12])) if x[1]>>4==8 else ""),
-    8+min(4,(x[1]>>4==8)*4)]),
-    28:(lambda x,y,s:['GEO_HELD_OBJECT(%d, %d, %d, %d, %d)'
-    %(x[1],(B2I(x[2:4])),(B2I(x[4:6])),(B2I(x[6:8])),(B2I(x[8:12]))),12]),
-    30:(lambda x,y,s:['GEO_NOP_1E()',8]),
-    31:(lambda x,y,s:['GEO_NOP_1F()',16]),
-    32:(lambda x,y,s:['GEO_CULLING_RADIUS(%d)'%(B2I(x[2:4])),4])
+    0:['>4xL',[8,0],['PUSH',4],(lambda f,y,c:'GEO_BRANCH_AND_LINK(%s)'%('Geo_'+y+hex(f[0])))],
+    1:['',[4,0],None,(lambda f,y,c:'GEO_END()')],
+    2:['>xB2xL',[8,0],['PUSH',4],(lambda f,y,c:'GEO_BRANCH(%d, %s)'%(f[0],'Geo_'+y+hex(c.addr)))],
+    3:['',[4,0],['POP',0],(lambda f,y,c:'GEO_RETURN()')],
+    4:['',[4,0],None,(lambda f,y,c:'GEO_OPEN_NODE()')],
+    5:['',[4,0],None,(lambda f,y,c:'GEO_CLOSE_NODE()')],
+    6:['>2xH',[4,0],None,(lambda f,y,c:'GEO_ASSIGN_AS_VIEW(%d)'%f)],
+    7:['>xBH',[4,0],None,(lambda f,y,c:'GEO_UPDATE_NODE_FLAGS(%d, %d)'%f)],
+    8:['>3xB4H',[12,0],None,(lambda f,y,c:'GEO_NODE_SCREEN_AREA(%d, %d, %d, %d, %d)'%f)],
+    9:['>2xH',[4,0],None,(lambda f,y,c:'GEO_NODE_ORTHO(%d)'%f)],
+    10:['>xB3HL',[8,'flag'],['CVASM',8],(lambda f,y,c:'GEO_CAMERA_FRUSTUM{}({}, {}, {}{}{})'.format("_WITH_FUNC" if f[0] else "",
+        *f[1:4],"," if f[0] else "",f[4] if f[0] else ""))],
+    11:['',[4,0],None,(lambda f,y,c:'GEO_NODE_START()')],
+    12:['>xB',[4,0],None,(lambda f,y,c:'GEO_ZBUFFER(%d)'%f)],
+    13:['>4x2H',[8,0],None,(lambda f,y,c:'GEO_RENDER_RANGE(%d, %d)'%f)],
+    14:['>3xBL',[8,0],['CVASM',4],(lambda f,y,c:'GEO_SWITCH_CASE(%d, %d)'%f)],
+    15:['>2x7HL',[20,0],['CVASM',16],(lambda f,y,c:'GEO_CAMERA(%d, %d, %d, %d, %d, %d, %d, %d)'%f)],
+    16:['>xB7H',[16,'dl'],['DL',8],(lambda f,y,c:'GEO_TRANSLATE_ROTATE{}({}, {}, {},{}, {}, {}, {}{})'.format("_WITH_DL" if f[0]>>4==8 else "",
+        *f[1:8],DLArg(f,y,c)))],
+    17:['>xB3H',[8,'dl'],['DL',8],(lambda f,y,c:'GEO_TRANSLATE_NODE{}({}, {}, {}, {}{})'.format("_WITH_DL" if f[0]>>4==8 else "",
+        f[0]&0xF,*f[1:4],DLArg(f,y,c)))],
+    18:['>xB3H',[8,'dl'],['DL',8],(lambda f,y,c:'GEO_ROTATION_NODE{}({}, {}, {}, {}{})'.format("_WITH_DL" if f[0]>>4==8 else "",
+        f[0]&0xF,*f[1:4],DLArg(f,y,c)))],
+    19:['>xB3HL',[12,0],['STOREDL',8],(lambda f,y,c:'GEO_ANIMATED_PART(%d, %d, %d, %d, %s)'%(*f[0:4],'DL_'+y+hex(f[4]) if f[4]>0 else '0'))],
+    20:['>xB3H',[8,'dl'],['DL',8],(lambda f,y,c:'GEO_BILLBOARD_WITH_PARAMS{}({}, {}, {}, {}{})'.format("_AND_DL" if f[0]>>4==8 else "",
+        f[0]&0xF,*f[1:4],DLArg(f,y,c)))],
+    21:['>xB2xL',[8,0],['STOREDL',4],(lambda f,y,c:'GEO_DISPLAY_LIST(%d, %s)'%(f[0],'DL_'+y+hex(f[1]) if f[1]>0 else '0'))],
+    22:['>3xBxBH',[8,0],None,(lambda f,y,c:'GEO_SHADOW(%d, %d, %d)'%f)],
+    23:['',[4,0],None,(lambda f,y,c:'GEO_RENDER_OBJ()')],
+    24:['>2xHL',[8,0],['CVASM',4],(lambda f,y,c:'GEO_ASM(%d, %d)'%f)],
+    25:['>2xHL',[8,0],['CVASM',4],(lambda f,y,c:'GEO_BACKGROUND{}({}{}{})'.format("_COLOR" if not f[1] else "",f[0],"," if f[1] else "",f[1] if f[1] else ""))],
+    26:['',[8,0],None,(lambda f,y,c:'GEO_NOP_1A()')],
+    0x1D:['>xB2x2L',[8,'dl'],['DL',8],(lambda f,y,c:'GEO_SCALE{}({}, {}{}{})'.format("_WITH_DL" if f[0]>>4==8 else "",
+        f[0]&0xF,f[1],"," if f[0]>>4==8 else "",f[2] if f[0]>>4==8 else ""))],
+    28:['>xB3HL',[12,0],None,(lambda f,y,c:'GEO_HELD_OBJECT(%d, %d, %d, %d, %d)'%f)],
+    30:['',[8,0],None,(lambda f,y,c:'GEO_NOP_1E()')],
+    31:['',[16,0],None,(lambda f,y,c:'GEO_NOP_1F()')],
+    32:['>2xH',[4,0],None,(lambda f,y,c:'GEO_CULLING_RADIUS(%d)'%f)],
 }
+Structs = {op:struct.Struct(c[0]) for op,c in Cmds.items()}
+U16 = struct.Struct('>H')
+U32 = struct.Struct('>L')
+
+#A decoded command. fields as unpacked by its struct, ptr is the u32 it points with
+#(0 without one), addr is the rom address of that for PUSH and STOREDL and arg is the u16
+#at 2 that a few functions are passed.
+class GeoCmd():
+    __slots__ = ['op','fields','length','kind','ptr','addr','arg']
+    def __init__(self,q,s):
+        op = q[0]
+        [fmt,[length,extra],pointer,text] = Cmds[op]
+        self.op = op
+        self.fields = Structs[op].unpack_from(q)
+        if (extra=='dl' and q[1]>>4==8) or (extra=='flag' and q[1]):
+            length += 4
+        self.length = length
+        self.kind = pointer and pointer[0]
+        self.ptr = U32.unpack_from(q,pointer[1])[0] if pointer and pointer[0]!='POP' else 0
+        self.addr = None
+        if self.kind=='PUSH' or (self.kind=='STOREDL' and self.ptr):
+            self.addr = s.B2P(self.ptr)
+        self.arg = U16.unpack_from(q,2)[0]
+
+    def Text(self,id):
+        return Cmds[self.op][3](self.fields,id,self)
+
+#Follow a geo layout from start, branching into the layouts it links to. Returns the
+#layouts as [[cmds, rom address]] and the DLs it uses as [rom address, segmented].
+def GeoDecode(rom, start, script):
+    x=0
+    g=[ [ [],start] ]
+    start=[start]
+    DLs=[]
+    t=0
+    while(True):
+        C=GeoCmd(rom[start[-1]+x:start[-1]+x+24],script)
+        if C.kind=="STOREDL" and C.ptr:
+            DLs.append([C.addr,C.ptr])
+        if C.kind=='PUSH':
+            g[t][0].append(C)
+            start[-1]=start[-1]+x+C.length
+            start.append(C.addr)
+            g.append([[],C.addr])
+            t=len(g)-1
+            x=0
+            continue
+        if C.kind=='POP':
+            g[t][0].append(C)
+            start.pop()
+            t=len(start)-1
+            x=0
+            continue
+        x += C.length
+        g[t][0].append(C)
+        if C.op==1:
+            break
+    return [g,DLs]
+
+#Decoded layouts, a layout used by several areas, levels or actors is only decoded once.
+#Keyed on the rom and address, each key has a list of [banks, entry], banks are the
+#bank mappings of the pointers it followed and entry is [layouts, DLs, rom pages read].
+GeoCache={}
+
+#start a new export, the rom might have changed since the last one
+def ResetCache():
+    GeoCache.clear()
 
-def TcH(bytes):
-    a = struct.pack(">%dB"%len(bytes),*bytes)
-    if len(bytes)==4:
-        return struct.unpack(">L",a)[0]
-    if len(bytes)==2:
-        return struct.unpack(">H",a)[0]
-    if len(bytes)==1:
-        return struct.unpack(">B",a)[0]
+def GeoLayouts(rom, start, script):
+    key = (rom.name, start)
+    for banks,entry in GeoCache.get(key, []):
+        if all(script.banks[g]==b for g,b in banks.items()):
+            rom.Touch(entry[2])
+            return entry
+    prev = rom.Track()
+    try:
+        [g,DLs] = GeoDecode(rom, start, script)
+    finally:
+        pages = rom.Untrack(prev)
+    segs = {c.ptr>>24 for l in g for c in l[0] if c.addr is not None}
+    banks = {b:script.banks[b] and list(script.banks[b]) for b in segs if b}
+    if len(GeoCache)>0x4000:
+        GeoCache.clear()
+    variants = GeoCache.setdefault(key, [])
+    variants.append([banks, [g, DLs, pages]])
+    del variants[:-8]
+    return [g, DLs, pages]
 
 def GetWaterData(rom, script, arg, area):
     #for editor water tables are at 0x19001800, but that might not be gauranteed
@@ -111,57 +177,26 @@ def GetWaterData(rom, script, arg, area):
     return WB
 
 def GeoParse(rom, start, script, segstart, id, cskybox, CBG, area):
-    x=0
-    g=[ [ [],start] ]
-    start=[start]
-    DLs=[]
-    t=0
+    [layouts,DLs,pages] = GeoLayouts(rom, start, script)
+    g=[]
     WaterBoxes = []
     envfx = 0
-    while(True):
-        q=rom[start[-1]+x:start[-1]+x+24]
-        C=Cmds[q[0]]
-        F=C(q,id,script)
-        if 'GEO_BACKGROUND' in F[0] and CBG:
-            F[0] = 'GEO_BACKGROUND(%s+10, geo_skybox_main)'%(cskybox)
-        if F[-1]=="ext":
-            if F[2]=='CVASM':
-                f=F[3].hex()
-                r=TcH(F[3])
-                if r!=0:
-                    label=script.GetLabel(f)
-                    if 'geo_movtex_draw_water_regions' in label:
-                        WaterBoxes.append(GetWaterData(rom,script,B2I(q[2:4]),area))
-                    if 'geo_envfx_main' in label and B2I(q[2:4])>0:
-                        envfx = 1
-                    F[0]=F[0].replace(str(r),label)
-            if F[2]=="STOREDL":
-                b=[a for a in F[3]]
-                if b!=[0,0,0,0]:
-                    q=TcH(b)
-                    b=script.B2P(TcH(b))
-                    DLs.append([b,q])
-            if F[2]=='PUSH':
-                g[t][0].append(F[0])
-                b=[a for a in F[3]]
-                b=script.B2P(TcH(b))
-                start[-1]=start[-1]+x+F[1]
-                start.append(b)
-                g.append([[],b])
-                t=len(g)-1
-                x=0
-                continue
-            if F[2]=='POP':
-                g[t][0].append(F[0])
-                start.pop()
-                t=len(start)-1
-                x=0
-                continue
-        x += F[1]
-        g[t][0].append(F[0])
-        if F[0]=="GEO_END()":
-            break
-    return (g,DLs,WaterBoxes,envfx)
+    for cmds,addr in layouts:
+        text = []
+        for C in cmds:
+            F = C.Text(id)
+            if C.op==25 and CBG:
+                F = 'GEO_BACKGROUND(%s+10, geo_skybox_main)'%(cskybox)
+            if C.kind=='CVASM' and C.ptr:
+                label=script.GetLabel('%08x'%C.ptr)
+                if 'geo_movtex_draw_water_regions' in label:
+                    WaterBoxes.append(GetWaterData(rom,script,C.arg,area))
+                if 'geo_envfx_main' in label and C.arg>0:
+                    envfx = 1
+                F=F.replace(str(C.ptr),label)
+            text.append(F)
+        g.append([text,addr])
+    return (g,[list(d) for d in DLs],WaterBoxes,envfx)
 
 def GeoWrite(geo, name, id):
     tabs = 1 # The amount of tabs we currently add to the ineer section of the GeoLayout definition.
@@ -169,7 +204,7 @@ def GeoWrite(geo, name, id):
     data = ""
     
     # Open the Geo file for writing.
-    f = open(name, 'w')
+    f = Output.Open(name, 'w')
     
     # Iterate the geo we got passed and write it out.
     for u,g in enumerate(geo):
@@ -248,48 +283,17 @@ def GeoActWrite(geo, f):
     f.close()
 
 def GeoActParse(rom,model):
-    x=0
-    g=[[[],model[1]]]
-    start=[model[3]]
     script = model[5]
     id=model[1]+"_"
-    DLs=[]
-    t=0
-    while(True):
-        q=rom[start[-1]+x:start[-1]+x+24]
-        C=Cmds[q[0]]
-        F=C(q,id,script)
-        if F[-1]=="ext":
-            if F[2]=='CVASM':
-                f=F[3].hex()
-                r=TcH(F[3])
-                if r!=0:
-                    label=script.GetLabel(f)
-                    F[0]=F[0].replace(str(r),label)
-            if F[2]=="STOREDL":
-                b=[a for a in F[3]]
-                if b!=[0,0,0,0]:
-                    q=TcH(b)
-                    b=script.B2P(TcH(b))
-                    DLs.append([b,q])
-            if F[2]=='PUSH':
-                g[t][0].append(F[0])
-                b=[a for a in F[3]]
-                b=script.B2P(TcH(b))
-                start[-1]=start[-1]+x+F[1]
-                start.append(b)
-                g.append([[],'Geo_'+id+hex(b)])
-                t=len(g)-1
-                x=0
-                continue
-            if F[2]=='POP':
-                g[t][0].append(F[0])
-                start.pop()
-                t=len(start)-1
-                x=0
-                continue
-        x+=F[1]
-        g[t][0].append(F[0])
-        if F[0]=="GEO_END()":
-            break
-    return (g,DLs)
\ No newline at end of file
+    [layouts,DLs,pages] = GeoLayouts(rom, model[3], script)
+    g=[]
+    for cmds,addr in layouts:
+        text = []
+        for C in cmds:
+            F = C.Text(id)
+            if C.kind=='CVASM' and C.ptr:
+                F=F.replace(str(C.ptr),script.GetLabel('%08x'%C.ptr))
+            text.append(F)
+        g.append([text,'Geo_'+id+hex(addr)])
+    g[0][1]=model[1]
+    return (g,[list(d) for d in DLs])
@@ -0,0 +1,19 @@
+#Deferred imports. A module imported through here is only actually loaded the
+#first time one of its attributes is used, so modes like Text=1 don't pay for
+#numpy, capstone, PIL or the big comparison tables they never touch.
+import importlib.util
+import sys
+
+def Import(name):
+    mod = sys.modules.get(name)
+    if mod:
+        return mod
+    spec = importlib.util.find_spec(name)
+    if not spec:
+        raise ImportError('No module named %s'%name,name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[name] = mod
+    loader.exec_module(mod)
+    return mod
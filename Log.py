@@ -1,13 +1,11 @@
 #This module is meant to do cross module logging of stuff to look out for when importing to decomp
 #and also go give general warnings and instructions for people who don't know much
 import sys
+import json
 from RM2CData import *
 
-log = sys.path[0]
-
-log = open(log+'//ImportInstructions.py','w')
-
-log.write("""This file will contain instructions on how to import RM2C data into the sm64ex-alo repo.
+#the instructions file is only written once an export finishes, see WriteWarnings
+Header = """This file will contain instructions on how to import RM2C data into the sm64ex-alo repo.
 First you should always copy the exported folders (/src,/levels,/sound,/text,/textures,/actors) into your repo.
 Then make sure you set RM2C inside the makefile to 1
 Then to build for PC use this input to terminal: "make clean && make RM2CPC"
@@ -25,93 +23,170 @@ These are provided for reference only, they must be manually integrated into the
 Below are some warnings generated by RM2C during extraction.
 It is expected to have many warnings for editor files and for roms with lots of custom content.
 
-""")
+"""
 
 Spacer="*"*90
 
-BadScroll=[]
-Scrollerrs=[]
-def InvalidScroll(level,area,scroll):
-	global BadScroll
-	global Scrollerrs
-	if (level,area,scroll) in BadScroll:
-		return
-	else:
-		BadScroll.append((level,area,scroll))
+#warning sections, the keyed ones are only logged once per key
+Keyed = ['Objects','Fog','Scrolls']
+Plain = ['Behaviors','Models','Collision']
+
+#lists in keys (scroll objects) are turned into tuples so they can go in a set
+def Key(k):
+	if type(k)==list or type(k)==tuple:
+		return tuple(map(Key,k))
+	return k
+
+#Everything logged during an export. Keyed warnings are deduped with a set instead
+#of scanning what was already logged, and a collector from a worker process can be
+#merged into another one in the order it was logged.
+class Diagnostics():
+	def __init__(self):
+		self.Seen = {c:set() for c in Keyed}
+		#category -> [[key,warning]], key is None for plain warnings
+		self.Entries = {c:[] for c in Keyed+Plain}
+		#(level,area) -> [surface nodes per cell as floor, wall and ceiling grids, surfaces,
+		#[tris before,after] when the collision was optimized]
+		self.Surfaces = {}
+
+	#returns 0 if the key was already logged
+	def Add(self,cat,key,err):
+		if key!=None:
+			if key in self.Seen[cat]:
+				return 0
+			self.Seen[cat].add(key)
+		self.Entries[cat].append([key,err])
+		return 1
+
+	def Warnings(self,cat):
+		return [e[1] for e in self.Entries[cat]]
+
+	def Merge(self,other):
+		for c in Keyed+Plain:
+			for key,err in other.Entries[c]:
+				self.Add(c,key,err)
+		self.Surfaces.update(other.Surfaces)
+
+	def ToDict(self):
+		d = {c:self.Warnings(c) for c in Keyed+Plain}
+		d['Surfaces'] = [{'level':Num2Name[l],'area':a,'surfaces':n,'nodes':int(cells.sum()),'optimized':opt,
+			'floors':cells[0].tolist(),'walls':cells[1].tolist(),'ceilings':cells[2].tolist()} for (l,a),[cells,n,opt] in self.Surfaces.items()]
+		return d
+
+	def ToJSON(self):
+		return json.dumps(self.ToDict(),indent=1)
+
+	def InvalidScroll(self,level,area,scroll):
 		err = 'Texture Scroll Object in level {} area {} at {} has unrecognized address. Object Has been commented out.'.format(Num2Name[level],area,hex(scroll[2]))
-		print(err)
-		Scrollerrs.append(err+'\n')
+		if self.Add('Scrolls',Key((level,area,scroll)),err+'\n'):
+			print(err)
 
-LastFog=[]
-Fogerrs=[]
-def LevelFog(file):
-	global LastFog
-	global Fogerrs
-	if file in LastFog:
-		return
-	else:
-		LastFog.append(file)
+	def LevelFog(self,file):
 		err = 'Model file {} has fog, for editor, fog DLs are heavily edited, potential for gfx errors.'.format(file)
-		print(err)
-		Fogerrs.append(err+'\n')
+		if self.Add('Fog',file,err+'\n'):
+			print(err)
 
-UnkObjs = []
-Objerrs=[]
-def UnkObject(level,Area,bhv):
-	global UnkObjs
-	global Objerrs
-	if (level,Area,bhv) in UnkObjs:
-		return
-	else:
-		UnkObjs.append((level,Area,bhv))
+	def UnkObject(self,level,Area,bhv):
 		err = 'Level {} Area {} has object {} with no known label.'.format(Num2Name[level],Area,bhv)
+		if self.Add('Objects',(level,Area,bhv),err+'\n'):
+			print(err)
+
+	def NewObject(self,bhv):
+		err = 'Behavior {} has custom values or new values inside of it.'.format(bhv)
 		print(err)
-		Objerrs.append(err+'\n')
+		self.Add('Behaviors',None,err+'\n')
+
+	def UnkModel(self,id,fold):
+		self.Add('Models',None,"model {} in folder {} has a new model or new textures.\n".format(id,fold))
+
+	def UnkCollision(self,id,fold,Bhv):
+		self.Add('Collision',None,"Collision {} in folder {} is unkown or found to be new. Used with Behavior{}.\n".format(id,fold,Bhv))
+
+	def Partition(self,level,area,cells,surfaces,optimized=None):
+		self.Surfaces[(level,area)] = [cells,surfaces,optimized]
+
+Diag = Diagnostics()
+
+def InvalidScroll(level,area,scroll):
+	Diag.InvalidScroll(level,area,scroll)
+
+def LevelFog(file):
+	Diag.LevelFog(file)
+
+def UnkObject(level,Area,bhv):
+	Diag.UnkObject(level,Area,bhv)
 
-NewObjs = []
 def NewObject(bhv):
-	global NewObjs
-	err = 'Behavior {} has custom values or new values inside of it.'.format(bhv)
-	print(err)
-	NewObjs.append(err+'\n')
+	Diag.NewObject(bhv)
 
-UnkModels=[]
 def UnkModel(id,fold):
-	global UnkModels
-	UnkModels.append("model {} in folder {} has a new model or new textures.\n".format(id,fold))
+	Diag.UnkModel(id,fold)
 
-UnkCol=[]
 def UnkCollision(id,fold,Bhv):
-	global UnkCol
-	UnkCol.append("Collision {} in folder {} is unkown or found to be new. Used with Behavior{}.\n".format(id,fold,Bhv))
-
+	Diag.UnkCollision(id,fold,Bhv)
+
+def Partition(level,area,cells,surfaces,optimized=None):
+	Diag.Partition(level,area,cells,surfaces,optimized)
+
+#start a fresh collector, worker processes send back only what they logged themselves
+def Reset():
+	global Diag
+	Diag = Diagnostics()
+	return Diag
+
+Sections = [
+	['Objects',"Objects without references must have behaviors created for them, be given an existing behavior, or be commented out."],
+	['Behaviors',"Unlike above, these are behaviors that have been edited. These are not commented out because I cannot detect if they are custom until after writing the script.\nYou must add the following edited behaviors and collision from custom.behavior_data.inc.h to behavior_data.c for these to work properly.\nAssociated collision will be logged in a different section."],
+	['Fog',"Levels with fog in sm64 editor and likely early versions of Rom Manager are completely broken and destroy the levels graphics and most non opaque objects.\nI attempt to auto fix these, if there is any issue in these levels check fog first."],
+	['Scrolls',"Texture scrolls do not always follow the same format I assume, if this error appears it may have an invalid address which causes a crash.\nRM2C will try to find the correct address after noticing the one it has is wrong, if a crash occurs when entering the level check these objects first"],
+	['Models',"New models are detected by comparing the checksums of textures from the specific model.\nThe comparison models come from an unedited vanilla rom loaded into Rom Manager.\nIf a model is in this list, it has either an unrecognized ID or a new texture.\nIf a model is not in this list, it does not guarantee that it is unedited."],
+	['Collision',"Collision models are loaded via behavior, not alongside the model. This means it can be more difficult to detect where exactly the collision belongs.\nI attempt to guess based on what model the collision is first used with, but if I'm not sure, it will be logged here."],
+]
+
+#vanilla pool sizes, SURFACE_POOL_SIZE and SURFACE_NODE_POOL_SIZE in extended_bounds.h
+SurfacePool = 2300
+SurfaceNodePool = 7000
+
+SurfaceMsg = """Static surfaces and surface nodes of each area, from binning its collision into the game's cells the way surface_load.c does (vanilla bounds).
+The pools are sized for the biggest area of a level, objects with collision take more from them every frame so leave room above these.
+If a level needs more than vanilla ({} surfaces, {} nodes), set SURFACE_POOL_SIZE and SURFACE_NODE_POOL_SIZE in include/extended_bounds.h.
+Areas over the vanilla node pool also list the nodes in each cell, rows are z and columns are x.""".format(SurfacePool,SurfaceNodePool)
+
+def SurfaceReport(log):
+	levels = {}
+	for (l,a),v in Diag.Surfaces.items():
+		levels.setdefault(l,[]).append([a]+v)
+	if not levels:
+		return
+	log.write(Spacer+"\n\n"+SurfaceMsg+"\n\n")
+	for l,areas in levels.items():
+		surfaces = max(n for a,cells,n,opt in areas)
+		nodes = max(int(cells.sum()) for a,cells,n,opt in areas)
+		over = surfaces>SurfacePool or nodes>SurfaceNodePool
+		log.write(' {}: needs SURFACE_POOL_SIZE {} and SURFACE_NODE_POOL_SIZE {}{}\n'.format(Num2Name[l],surfaces,nodes,', more than vanilla' if over else ''))
+		for a,cells,n,opt in areas:
+			total = cells.sum(axis=0)
+			[z,x] = divmod(int(total.argmax()),total.shape[1])
+			log.write('  area {}: {} surfaces, {} nodes ({} floors, {} walls, {} ceilings), busiest cell x {} z {} with {} nodes{}\n'.format(
+				a,n,int(total.sum()),*[int(c.sum()) for c in cells],x,z,int(total[z,x]),', optimized from {} tris to {}'.format(*opt) if opt else ''))
+			if total.sum()>SurfaceNodePool:
+				[log.write('   '+' '.join('%4d'%c for c in row)+'\n') for row in total.tolist()]
+
+#ImportInstructions.py for people, ImportInstructions.json with the same warnings for tools
 def WriteWarnings():
-	global Objerrs
-	global NewObjs
-	global Fogerrs
-	global Scrollerrs
-	global UnkModels
-	global UnkCol
-	if Objerrs:
-		log.write(Spacer+"\n\nObjects without references must have behaviors created for them, be given an existing behavior, or be commented out.\n\n")
-		[log.write(' {}'.format(s)) for s in Objerrs]
-	if NewObjs:
-		log.write(Spacer+"\n\nUnlike above, these are behaviors that have been edited. These are not commented out because I cannot detect if they are custom until after writing the script.\nYou must add the following edited behaviors and collision from custom.behavior_data.inc.h to behavior_data.c for these to work properly.\nAssociated collision will be logged in a different section.\n\n")
-		[log.write(' {}'.format(s)) for s in NewObjs]
-	if Fogerrs:
-		log.write(Spacer+"\n\nLevels with fog in sm64 editor and likely early versions of Rom Manager are completely broken and destroy the levels graphics and most non opaque objects.\nI attempt to auto fix these, if there is any issue in these levels check fog first.\n\n")
-		[log.write(' {}'.format(s)) for s in Fogerrs]
-	if Scrollerrs:
-		log.write(Spacer+"\n\nTexture scrolls do not always follow the same format I assume, if this error appears it may have an invalid address which causes a crash.\nRM2C will try to find the correct address after noticing the one it has is wrong, if a crash occurs when entering the level check these objects first\n\n")
-		[log.write(' {}'.format(s)) for s in Scrollerrs]
-	if UnkModels:
-		log.write(Spacer+"\n\nNew models are detected by comparing the checksums of textures from the specific model.\nThe comparison models come from an unedited vanilla rom loaded into Rom Manager.\nIf a model is in this list, it has either an unrecognized ID or a new texture.\nIf a model is not in this list, it does not guarantee that it is unedited.\n\n")
-		[log.write(' {}'.format(m)) for m in UnkModels]
-	if UnkCol:
-		log.write(Spacer+"\n\nCollision models are loaded via behavior, not alongside the model. This means it can be more difficult to detect where exactly the collision belongs.\nI attempt to guess based on what model the collision is first used with, but if I'm not sure, it will be logged here.\n\n")
-		[log.write(' {}'.format(m)) for m in UnkCol]
+	log = open(sys.path[0]+'//ImportInstructions.py','w')
+	log.write(Header)
+	for c,msg in Sections:
+		errs = Diag.Warnings(c)
+		if errs:
+			log.write(Spacer+"\n\n"+msg+"\n\n")
+			[log.write(' {}'.format(s)) for s in errs]
+	SurfaceReport(log)
 	log.write(Warnings)
 	log.close()
+	log = open(sys.path[0]+'//ImportInstructions.json','w')
+	log.write(Diag.ToJSON())
+	log.close()
 
 Warnings = """
 Known methods of crashing:
@@ -124,7 +199,7 @@ IF ONLY ALPHA TEXTURES MESSED UP - MOVE FOG GEO LAYOUT TO LAYER 1/4 FROM 4/6
 IF CRASH UPON ENTERING A LEVEL, CHECK OBJECTS. IF EDITOR, CHECK SCROLLS FIRST. IF NO OBJECTS BAD CHECK SKYBOXES, THEN SEQUENCES
 *****************************************************************************
 N64 BUILD
-IF SURFACE NODE POOOL OR SURFACE POOL FULL - ADD MORE TRIS TO EXT BOUNDS.H
+IF SURFACE NODE POOOL OR SURFACE POOL FULL - ADD MORE TRIS TO EXT BOUNDS.H, SEE THE SURFACE COUNTS ABOVE
 IF CRASH ON STAR SELECT - PUSH FORWARD GODDARD SEGMENT IN SEGMENTS.H
 *****************************************************************************
 
@@ -0,0 +1,86 @@
+#Manifest for Incremental=1 exports. For every level it keeps which pages of the rom
+#the export read, a hash of those pages, the files it wrote and what it returned to main.
+#On the next export a level whose pages hash the same and whose files are still there
+#gets its old result back instead of being exported again. Anything that changes the
+#output besides the rom (args, append roms, RM2C itself) is part of the key, so a
+#change there makes every level export again.
+import hashlib
+import pickle
+import os
+
+#bump when the layout of the pickled manifest changes
+ManifestVersion = 1
+
+FileName = 'manifest.pickle'
+
+#everything besides the rom that a level export reads, on top of every script next to this one
+Sources = ['sm64.us.map','originals']
+
+def FileHash(name):
+    h = hashlib.sha1()
+    f = open(name,'rb')
+    for b in iter(lambda: f.read(1<<20),b''):
+        h.update(b)
+    f.close()
+    return h.hexdigest()
+
+#hash of RM2C's own scripts, the map, data tables and the original level files
+def CodeKey():
+    dir = os.path.dirname(os.path.abspath(__file__))
+    files = [os.path.join(dir,n) for n in os.listdir(dir) if n.endswith('.py')]
+    for s in Sources:
+        s = os.path.join(dir,s)
+        if os.path.isdir(s):
+            for root,dirs,names in os.walk(s):
+                files.extend(os.path.join(root,n) for n in names)
+        else:
+            files.append(s)
+    h = hashlib.sha1()
+    for f in sorted(files):
+        h.update(os.path.relpath(f,dir).encode())
+        h.update(FileHash(f).encode())
+    return h.hexdigest()
+
+def Key(editor,Append,Onlys,romname,MusicExtend,OptimizeCol):
+    Append = [(FileHash(A[0]),A[1],A[2]) for A in Append]
+    return [ManifestVersion,CodeKey(),editor,Append,Onlys,romname,MusicExtend,OptimizeCol]
+
+class Manifest():
+    def __init__(self,key):
+        self.key = key
+        #level -> [pages read, hash of them, files, pickled result]
+        self.Levels = {}
+
+    #the result of the last export of level, or None if it has to be exported again
+    def Get(self,rom,level,root):
+        e = self.Levels.get(level)
+        if not e:
+            return None
+        [pages,digest,files,res] = e
+        for f in files:
+            if not os.path.exists(os.path.join(root,f)):
+                return None
+        if rom.PageHash(pages)!=digest:
+            return None
+        return pickle.loads(res)
+
+    #res is pickled right away, main goes on to change the script in it
+    def Set(self,rom,level,pages,files,res):
+        pages = sorted(pages)
+        self.Levels[level] = [pages,rom.PageHash(pages),files,pickle.dumps(res,protocol=pickle.HIGHEST_PROTOCOL)]
+
+def Load(name,key):
+    try:
+        f = open(name,'rb')
+        man = pickle.load(f)
+        f.close()
+        if man.key==key:
+            return man
+    except:
+        pass
+    return Manifest(key)
+
+def Save(man,name):
+    f = open(name,'wb')
+    pickle.dump(man,f,protocol=pickle.HIGHEST_PROTOCOL)
+    f.close()
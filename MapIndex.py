@@ -0,0 +1,97 @@
+#Symbol index for sm64.us.map. Label lookups used to scan every line of the map,
+#now they are dictionary hits. The index is pickled next to the map and keyed
+#on the hash of the map so later runs skip parsing entirely.
+import hashlib
+import pickle
+import bisect
+import re
+import io
+
+#bump when the layout of the pickled index changes
+CacheVersion = 1
+
+#lookups are always 8 lowercase hex digits, so they can only ever
+#be found inside a run of lowercase hex characters
+HexRun = re.compile('[0-9a-f]{8,}')
+IsAddr = re.compile('[0-9a-f]{8}')
+
+class MapIndex():
+    def __init__(self,lines):
+        self.lines = lines
+        #8 digit hex string -> label of the first line containing it.
+        #This is exactly what the old substring scan found.
+        self.Windows = {}
+        #label -> address of the first symbol line defining it
+        self.Labels = {}
+        #sorted [address, label] of every symbol line for range lookups
+        self.Addrs = []
+        for l in lines:
+            q = l.rfind(" ")
+            res = l[q:-1]
+            for run in HexRun.findall(l):
+                for i in range(len(run)-7):
+                    self.Windows.setdefault(run[i:i+8],res)
+            tok = l.split()
+            if len(tok)>1 and tok[0].startswith('0x') and len(tok[0])==18 and tok[1].isidentifier():
+                self.Labels.setdefault(tok[1],"0x"+l.split("0x")[1][8:16])
+                self.Addrs.append((int(tok[0],16)&0xFFFFFFFF,tok[1]))
+        self.Addrs.sort()
+        self.Keys = [a[0] for a in self.Addrs]
+
+    def GetLabel(self,addr):
+        if IsAddr.fullmatch(addr):
+            return self.Windows.get(addr,"0x"+addr)
+        #anything that isn't a plain address falls back to the old scan
+        for l in self.lines:
+            if addr in l:
+                q = l.rfind(" ")
+                return l[q:-1]
+        return "0x"+addr
+
+    def GetAddr(self,label):
+        addr = self.Labels.get(label)
+        if addr:
+            return addr
+        for l in self.lines:
+            if label in l:
+                return "0x"+l.split("0x")[1][8:16]
+        return None
+
+    #closest symbol at or below addr, returns [label,offset] or None
+    def GetSymbol(self,addr):
+        i = bisect.bisect_right(self.Keys,addr)
+        if not i:
+            return None
+        a = self.Addrs[i-1]
+        return [a[1],addr-a[0]]
+
+    #every symbol with an address in [start,end)
+    def GetRange(self,start,end):
+        i = bisect.bisect_left(self.Keys,start)
+        j = bisect.bisect_left(self.Keys,end)
+        return self.Addrs[i:j]
+
+def Load(name):
+    f = open(name,'rb')
+    raw = f.read()
+    f.close()
+    key = (CacheVersion,hashlib.sha1(raw).hexdigest())
+    cache = name+'.pickle'
+    try:
+        f = open(cache,'rb')
+        [ckey,index] = pickle.load(f)
+        f.close()
+        if ckey==key:
+            return index
+    except:
+        pass
+    #decode the same way the text file is read, so label results don't change
+    lines = io.TextIOWrapper(io.BytesIO(raw)).readlines()
+    index = MapIndex(lines)
+    try:
+        f = open(cache,'wb')
+        pickle.dump([key,index],f,protocol=pickle.HIGHEST_PROTOCOL)
+        f.close()
+    except:
+        pass
+    return index
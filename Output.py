@@ -0,0 +1,171 @@
+#Write if changed output. Files opened through here are built in memory and only written
+#to disk when their contents differ from what is already there, so a re-export leaves the
+#mtimes of unchanged files alone and make in the decomp repo only rebuilds what changed.
+#Folders that used to be wiped before an export are registered with Clean instead, and
+#whatever in them wasn't written again gets removed by Prune at the end.
+import io
+import os
+import time
+import locale
+
+#absolute paths of every file written (or found unchanged) this export
+Written = set()
+#folders to remove stale files from
+Roots = []
+#files modified after this were written by something that doesn't go through here
+Start = time.time()
+Stats = [0,0]
+#contents of files opened for appending, they're written by Flush so a file
+#that's appended to a few times during an export is only written once
+Pending = {}
+
+def Begin():
+    global Start
+    Written.clear()
+    Roots.clear()
+    Pending.clear()
+    Stats[:] = [0,0]
+    #some file systems only keep mtimes to the second or two
+    Start = time.time()-2
+
+def Abs(name):
+    return os.path.abspath(str(name))
+
+#write data if it differs from the file on disk, returns 1 if it was written
+def Commit(name,data):
+    name = Abs(name)
+    Written.add(name)
+    Pending.pop(name,None)
+    try:
+        if os.path.getsize(name)==len(data):
+            f = open(name,'rb')
+            old = f.read()
+            f.close()
+            if old==data:
+                Stats[1] += 1
+                return 0
+    except OSError:
+        pass
+    f = open(name,'wb')
+    f.write(data)
+    f.close()
+    Stats[0] += 1
+    return 1
+
+#Files from an earlier export are never appended to, a file opened with 'a' only
+#keeps what was written to it during this export, same as when folders were wiped.
+def Current(name):
+    name = Abs(name)
+    if name in Pending:
+        return Pending[name]
+    if name not in Written:
+        return None
+    f = open(name,'rb')
+    data = f.read()
+    f.close()
+    return data
+
+#appended files are kept until Flush, anything else is written now
+def Close(name,mode,data):
+    if 'a' in mode:
+        name = Abs(name)
+        Written.add(name)
+        Pending[name] = data
+    else:
+        Commit(name,data)
+
+#write the files that were appended to
+def Flush():
+    for name,data in list(Pending.items()):
+        Commit(name,data)
+
+class TextFile(io.StringIO):
+    def __init__(self,name,mode,encoding):
+        super().__init__(newline='')
+        self.name = str(name)
+        self.mode = mode
+        self.enc = encoding or locale.getpreferredencoding(False)
+        if 'a' in mode:
+            data = Current(name)
+            if data:
+                self.write(data.decode(self.enc).replace(os.linesep,'\n'))
+
+    def close(self):
+        if not self.closed:
+            data = self.getvalue()
+            if os.linesep!='\n':
+                data = data.replace('\n',os.linesep)
+            Close(self.name,self.mode,data.encode(self.enc))
+        super().close()
+
+class BinFile(io.BytesIO):
+    def __init__(self,name,mode):
+        super().__init__()
+        self.name = str(name)
+        self.mode = mode
+        if 'a' in mode:
+            data = Current(name)
+            if data:
+                self.write(data)
+
+    def close(self):
+        if not self.closed:
+            Close(self.name,self.mode,self.getvalue())
+        super().close()
+
+#drop in for open(name,'w'/'a'/'wb'/'ab'), the file is written when closed
+def Open(name,mode='w',encoding=None):
+    if 'b' in mode:
+        return BinFile(name,mode)
+    return TextFile(name,mode,encoding)
+
+#shutil.copytree that also works into an existing folder, skip is files the caller writes itself
+def CopyTree(src,dst,skip=[]):
+    for root,dirs,files in os.walk(src):
+        out = os.path.join(dst,os.path.relpath(root,src))
+        os.makedirs(out,exist_ok=True)
+        for n in files:
+            if root==str(src) and n in skip:
+                continue
+            f = open(os.path.join(root,n),'rb')
+            Commit(os.path.join(out,n),f.read())
+            f.close()
+
+#files written by another process, with its counts if they aren't in Stats yet
+def Mark(names,stats=None):
+    Written.update(map(Abs,names))
+    if stats:
+        Stats[0] += stats[0]
+        Stats[1] += stats[1]
+
+#[files, counts] written since Checkpoint, for sending back from a worker
+def Checkpoint():
+    return [set(Written),list(Stats)]
+
+def Since(cp):
+    return [list(Written-cp[0]),[a-b for a,b in zip(Stats,cp[1])]]
+
+def Clean(dir):
+    Roots.append(Abs(dir))
+
+def Stale(name):
+    if name in Written:
+        return 0
+    #written by something else during this export
+    return os.path.getmtime(name)<Start
+
+#remove everything in the Clean folders that this export didn't write
+def Prune():
+    for r in Roots:
+        #folders something was removed from, only those are removed once empty
+        removed = set()
+        for root,dirs,files in os.walk(r,topdown=False):
+            for n in files:
+                n = os.path.join(root,n)
+                if Stale(n):
+                    os.remove(n)
+                    removed.add(root)
+            if root!=r and root in removed and not os.listdir(root):
+                os.rmdir(root)
+                removed.add(os.path.dirname(root))
+    Roots.clear()
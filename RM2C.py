@@ -1,39 +1,50 @@
 import sys
 import os
 import struct
+import bisect
 import traceback
-import GeoWrite as GW
-import F3D
-import ColParse
 from pathlib import Path
-from capstone import *
 import shutil
-from bitstring import *
 from RM2CData import *
-import BinPNG
-import groups as GD
 import math
-import disassemble_sound as d_s
 import multiprocessing as mp
 import Log
 import re
-import BhvParse as BP
 import gc
-#these all exist as data modules for comparisons to see if content is new or not
-import ActorCHKSM
-import BehComp
-import ColComp
 import time
-import cProfile
-import pstats
+import MapIndex
+import Manifest
+import Output
+import Rom
+import Workers
+import Lazy
+#heavy modules and reference tables are only loaded once something uses them
+GW = Lazy.Import('GeoWrite')
+F3D = Lazy.Import('F3D')
+ColParse = Lazy.Import('ColParse')
+BinPNG = Lazy.Import('BinPNG')
+GD = Lazy.Import('groups')
+d_s = Lazy.Import('disassemble_sound')
+BP = Lazy.Import('BhvParse')
+capstone = Lazy.Import('capstone')
+cProfile = Lazy.Import('cProfile')
+pstats = Lazy.Import('pstats')
+#comparisons to vanilla data to see if content is new or not.
+#Compiled from the ActorCHKSM, BehComp and ColComp data modules.
+RefDB = Lazy.Import('RefDB')
 #So that each Script class doesn't open up a half MB file.
-mapF = open('sm64.us.map','r')
-map = mapF.readlines()
+#The map is indexed once per run (and cached on disk) instead of scanned per lookup,
+#and only loaded the first time a label is needed.
+map = None
+
+def GetMap():
+    global map
+    if not map:
+        map = MapIndex.Load('sm64.us.map')
+    return map
 
 class Script():
     def __init__(self,level):
-        global map
-        self.map=map
         self.banks=[None for a in range(32)]
         self.asm=[[0x80400000,0x1200000,0x1220000],[0x80246000,0x1000,0x21f4c0]]
         self.models=[None for a in range(256)]
@@ -52,6 +63,8 @@ class Script():
         self.header=[]
         self.objects = []
         self.ScrollArray=[]
+        #set once the areas of a custom level are written
+        self.envfx=None
         
     def B2P(self,B):
         Bank=B>>24
@@ -95,19 +108,10 @@ class Script():
         # if addr[0:2]=='00':
             # print(addr + ' is in bank 0 cannot be found')
             # return '0x'+addr
-        for l in self.map:
-            if addr in l:
-                q = l.rfind(" ")
-                return l[q:-1]
-                
-        return "0x"+addr
+        return GetMap().GetLabel(addr)
         
     def GetAddr(self,label):
-        for l in self.map:
-            if label in l:
-                return "0x"+l.split("0x")[1][8:16]
-                
-        return None
+        return GetMap().GetAddr(label)
         
     def RME(self,num,rom):
         if self.editor:
@@ -120,6 +124,25 @@ class Script():
     def MakeDec(self,name):
         self.header.append(name)
         
+    #copy of the state built up by the level script so far, see LevelScript.Resume
+    def Snapshot(self):
+        snap={}
+        for k,v in self.__dict__.items():
+            if k in ('Currlevel','levels','CmdCounts'):
+                continue
+            if type(v)==list:
+                v=list(v)
+            snap[k]=v
+        return snap
+
+    def Restore(self,snap):
+        for k,v in snap.items():
+            if type(v)==list:
+                v=list(v)
+            setattr(self,k,v)
+        #models keep a ref to the script that loaded them
+        self.models=[(*m[:4],self) if m else m for m in self.models]
+
     def Seg2(self,rom):
         UPH = (lambda x,y: struct.unpack(">H",x[y:y+2])[0])
         start=UPH(rom,0x3ac2)<<16
@@ -135,13 +158,8 @@ class Area():
 
 #tuple convert to hex
 def TcH(bytes):
-    a = struct.pack(">%dB"%len(bytes),*bytes)
-    if len(bytes)==4:
-        return struct.unpack(">L",a)[0]
-    if len(bytes)==2:
-        return struct.unpack(">H",a)[0]
-    if len(bytes)==1:
-        return struct.unpack(">B",a)[0]
+    if len(bytes) in (1,2,4):
+        return int.from_bytes(bytes,'big')
 
 def U2S(half):
     return struct.unpack(">h",struct.pack(">H",half))[0]
@@ -375,7 +393,6 @@ def ConvertEditorTexScrollsAlt(script,Obj,PB):
     return Obj
 
 def FormatScrollObject(scroll,verts,obj,s,area):
-    #not efficient at all, but number of scrolls is low and I'm lazy
     #vert = [seg ptr, rom ptr, num verts], sorted by seg ptrs
     if not verts:
         return None
@@ -384,16 +401,17 @@ def FormatScrollObject(scroll,verts,obj,s,area):
     offset=0
     #if verts are not in order, I can falsely assume the vert does not exist
     #becuase I see a gap and mistake it for the end of an area or something.
-    verts.sort(key=lambda x: x[0]) 
-    for v in verts:
-        if addr>=v[0]:
-            closest = v[0]
-            offset = addr-v[0]
-        if v[0]>addr:
-            if offset>0xf0:
-                offset=0xFF0
-                Log.InvalidScroll(s.Currlevel,area,scroll)
-            break
+    verts.sort(key=lambda x: x[0])
+    keys = [v[0] for v in verts]
+    #first vb past the scroll, the scroll is in the one before it
+    i = bisect.bisect_right(keys,addr)
+    if i<len(verts):
+        if i:
+            closest = verts[i-1][0]
+            offset = addr-closest
+        if offset>0xf0:
+            offset=0xFF0
+            Log.InvalidScroll(s.Currlevel,area,scroll)
     else:
         Log.InvalidScroll(s.Currlevel,area,scroll)
         closest=addr
@@ -421,11 +439,14 @@ def FormatScrollObject(scroll,verts,obj,s,area):
     obj[3]=scroll[3] #z
     obj[5]=Types[scroll[-2]] #ry
     obj[6]=scroll[-1] #rz
-    obj[4]=int(offset/0x10) #rx
+    obj[4]=offset//0x10 #rx
     obj[-3] = bparam
-    s.ScrollArray.append(['VB_%s_%d_0x%x'%(Num2Name[s.Currlevel],scroll[1],closest),int(offset/0x10)])
+    s.ScrollArray.append(['VB_%s_%d_0x%x'%(Num2Name[s.Currlevel],scroll[1],closest),offset//0x10])
     return obj
 
+#model id, pos, rot, bparam, bhv
+ObjectArgs = struct.Struct('>B6hLL')
+
 def PlaceObject(rom,cmd,start,script):
     arg=cmd[2]
     A=script.GetArea()
@@ -435,32 +456,26 @@ def PlaceObject(rom,cmd,start,script):
     #remove disabled objects
     if mask==0:
         return start
-    id=arg[1]
     #efficiency
-    x=U2S(TcH(arg[2:4]))
-    y=U2S(TcH(arg[4:6]))
-    z=U2S(TcH(arg[6:8]))
-    rx=U2S(TcH(arg[8:10]))
-    ry=U2S(TcH(arg[10:12]))
-    rz=U2S(TcH(arg[12:14]))
-    bparam=hex(TcH(arg[14:18]))
+    [id,x,y,z,rx,ry,rz,bparam,Baddr]=ObjectArgs.unpack_from(arg,1)
+    bparam=hex(bparam)
     #check for MOP stuff first
     for a,b in MOPObjAddr.items():
-        if (id,TcH(arg[18:22]))==a:
+        if (id,Baddr)==a:
             bhv=' bhv'+b[0]
             PO=[id,x,y,z,rx,ry,rz,bparam,bhv,mask]
             break
     else:
-        bhv=script.GetLabel("{:08x}".format(TcH(arg[18:22])))
-        if bhv in "0x{:08x}".format(TcH(arg[18:22])):
-            bhv = " Bhv_Custom_0x{:08x}".format(TcH(arg[18:22]))
+        bhv=script.GetLabel("{:08x}".format(Baddr))
+        if bhv in "0x{:08x}".format(Baddr):
+            bhv = " Bhv_Custom_0x{:08x}".format(Baddr)
             Log.UnkObject(script.Currlevel,script.CurrArea,bhv)
         PO=[id,x,y,z,rx,ry,rz,bparam,bhv,mask]
         if 'editor_Scroll_Texture' in bhv or 'RM_Scroll_Texture' in bhv:
             PO = ConvertTexScrolls(script,PO,rom)
     A.objects.append(PO)
     #for parsing later at the end
-    script.objects.append([*PO,script.CurrArea,TcH(arg[18:22])])
+    script.objects.append([*PO,script.CurrArea,Baddr])
     return start
 
 def MacroObjects(rom,cmd,start,script):
@@ -470,8 +485,9 @@ def MacroObjects(rom,cmd,start,script):
     A.macros = []
     x=0
     while(True):
-        m = BitArray(rom[macros+x:macros+x+10])
-        [yRot,Preset,X,Y,Z,Bp] = m.unpack("uint:7,uint:9,4*uint:16")
+        [m,X,Y,Z,Bp] = rom.Unpack('5H',macros+x)
+        yRot = m>>9
+        Preset = m&0x1FF
         if Preset<0x1F:
             break
         else:
@@ -539,22 +555,6 @@ def SetTerrain(rom,cmd,start,script):
         A.terrain=TcH(arg[1:2])
     return start
 
-def ULC(rom,start):
-    cmd = struct.unpack(">B",rom[start:start+1])[0]
-    len = struct.unpack(">B",rom[start+1:start+2])[0]
-    q=len-2
-    args = struct.unpack(">%dB"%q,rom[start+2:start+len])
-    return [cmd,len,args]
-
-#iterates through script until a cmd is found that
-#requires new action, then returns that cmd
-def PLC(rom,start):
-    (cmd,len,args) = ULC(rom,start)
-    start+=len
-    if cmd in jumps:
-        return (cmd,len,args,start)
-    return PLC(rom,start)
-
 def WriteModel(rom, dls, s, name, Hname, id, tdir):
     x = 0
     verts = None
@@ -580,7 +580,7 @@ def WriteModel(rom, dls, s, name, Hname, id, tdir):
         
     [refs, crcs] = F3D.ModelWrite(rom, ModelData, name, id, tdir, s.editor, s.Currlevel)
     modelH = name/'custom.model.inc.h'
-    mh = open(modelH,'w')
+    mh = Output.Open(modelH,'w')
     headgaurd="%s_HEADER_H"%(Hname)
     mh.write('#ifndef %s\n#define %s\n#include "types.h"\n'%(headgaurd,headgaurd))
     for r in refs:
@@ -709,7 +709,7 @@ def WriteLevelScript(name,Lnum,s,level,Anum,envfx):
     
     data = ""
     
-    f = open(name, 'w')
+    f = Output.Open(name, 'w')
     data += scriptHeader
     
     for a in Anum:
@@ -906,13 +906,14 @@ def WriteVanillaLevel(rom,s,num,areas,rootdir,m64dir,AllWaterBoxes,Onlys,romname
     name=Num2Name[num]
     level=Path(rootdir)/'levels'/("%s"%name)
     original = rootdir/'originals'/("%s"%name)
-    shutil.copytree(original,level)
+    #script.c gets rewritten below, copying it first would change it twice
+    Output.CopyTree(original,level,['script.c'])
     #open original script
     script = level / 'script.c'
-    scriptO = open(script,'r')
+    scriptO = open(original / 'script.c','r')
     Slines = scriptO.readlines()
     scriptO.close()
-    script = open(script,'w')
+    script = Output.Open(script,'w')
     #go until an area is found
     x=0 #line pos
     restrict = ['OBJECT','WARP_NODE','JUMP_LINK']
@@ -983,7 +984,9 @@ def WriteVanillaLevel(rom,s,num,areas,rootdir,m64dir,AllWaterBoxes,Onlys,romname
     [script.write(l) for l in Slines]
     return [AllWaterBoxes,m64s,seqNums]
 
-def WriteLevel(rom, s, num, areas, rootdir, m64dir, AllWaterBoxes, Onlys, romname, m64s, seqNums, MusicExtend):
+#writes everything that belongs to a single area. Levels don't share any of this,
+#so this part can run in a worker process. Returns envfx for WriteLevelFinish
+def WriteAreas(rom, s, num, areas, rootdir, m64dir, AllWaterBoxes, Onlys, romname, m64s, seqNums, MusicExtend, OptimizeCol):
     #create level directory
     WaterOnly = Onlys[0]
     ObjectOnly = Onlys[1]
@@ -992,7 +995,8 @@ def WriteLevel(rom, s, num, areas, rootdir, m64dir, AllWaterBoxes, Onlys, romnam
     name=Num2Name[num]
     level=  Path(rootdir)/'levels'/("%s" % name)
     original = rootdir/'originals'/("%s" % name)
-    shutil.copytree(original,level)
+    #header.h is rewritten by WriteLevelFinish
+    Output.CopyTree(original,level,[] if OnlySkip else ['header.h'])
     Areasdir = level/"areas"
     Areasdir.mkdir(exist_ok=True)
     
@@ -1035,13 +1039,14 @@ def WriteLevel(rom, s, num, areas, rootdir, m64dir, AllWaterBoxes, Onlys, romnam
                     s.MakeDec("Gfx DL_%s[]"%(id+hex(d[1])))
         #write collision file
         if not OnlySkip:
-            ColParse.ColWrite(adir/"custom.collision.inc.c",s,Arom,area.col,id)
+            CD = ColParse.ColWrite(adir/"custom.collision.inc.c",s,Arom,area.col,id,OptimizeCol)
+            Log.Partition(num,a,*CD.Partition(),CD.Optimized)
         s.MakeDec('const Collision col_%s[]'%(id+hex(area.col)))
         #write mov tex file
         if not (ObjectOnly or MusicOnly):
             #WB = [types][array of type][box data]
             MovTex = adir / "movtextNew.inc.c"
-            MovTex = open(MovTex,'w')
+            MovTex = Output.Open(MovTex,'w')
             Wrefs = []
             for k,Boxes in enumerate(WB):
                 wref = []
@@ -1062,6 +1067,16 @@ def WriteLevel(rom, s, num, areas, rootdir, m64dir, AllWaterBoxes, Onlys, romnam
                 s.MakeDec("struct MovtexQuadCollection %sMovtex_%d[]"%(id,j))
                 AllWaterBoxes.append(["%sMovtex_%d"%(id,j),num,a,j])
         print('finished area '+str(a)+ ' in level '+name)
+    return envfx
+
+#writes the level script, header and level files. Texture scroll objects are numbered
+#while writing the script, so this has to run in level order.
+def WriteLevelFinish(s, num, areas, rootdir, Onlys, envfx):
+    WaterOnly = Onlys[0]
+    MusicOnly = Onlys[2]
+    OnlySkip = any(Onlys)
+    name=Num2Name[num]
+    level=  Path(rootdir)/'levels'/("%s" % name)
     #now write level script
     if not (WaterOnly or MusicOnly):
         WriteLevelScript(level/"custom.script.c",name,s,s.levels[num],areas,envfx)
@@ -1069,7 +1084,7 @@ def WriteLevel(rom, s, num, areas, rootdir, m64dir, AllWaterBoxes, Onlys, romnam
     if not OnlySkip:
         #finally write header
         H=level/"header.h"
-        q = open(H,'w')
+        q = Output.Open(H,'w')
         headgaurd="%s_HEADER_H"%(name.upper())
         q.write('#ifndef %s\n#define %s\n#include "types.h"\n#include "game/moving_texture.h"\n'%(headgaurd,headgaurd))
         for h in s.header:
@@ -1080,7 +1095,7 @@ def WriteLevel(rom, s, num, areas, rootdir, m64dir, AllWaterBoxes, Onlys, romnam
         q.close()
         #append to geo.c, maybe the original works good always??
         G = level/"custom.geo.c"
-        g = open(G,'w')
+        g = Output.Open(G,'w')
         g.write(geocHeader)
         g.write('#include "levels/%s/header.h"\n'%name)
         for i,a in enumerate(areas):
@@ -1089,7 +1104,7 @@ def WriteLevel(rom, s, num, areas, rootdir, m64dir, AllWaterBoxes, Onlys, romnam
         g.close
         #write leveldata.c
         LD = level/"custom.leveldata.c"
-        ld = open(LD,'w')
+        ld = Output.Open(LD,'w')
         ld.write(ldHeader)
         Ftypes = ['custom.model.inc.c"\n','custom.collision.inc.c"\n']
         ld.write('#include "levels/%s/textureNew.inc.c"\n'%(name))
@@ -1099,7 +1114,6 @@ def WriteLevel(rom, s, num, areas, rootdir, m64dir, AllWaterBoxes, Onlys, romnam
             for Ft in Ftypes:
                     ld.write(start+Ft)
         ld.close
-    return [AllWaterBoxes,m64s,seqNums]
 
 #Finds out what model is based on seg addr and loaded banks
 def ProcessModel(rom,editor,s,modelID,model):
@@ -1268,6 +1282,121 @@ jumps = {
     0x39:MacroObjects
 }
 
+#size of each vanilla level cmd. The engine just trusts the length byte so that is what
+#gets followed, this is only used to count cmds that don't match vanilla.
+CmdLengths = [
+    0x10,0x10,0x04,0x04,0x04,0x08,0x08,0x04,0x04,0x04,0x04,0x08,0x0C,0x0C,0x08,0x04,
+    0x04,0x08,0x08,0x04,0x04,0x04,0x10,0x0C,0x0C,0x04,0x0C,0x04,0x04,0x04,0x04,0x08,
+    0x04,0x08,0x08,0x0C,0x18,0x0C,0x08,0x08,0x0C,0x04,0x04,0x0C,0x04,0x04,0x08,0x08,
+    0x04,0x04,0x04,0x08,0x04,0x04,0x08,0x04,0x04,0x08,0x10,0x10,0x04
+]
+
+#cmds that change where the script goes next, loops can only be formed through these
+FlowCmds = {0,1,2,5,6,7,12}
+
+#cmds whose result depends on which level is being exported (jump if level, area).
+#Everything the entry script does before the first of these is the same for every level.
+LevelCmds = {0x0C,0x1F}
+
+#A script that calls itself pushes a new frame every pass so its state never repeats.
+#The game's level script stack is 32 words, anything deeper than this is runaway recursion,
+#and no real script runs anywhere near this many cmds.
+MaxStack = 64
+MaxSteps = 1000000
+
+#(rom, entry, area offset, editor, banks) -> state of the script when it reached a LevelCmd
+EntryStates = {}
+
+#Runs a level script. Cmds with no handler in jumps are skipped without decoding them,
+#cmds with one get their args as a view into the rom. Loops are detected by remembering
+#the state (pc, stack, banks) at every control flow cmd instead of capping the cmd count.
+class LevelScript():
+    def __init__(self,rom,script):
+        self.rom=rom
+        self.script=script
+        #number of times each cmd was executed
+        self.Counts=[0]*256
+        #cmds whose length byte doesn't match vanilla
+        self.BadLengths=0
+        self.visited=set()
+        self.loop=False
+        self.pc=None
+
+    def State(self,pc):
+        s=self.script
+        banks=tuple(tuple(b) if b else None for b in s.banks)
+        return (pc,tuple(s.Stack),s.Base,s.Top,banks)
+
+    #run from entry until a cmd returns no next ptr, a loop is found (or the stack or
+    #cmd count runs away), or Stop(pc) is true after a handled cmd. Returns the last ptr.
+    def Run(self,entry,Stop=None,Pause=()):
+        rom=self.rom
+        script=self.script
+        Counts=self.Counts
+        pc=entry
+        steps=0
+        while(pc):
+            cmd=rom[pc]
+            #stop before running this cmd
+            if cmd in Pause:
+                break
+            size=rom[pc+1]
+            Counts[cmd]+=1
+            if cmd<0x3D and CmdLengths[cmd]!=size:
+                self.BadLengths+=1
+            #a zero length cmd would have the engine spin in place forever
+            if size<2:
+                pc=None
+                break
+            nxt=pc+size
+            steps+=1
+            if steps>MaxSteps or len(script.Stack)>MaxStack:
+                self.loop=True
+                pc=None
+                break
+            func=jumps.get(cmd)
+            if not func:
+                pc=nxt
+                continue
+            if cmd in FlowCmds:
+                state=self.State(pc)
+                if state in self.visited:
+                    self.loop=True
+                    pc=None
+                    break
+                self.visited.add(state)
+            pc=func(rom,(cmd,size,rom.View(pc+2,size-2),nxt),nxt,script)
+            if Stop and pc and Stop(pc):
+                break
+        self.pc=pc
+        return pc
+
+    #Same as Run, but the part of the script before the first LevelCmd is only ran
+    #once per rom and then restored from a snapshot. Only valid on a fresh script.
+    def Resume(self,entry):
+        s=self.script
+        banks=tuple(tuple(b) if b else None for b in s.banks)
+        key=(self.rom.name,entry,s.Aoffset,s.editor,banks)
+        snap=EntryStates.get(key)
+        if snap:
+            [state,pc,counts,visited,bad,pages]=snap
+            s.Restore(state)
+            self.Counts[:]=counts
+            self.visited=set(visited)
+            self.BadLengths=bad
+            #the rom reads of the entry script count for every level resumed from it
+            self.rom.Touch(pages)
+            return self.Run(pc)
+        prev=self.rom.Track()
+        try:
+            pc=self.Run(entry,Pause=LevelCmds)
+        finally:
+            pages=self.rom.Untrack(prev)
+        if not pc:
+            return pc
+        EntryStates[key]=[s.Snapshot(),pc,list(self.Counts),set(self.visited),self.BadLengths,pages]
+        return self.Run(pc)
+
 def RipNonLevelSeq(rom,m64s,seqNums,rootdir,MusicExtend,romname):
     m64dir = rootdir/'sound'/"sequences"/"us"
     os.makedirs(m64dir,exist_ok=True)
@@ -1292,7 +1421,7 @@ def RipSequence(rom,seqNum,m64Dir,Lnum,Anum,romname,MusicExtend):
     m64 = rom[gSeqFileHeader+offset:gSeqFileHeader+offset+len]
     m64File = m64Dir/("{1:02X}_Seq_{0}_custom.m64".format(romname,seqNum+MusicExtend))
     m64Name = "{1:02X}_Seq_{0}_custom".format(romname,seqNum+MusicExtend)
-    f = open(m64File,'wb')
+    f = Output.Open(m64File,'wb')
     f.write(m64)
     f.close()
     return [m64Name,seqNum+MusicExtend]
@@ -1309,7 +1438,7 @@ def CreateSeqJSON(rom,m64s,rootdir,MusicExtend):
     UPB = (lambda x,y: struct.unpack(">B",x[y:y+1])[0])
     UPH = (lambda x,y: struct.unpack(">h",x[y:y+2])[0])
     seqJSON = m64Dir/"sequences.json"
-    seqJSON = open(seqJSON,'w')
+    seqJSON = Output.Open(seqJSON,'w')
     last = 0
     for j,m64 in enumerate(m64s):
         bank = UPH(rom,seqMagic+(m64[1]-MusicExtend)*2)
@@ -1350,23 +1479,21 @@ def RipInstBanks(rom, rootdir):
         traceback.print_exc()
 
 def AppendAreas(entry,script,Append):
-    for rom,offset,editor in Append:
+    for i,(rom,offset,editor) in enumerate(Append):
         script.Aoffset = offset
         script.editor = editor
-        Arom=open(rom,'rb')
-        Arom = Arom.read()
+        Arom = Rom.Rom(rom)
         #get all level data from script
-        while(True):
-            #parse script until reaching special
-            q=PLC(Arom,entry)
-            #execute special cmd
-            entry = jumps[q[0]](Arom,q,q[3],script)
-            #check for end, then loop
-            if not entry:
-                break
+        vm = LevelScript(Arom,script)
+        #only the first pass starts from a fresh script
+        if i==0:
+            vm.Resume(entry)
+        else:
+            vm.Run(entry)
     return script
 
-def ExportLevel(rom, level, editor, Append, AllWaterBoxes, Onlys, romname, m64s, seqNums, MusicExtend, lvldefs):
+#run the level scripts of every rom for this level
+def ParseLevel(rom, level, editor, Append):
     #choose level
     s = Script(level)
     s.Seg2(rom)
@@ -1374,28 +1501,29 @@ def ExportLevel(rom, level, editor, Append, AllWaterBoxes, Onlys, romname, m64s,
     s = AppendAreas(entry, s, Append)
     s.Aoffset = 0
     s.editor = editor
+    #get all level data from script
+    vm = LevelScript(rom, s)
+    # If a cmd fails, then we found a empty level entry.
+    try:
+        if Append:
+            vm.Run(entry)
+        else:
+            vm.Resume(entry)
+    except:
+        pass
+    s.CmdCounts = vm.Counts
+    return [s,vm]
+
+#Parses a level and writes its areas. The rest is written by FinishLevel.
+def ExportLevelAreas(rom, level, editor, Append, AllWaterBoxes, Onlys, romname, m64s, seqNums, MusicExtend, OptimizeCol):
+    [s,vm] = ParseLevel(rom, level, editor, Append)
     rootdir = Path(sys.path[0])
     m64dir = rootdir/'sound'/"sequences"/"us"
     os.makedirs(m64dir, exist_ok=True)
     
-    #get all level data from script
-    x=0
-    while(True):
-        #parse script until reaching special
-        q = PLC(rom, entry)
-        # Execute special cmd
-        # If there is no entry. Then we found a empty level entry.
-        try:
-            entry = jumps[q[0]](rom, q, q[3], s)
-        except:
-            break
-        x += 1
-        #check for end, then loop
-        if not entry:
-            break
-        #you've hit a inf loop, usually in end screens with no level
-        if x > 10000:
-            return s
+    #you've hit a inf loop, usually in end screens with no level
+    if vm.loop:
+        return s
  
     #this tool isn't for exporting vanilla levels
     #so I export only objects for these levels
@@ -1406,13 +1534,42 @@ def ExportLevel(rom, level, editor, Append, AllWaterBoxes, Onlys, romname, m64s,
             traceback.print_exc()
         return s
 
+    #now do level
+    s.envfx = WriteAreas(rom, s, level,s.GetNumAreas(level), rootdir, m64dir, AllWaterBoxes,Onlys, romname, m64s, seqNums, MusicExtend, OptimizeCol)
+    return s
+
+def FinishLevel(s, level, Onlys, lvldefs):
+    #only custom levels get this far
+    if s.envfx==None:
+        return
     LevelName = {**Num2Name}
     lvldefs.write("DEFINE_LEVEL(%s,%s)\n" % (Num2Name[level], "LEVEL_" + Num2LevelName.get(level, 'castle').upper()))
-    
-    #now do level
-    [AllWaterBoxes, m64s, seqNums] = WriteLevel(rom, s, level,s.GetNumAreas(level), rootdir, m64dir, AllWaterBoxes,Onlys, romname, m64s, seqNums, MusicExtend)
+    WriteLevelFinish(s, level, s.GetNumAreas(level), Path(sys.path[0]), Onlys, s.envfx)
+
+def ExportLevel(rom, level, editor, Append, AllWaterBoxes, Onlys, romname, m64s, seqNums, MusicExtend, OptimizeCol, lvldefs):
+    s = ExportLevelAreas(rom, level, editor, Append, AllWaterBoxes, Onlys, romname, m64s, seqNums, MusicExtend, OptimizeCol)
+    FinishLevel(s, level, Onlys, lvldefs)
     return s
 
+#ExportLevelAreas in a worker process or for an incremental export. Everything that would
+#have been added to shared state is sent back so main can merge it in level order, along
+#with the pages of the rom that were read and the files that were written.
+def ExportLevelJob(rom, level, editor, Append, Onlys, romname, MusicExtend, OptimizeCol):
+    LogPrev = Log.Diag
+    Diag = Log.Reset()
+    AllWaterBoxes, m64s, seqNums = [], [], []
+    Out = Output.Checkpoint()
+    DLs = list(F3D.CacheStats)
+    prev = rom.Track()
+    try:
+        s = ExportLevelAreas(rom, level, editor, Append, AllWaterBoxes, Onlys, romname, m64s, seqNums, MusicExtend, OptimizeCol)
+        Output.Flush()
+    finally:
+        pages = rom.Untrack(prev)
+        Log.Diag = LogPrev
+    DLs = [a-b for a,b in zip(F3D.CacheStats,DLs)]
+    return [s, AllWaterBoxes, m64s, seqNums, Diag, pages, Output.Since(Out), DLs]
+
 class Actor():
     def __init__(self,aDir,actors):
         self.folders ={}
@@ -1449,7 +1606,7 @@ class Actor():
         
     def ParseModels(self,val,k,rom,fold):
         fgeo = fold/'custom.geo.inc.c'
-        fgeo = open(fgeo,'w')
+        fgeo = Output.Open(fgeo,'w')
         geos = []
         dls = []
         ids = []
@@ -1514,7 +1671,7 @@ class Actor():
                 pass
             return
         modelH = dir/'custom.model.inc.h'
-        mh = open(modelH,'w')
+        mh = Output.Open(modelH,'w')
         headgaurd="%s_HEADER_H"%(Hname)
         mh.write('#ifndef %s\n#define %s\n#include "types.h"\n'%(headgaurd,headgaurd))
         for r in refs:
@@ -1526,15 +1683,9 @@ class Actor():
         gc.collect()
         
     def CompareChecksums(self,crcs,id,fold):
-        if id not in ActorCHKSM.__dict__.keys():
+        if RefDB.Get().NewModel(id,crcs):
             Log.UnkModel(id,fold)
             return 1
-        else:
-            cksm = ActorCHKSM.__dict__.get(id)
-            for c in crcs:
-                if c not in cksm:
-                    Log.UnkModel(id,fold)
-                    return 1
         return 0
  
     #Hardcode power meter export. Only exporting textures
@@ -1699,11 +1850,11 @@ def ExportActorCol(col,reg,rom,ass,C):
         print('{} collision could not be exported. Invalid address'.format(cname))
 
 def checkCol(ColD,id,cdir,Bhv,reg,cname):
-    if id not in ColComp.__dict__.keys():
+    new = RefDB.Get().NewCollision(id,ColD)
+    if new==None:
         return 1
     else:
-        DictDat = ColComp.__dict__.get(id)
-        if not DictDat == ColD:
+        if new:
             Log.UnkCollision(id,cname,Bhv)
             return 1
         else:
@@ -1713,7 +1864,7 @@ def checkCol(ColD,id,cdir,Bhv,reg,cname):
             return 0
 
 def ExportFunctions(functions,rom,Bdir):
-    md=Cs(CS_ARCH_MIPS,CS_MODE_MIPS64+CS_MODE_BIG_ENDIAN)
+    md=capstone.Cs(capstone.CS_ARCH_MIPS,capstone.CS_MODE_MIPS64+capstone.CS_MODE_BIG_ENDIAN)
     # md.detail = True
     jumps=['jr','j']
     stop=0x1000
@@ -1800,11 +1951,11 @@ def ExportBhv(rom,o,bdata,bhv,check,f,editor):
     return [cols,funcs,new]
 
 def CompareBeh(BhvScript,bhv):
-    if bhv not in BehComp.__dict__.keys():
+    new = RefDB.Get().NewBehavior(bhv,BhvScript)
+    if new==None:
         return 1
 
-    BhvScr = ActorCHKSM.__dict__.get(bhv)
-    if not BhvScr == BhvScript:
+    if new:
         Log.NewObject(bhv)
         return 1
 
@@ -1829,7 +1980,7 @@ def FindCustomSkyboxse(rom,Banks,SB):
         if B[0]>0x1220000:
             custom[B[0]] = '_SkyboxCustom%d'%B[0]
     #make some skybox rules for the linker so it can find these
-    f = open(SB / 'Skybox_Rules.ld','w')
+    f = Output.Open(SB / 'Skybox_Rules.ld','w')
     for v in custom.values():
         f.write('   MIO0_SEG({}, 0x0A000000)\n'.format(v[1:]+"_skybox"))
     return custom
@@ -1838,14 +1989,14 @@ def ExportTextures(rom,editor,rootdir,Banks,inherit):
     s=Script(9)
     s.Seg2(rom)
     Textures = rootdir/"textures"
-    if os.path.isdir(Textures) and not inherit:
-        shutil.rmtree(Textures)
+    if not inherit:
+        Output.Clean(Textures)
     Textures.mkdir(exist_ok=True)
     #There are several different banks of textures, all are in bank 0xA or 0xB or 0x2
     #Editor and RM have different bank load locations, this is because editor didn't follow alignment
     #Seg2 func accounts for this by detecting the asm load, other banks will have to use different dicts
-    #Skyboxes are first. Each skybox has its own bank. This alg will export each skybox tile, then merge
-    #them into one skybox and delete them all. Its pretty slow.
+    #Skyboxes are first. Each skybox has its own bank of 8x8 tiles, they are decoded
+    #straight into one image per skybox.
     SB = Textures/'skyboxes'
     SB.mkdir(exist_ok=True)
     if editor:
@@ -1854,116 +2005,37 @@ def ExportTextures(rom,editor,rootdir,Banks,inherit):
         skyboxes = skyboxesRM
     #Check for custom skyboxes using Banks
     skyboxes = {**FindCustomSkyboxse(rom,Banks,SB),**skyboxes}
-    p = mp.Pool(mp.cpu_count())
+    #each skybox is one task for the pool
+    boxes = []
     for k,v in skyboxes.items():
-        imgs = []
         name = v.split('_')[1]
         if name=='cloud':
             name='cloud_floor'
-        imgs = p.starmap(ExportSkyTiles,[(SB,rom,v,k,i) for i in range(0x40)])
-        # for i in range(0x40):
-            # namet = v.split('_')[1]+str(i)
-            # box = BinPNG.MakeImage(str(SB / namet))
-            # bin = rom[k+i*0x800:k+0x800+i*0x800]
-            # BinPNG.RGBA16(32,32,bin,box)
-            # imgs.append(box)
-        FullBox = BinPNG.InitSkybox(str(SB / name))
-        for j,tile in enumerate(imgs):
-            x=(j*31)%248
-            y=int((j*31)/248)*31
-            BinPNG.TileSkybox(FullBox,x,y,tile)
-        FullBox.save(str(SB / (name+'.png')))
-        [os.remove(Path(img)) for img in imgs]
-        print('skybox %s done'%name)
+        boxes.append((BinPNG.Skybox,(rom[k:k+0x20000],str(SB / name))))
+    Workers.WriteImages(boxes)
+    for b in boxes:
+        print('skybox %s done'%os.path.basename(b[1][-1]))
     print('skyboxes done')
     ExportSeg2(rom,Textures,s)
 
-def ExportSkyTiles(SB,rom,v,k,i):
-    namet = v.split('_')[1]+str(i)
-    box = BinPNG.MakeImage(str(SB / namet))
-    bin = rom[k+i*0x800:k+0x800+i*0x800]
-    BinPNG.RGBA16(32,32,bin,box)
-    box.close()
-    return str(SB / (namet+'.png'))
-
 #segment 2
 def ExportSeg2(rom,Textures,s):
     Seg2 = Textures/'segment2'
     Seg2.mkdir(exist_ok=True)
-    #seg2 textures have a few sections. First is 16x16 HUD glyphs. 0x200 each
-    nameOff=0
-    for tex in range(0,0x4A00,0x200):
-        if tex in Seg2Glpyhs:
-            nameOff+=Seg2Glpyhs[tex]
-        gname = 'segment2.{:05X}.rgba16'.format(tex+nameOff)
-        glyph = BinPNG.MakeImage(str(Seg2 / gname))
-        loc = s.B2P(0x02000000+tex)
-        bin = rom[loc:loc+0x200]
-        BinPNG.RGBA16(16,16,bin,glyph)
-    #cam glyphs are separate
-    nameOff=0xb50
-    for tex in range(0x7000,0x7600,0x200):
-        gname = 'segment2.{:05X}.rgba16'.format(tex+nameOff)
-        glyph = BinPNG.MakeImage(str(Seg2 / gname))
-        loc = s.B2P(0x02000000+tex)
-        bin = rom[loc:loc+0x200]
-        BinPNG.RGBA16(16,16,bin,glyph)
-    #cam up/down are 8x8
-    for tex in range(0x7600,0x7700,0x80):
-        gname = 'segment2.{:05X}.rgba16'.format(tex+nameOff)
-        glyph = BinPNG.MakeImage(str(Seg2 / gname))
-        loc = s.B2P(0x02000000+tex)
-        bin = rom[loc:loc+0x80]
-        BinPNG.RGBA16(8,8,bin,glyph)
-    #Now exporting dialog chars. They are 16x8 IA4. 0x40 in length each.
-    for char in range(0x5900,0x7000,0x40):
-        gname = 'font_graphics.{:05X}.ia4'.format(char)
-        glyph = BinPNG.MakeImage(str(Seg2 / gname))
-        loc = s.B2P(0x02000000+char)
-        bin = rom[loc:loc+0x40]
-        BinPNG.IA(16,8,4,bin,glyph)
-    #now credits font. Its 8x8 rgba16, 0x80 length each
-    nameOff=0x6200-0x4A00
-    for char in range(0x4A00,0x5900,0x80):
-        #the names are offset from actual loc
-        gname = 'segment2.{:05X}.rgba16'.format(char+nameOff)
-        glyph = BinPNG.MakeImage(str(Seg2 / gname))
-        loc = s.B2P(0x02000000+char)
-        bin = rom[loc:loc+0x80]
-        BinPNG.RGBA16(8,8,bin,glyph)
-    #shadows. 16x16 IA8. 0x100 len
-    names = ['shadow_quarter_circle','shadow_quarter_square']
-    for char in range(2):
-        gname = '{}.ia4'.format(names[char])
-        glyph = BinPNG.MakeImage(str(Seg2 / gname))
-        loc = s.B2P(0x02000000+char*0x100+0x120b8)
-        bin = rom[loc:loc+0x100]
-        BinPNG.IA(16,16,8,bin,glyph)
-    #warp transitions. 32x64 or 64x64. I will grab data from arr for these
-    for warp in Seg2WarpTransDat:
-        gname = 'segment2.{}.ia4'.format(warp[1])
-        glyph = BinPNG.MakeImage(str(Seg2 / gname))
-        loc = s.B2P(0x02000000+warp[0])
-        bin = rom[loc:loc+warp[3]]
-        BinPNG.IA(*warp[2],8,bin,glyph)
-    #last in seg2 is water boxes. These are all rgba16 32x32 except mist which is IA16
-    nameOff=0x11c58-0x14AB8
-    for tex in range(5):
-        TexLoc = (tex*0x800+0x14AB8)
-        if tex==3:
-            gname = 'segment2.{:05X}.ia16'.format(TexLoc+nameOff)
-        else:
-            gname = 'segment2.{:05X}.rgba16'.format(TexLoc+nameOff)
-        glyph = BinPNG.MakeImage(str(Seg2 / gname))
-        loc = s.B2P(0x02000000+TexLoc)
-        bin = rom[loc:loc+0x800]
-        if tex==3:
-            BinPNG.IA(32,32,16,bin,glyph)
-        else:
-            BinPNG.RGBA16(32,32,bin,glyph)
+    ExportTextureManifest(rom,s,2,Seg2,Seg2Textures)
+
+#decode every texture in manifest from segment seg into pngs in dir, all in one batch for the pool.
+#manifest = [[name, segment offset, format, bit depth, (width, height)],...]
+def ExportTextureManifest(rom,s,seg,dir,manifest):
+    imgs = []
+    for name,off,fmt,depth,size in manifest:
+        loc = s.B2P((seg<<24)+off)
+        bin = rom[loc:loc+size[0]*size[1]*depth//8]
+        imgs.append((getattr(BinPNG,fmt),(*size,depth,bin,str(dir / name))))
+    Workers.WriteImages(imgs)
 
 def ExportInternalName(rom,src):
-    IntNameS = open(src/'internal_name.s','w')
+    IntNameS = Output.Open(src/'internal_name.s','w')
     IntNameS.write(".byte ")
     for i in range(20):
         comma = ','*(i!=19)
@@ -1973,7 +2045,7 @@ def ExportTextureScrolls(Scripts,rootdir):
     game = rootdir/'src'/'game'
     os.makedirs(game,exist_ok=True)
     ST = game/'ScrollTargets.inc.c'
-    ST = open(ST,'w')
+    ST = Output.Open(ST,'w')
     ST.write(ScrollTargetHead)
     x=0
     arr = []
@@ -1999,7 +2071,7 @@ def ExportMisc(rom,rootdir,editor):
     Trajectory = misc/('Trajectories.inc.c')
     #Trajectories are by default in the level bank, but moved to vram for all hacks
     #If your trajectory does not follow this scheme, then too bad
-    Trj = open(Trajectory,'w')
+    Trj = Output.Open(Trajectory,'w')
     Trj.write("""#include <PR/ultratypes.h>
 #include "level_misc_macros.h"
 #include "macros.h"
@@ -2058,7 +2130,7 @@ def ExportMisc(rom,rootdir,editor):
         Trj.write(NewTraj)
             
     #Star positions
-    SP = open(StarPos,'w')
+    SP = Output.Open(StarPos,'w')
     #pre editor and post editor do star positions completely different.
     #I will only be supporting post editor as the only pre editor hack people care
     #about is sm74 which I already ported.
@@ -2082,7 +2154,7 @@ def ExportMisc(rom,rootdir,editor):
     #some hacks move this so I want to put a stop in just in case
     stop=ItemBox+0x800
     IBox = misc/('Item_Box.inc.c')
-    IBox = open(IBox,'w')
+    IBox = Output.Open(IBox,'w')
     IBox.write("""#include <PR/ultratypes.h>
 #include "behavior_actions.h"
 #include "macros.h"
@@ -2113,7 +2185,7 @@ def ExportMisc(rom,rootdir,editor):
 def ExportTweaks(rom,rootdir):
     misc = rootdir/'src'/'game'
     os.makedirs(misc,exist_ok=True)
-    twk = open(misc/'tweaks.inc.c','w')
+    twk = Output.Open(misc/'tweaks.inc.c','w')
     twk.write("""//This is a series of defines to edit commonly changed parameters in romhacks
 //These are commonly referred to as tweaks
 """)
@@ -2149,13 +2221,12 @@ def ExportText(rom,rootdir,TxtAmt):
     text = rootdir/"text"/'us'
     os.makedirs(text,exist_ok=True)
     textD = text/("dialogs.h")
-    textD = open(textD,'w',encoding="utf-8")
+    textD = Output.Open(textD,'w',encoding="utf-8")
     UPW = (lambda x,y: struct.unpack(">L",x[y:y+4])[0])
     #format is u32 unused, u8 lines/box, u8 pad, u16 X, u16 width, u16 pad, offset
-    DialogFmt = "int:32,2*uint:8,3*uint:16,uint:32"
+    DialogFmt = "lBBHHHL"
     for dialog in range(0,TxtAmt*16,16):
-        StrSet = BitArray(rom[DiaTbl+dialog:DiaTbl+16+dialog])
-        StrSet = StrSet.unpack(DialogFmt)
+        StrSet = rom.Unpack(DialogFmt,DiaTbl+dialog)
         #mio0 compression messes with banks and stuff it just werks
         Mtxt = s.B2P(StrSet[6])
         str = ""
@@ -2171,7 +2242,7 @@ def ExportText(rom,rootdir,TxtAmt):
     #now do courses
     courses = text/("courses.h")
     LevelNames = 0x8140BE
-    courses = open(courses,'w',encoding="utf-8")
+    courses = Output.Open(courses,'w',encoding="utf-8")
     for course in range(26):
         name = s.B2P(UPW(rom,course*4+LevelNames))
         str = ""
@@ -2225,7 +2296,7 @@ def ExportWaterBoxes(AllWaterBoxes,rootdir):
     if not AllWaterBoxes:
         print("no water boxes")
         return
-    MTinc = open(MovtexEdit,'w')
+    MTinc = Output.Open(MovtexEdit,'w')
     MTinc.write(infoMsg)
     for a in AllWaterBoxes:
         MTinc.write("extern u8 "+a[0]+"[];\n")
@@ -2289,16 +2360,11 @@ def ExportTitleScreen(rom,level):
     s.Seg2(rom)
     entry = 0x108A10
     #get all level data from script
-    while(True):
-        #parse script until reaching special
-        q=PLC(rom,entry)
-        #execute special cmd
-        entry = jumps[q[0]](rom,q,q[3],s)
-        #I assume no one messed with the entry script
-        #or else this will fail hard. I have to exit manually
-        #early because the title screen is overwritten quickly
-        if entry>=2531020:
-            break
+    vm = LevelScript(rom,s)
+    #I assume no one messed with the entry script
+    #or else this will fail hard. I have to exit manually
+    #early because the title screen is overwritten quickly
+    entry = vm.Run(entry,lambda pc: pc>=2531020)
     #somehow title screens have issues
     try:
         Rtitleptr = s.B2P(titleptr)
@@ -2309,41 +2375,27 @@ def ExportTitleScreen(rom,level):
     WriteModel(rom,[[Rtitleptr,titleptr]],s,intro,'TITLESCREEN','intro_seg7_',intro)
     #Make leveldata.c for intro
     ld = intro/ 'leveldata.c'
-    ld = open(ld,'w')
+    ld = Output.Open(ld,'w')
     ld.write(TitleStrFormatter.format('DL_intro_seg7_0x%x'%titleptr))
     ld.close()
     #Export file/star select textures manually
     #continue script parsing until new bank 7 is reached
-    while(True):
-        #parse script until reaching special
-        q=PLC(rom,entry)
-        #execute special cmd
-        entry = jumps[q[0]](rom,q,q[3],s)
-        #I assume no one messed with the entry script
-        #or else this will fail hard. I have to exit manually
-        #early because the title screen is overwritten quickly
-        if entry>=0x2abca0:
-            break
+    vm.Run(entry,lambda pc: pc>=0x2abca0)
     menu = level/'menu'
     menu.mkdir(exist_ok=True)
-    #format is name,seg addr,size, binsize. All textures are RGBA16 fmt
-    for tex in Seg7Textures:
-        img = BinPNG.MakeImage(str(menu / tex[0]))
-        loc= s.B2P(0x07000000+tex[1])
-        bin = rom[loc:loc+tex[3]]
-        BinPNG.RGBA16(*tex[2],bin,img)
+    ExportTextureManifest(rom,s,7,menu,MenuTextures)
 
 
 def main(levels = [], actors = [], editor = False, rom = '', Append = [], WaterOnly = 0, ObjectOnly = 0,
 MusicOnly = 0, MusicExtend = 0, Text = None, Misc = None, Textures = 0, Inherit = 0, Upscale = 0,
-Title = 0, Sound = 0, Objects = 0):
+Title = 0, Sound = 0, Objects = 0, Jobs = 1, Incremental = 0, OptimizeCol = 0):
     #This is not an arg you should edit really
     TxtAmount = 170
     romname = rom.split(".")[0]
     fullromname = rom
-    rom = open(rom, 'rb')
-    rom = rom.read()
+    rom = Rom.Rom(rom)
     root = sys.path[0]
+    Output.Begin()
     
     # Correct our string params
     if type(levels)==str:
@@ -2356,8 +2408,7 @@ Title = 0, Sound = 0, Objects = 0):
     #Export dialogs and course names
     if (Text or levels=='all') and Text != 0:
         for A in Append:
-            Arom = open(A[0],'rb')
-            Arom = Arom.read()
+            Arom = Rom.Rom(A[0])
             ExportText(Arom,Path(root),TxtAmount)
         ExportText(rom,Path(root),TxtAmount)
         print('Text Finished')
@@ -2365,8 +2416,7 @@ Title = 0, Sound = 0, Objects = 0):
     #Export misc data like trajectories or star positions.
     if (Misc or levels=='all') and Misc != 0:
         for A in Append:
-            Arom = open(A[0],'rb')
-            Arom = Arom.read()
+            Arom = Rom.Rom(A[0])
             ExportMisc(Arom,Path(root),A[2])
         ExportMisc(rom,Path(root),editor)
         print('Misc Finished')
@@ -2377,43 +2427,94 @@ Title = 0, Sound = 0, Objects = 0):
     seqNums = []
     Onlys = [WaterOnly,ObjectOnly,MusicOnly]
     
-    #clean sound dir
+    #levels are only exported again if what they read from the rom changed
+    Incremental = int(Incremental)
+    OptimizeCol = int(OptimizeCol)
+    if Incremental:
+        ManName = Path(root) / Manifest.FileName
+        Man = Manifest.Load(ManName, Manifest.Key(editor, Append, Onlys, romname, MusicExtend, OptimizeCol))
+
+    #clean sound dir. Files aren't deleted up front, the ones that weren't written
+    #again are removed at the end so unchanged files keep their mtimes
     sound = Path(root) / 'sound'
     if not Inherit:
-        if os.path.isdir(sound):
-            shutil.rmtree(sound)
+        Output.Clean(sound)
  
     #custom level defines file so the linker knows whats up. Mandatory or export won't work
     lvldir = Path(root) / 'levels'
 
     #So you don't have truant level folders from a previous export
     if not Inherit:
-        if os.path.isdir(lvldir):
-            shutil.rmtree(lvldir)
+        Output.Clean(lvldir)
  
     lvldir.mkdir(exist_ok=True)
     lvldefs = lvldir/"custom_level_defines.h"
-    lvldefs = open(lvldefs,'w')
+    lvldefs = Output.Open(lvldefs,'w')
         
     ass=Path("actors")
     ass=Path(root)/ass
     if not Inherit and (actors or Objects):
-        if os.path.isdir(ass):
-            shutil.rmtree(ass)
+        Output.Clean(ass)
     ass.mkdir(exist_ok=True)
     
     #Array of all scripts from each level
     Scripts = []
     if levels=='all':
-        for k in Num2Name.keys():
-            s = ExportLevel(rom, k, editor, Append, AllWaterBoxes, Onlys, romname, m64s, seqNums, MusicExtend, lvldefs)
+        Lnums = list(Num2Name.keys())
+    else:
+        Lnums = [k for k in levels if Num2Name.get(k)]
+    #DLs and geo layouts decoded by an earlier export in this process don't count
+    if Lnums or actors:
+        F3D.ResetCache()
+        GW.ResetCache()
+    Jobs = int(Jobs)
+    if (Jobs>1 and len(Lnums)>1) or Incremental:
+        #level -> result of ExportLevelJob
+        res = {}
+        if Incremental:
+            for k in Lnums:
+                r = Man.Get(rom, k, root)
+                if r:
+                    res[k] = r
+        todo = [k for k in Lnums if k not in res]
+        pooled = []
+        args = [(rom, k, editor, Append, Onlys, romname, MusicExtend, OptimizeCol) for k in todo]
+        #areas of each level are written by the workers, everything shared
+        #is merged here in level order so the output matches a serial run
+        if Jobs>1 and len(todo)>1:
+            p = mp.Pool(min(Jobs,len(todo)))
+            res.update(zip(todo,p.starmap(ExportLevelJob,args)))
+            p.close()
+            pooled = todo
+        else:
+            res.update(zip(todo,[ExportLevelJob(*a) for a in args]))
+        for k in Lnums:
+            [s,WB,Lm64s,LseqNums,Diag,pages,[written,counts],DLs] = res[k]
+            Output.Mark(written,counts if k in pooled else None)
+            if k in pooled:
+                F3D.CacheStats[0] += DLs[0]
+                F3D.CacheStats[1] += DLs[1]
+            AllWaterBoxes.extend(WB)
+            for m64,seqNum in zip(Lm64s,LseqNums):
+                if m64 not in m64s:
+                    m64s.append(m64)
+                    seqNums.append(seqNum)
+            Log.Diag.Merge(Diag)
+            if Incremental and k in todo:
+                files = [os.path.join('levels',Num2Name[k])]+[os.path.join('sound','sequences','us',m+'.m64') for m in Lm64s]
+                Man.Set(rom, k, pages, [f for f in files if os.path.exists(os.path.join(root,f))], res[k])
+            FinishLevel(s, k, Onlys, lvldefs)
             Scripts.append(s)
-            print(Num2Name[k] + ' done')
+            if k in todo:
+                print(Num2Name[k] + ' done')
+            else:
+                print(Num2Name[k] + ' unchanged')
+        if Incremental:
+            Manifest.Save(Man, ManName)
+        del res
     else:
-        for k in levels:
-            if not Num2Name.get(k):
-                continue
-            s = ExportLevel(rom, k, editor, Append, AllWaterBoxes, Onlys, romname, m64s, seqNums, MusicExtend, lvldefs)
+        for k in Lnums:
+            s = ExportLevel(rom, k, editor, Append, AllWaterBoxes, Onlys, romname, m64s, seqNums, MusicExtend, OptimizeCol, lvldefs)
             Scripts.append(s)
             print(Num2Name[k] + ' done')
  
@@ -2453,8 +2554,19 @@ Title = 0, Sound = 0, Objects = 0):
         if Sound:
             RipInstBanks(fullromname, Path(root))
  
+    Workers.Close()
+    Output.Flush()
+    Output.Prune()
+    print('{} files written, {} unchanged'.format(*Output.Stats))
+    if Lnums or actors:
+        [hits,misses] = F3D.CacheStats
+        if hits+misses:
+            print('{} of {} DLs were already decoded ({:.0%} cache hits)'.format(hits,hits+misses,hits/(hits+misses)))
     Log.WriteWarnings()
     print('Export Completed, see ImportInstructions.py for potential errors when importing to decomp')
+    rss = Rom.PeakRSS()
+    if rss:
+        print('Peak memory use {:.1f} MB'.format(rss))
 
 if __name__=='__main__':
     argD = {}
@@ -2462,8 +2574,17 @@ if __name__=='__main__':
     for arg in sys.argv[1:]:
         args+=arg+" "
     try:
-        #the utmosts of cringes
+        #-j N is the same as Jobs=N
+        argv = []
         for arg in sys.argv:
+            if argv and argv[-1]=='-j':
+                argv[-1] = 'Jobs='+arg
+            elif arg.startswith('-j'):
+                argv.append('Jobs='+arg[2:] if arg[2:] else arg)
+            else:
+                argv.append(arg)
+        #the utmosts of cringes
+        for arg in argv:
             if arg=='RM2C.py':
                 continue
             arg = arg.split('=')
@@ -117,6 +117,51 @@ Seg2WarpTransDat=[
 	[0x132b8,'10458',(64,64),0x1000],
 	[0x142b8,'11458',(32,64),0x800]]
 
+#Texture manifests, exported by ExportTextureManifest in one batch.
+#[name, segment offset, format, bit depth, (width, height)]
+def Seg2Manifest():
+	textures=[]
+	#seg2 textures have a few sections. First is 16x16 HUD glyphs. 0x200 each
+	nameOff=0
+	for tex in range(0,0x4A00,0x200):
+		if tex in Seg2Glpyhs:
+			nameOff+=Seg2Glpyhs[tex]
+		textures.append(['segment2.{:05X}.rgba16'.format(tex+nameOff),tex,'RGBA',16,(16,16)])
+	#cam glyphs are separate
+	nameOff=0xb50
+	for tex in range(0x7000,0x7600,0x200):
+		textures.append(['segment2.{:05X}.rgba16'.format(tex+nameOff),tex,'RGBA',16,(16,16)])
+	#cam up/down are 8x8
+	for tex in range(0x7600,0x7700,0x80):
+		textures.append(['segment2.{:05X}.rgba16'.format(tex+nameOff),tex,'RGBA',16,(8,8)])
+	#dialog chars are 16x8 IA4
+	for char in range(0x5900,0x7000,0x40):
+		textures.append(['font_graphics.{:05X}.ia4'.format(char),char,'IA',4,(16,8)])
+	#credits font is 8x8 rgba16, the names are offset from actual loc
+	nameOff=0x6200-0x4A00
+	for char in range(0x4A00,0x5900,0x80):
+		textures.append(['segment2.{:05X}.rgba16'.format(char+nameOff),char,'RGBA',16,(8,8)])
+	#shadows. 16x16 IA8
+	for char,name in enumerate(['shadow_quarter_circle','shadow_quarter_square']):
+		textures.append(['{}.ia4'.format(name),char*0x100+0x120b8,'IA',8,(16,16)])
+	#warp transitions. 32x64 or 64x64 IA8
+	for warp in Seg2WarpTransDat:
+		textures.append(['segment2.{}.ia4'.format(warp[1]),warp[0],'IA',8,warp[2]])
+	#last are water boxes. These are all rgba16 32x32 except mist which is IA16
+	nameOff=0x11c58-0x14AB8
+	for tex in range(5):
+		TexLoc = (tex*0x800+0x14AB8)
+		if tex==3:
+			textures.append(['segment2.{:05X}.ia16'.format(TexLoc+nameOff),TexLoc,'IA',16,(32,32)])
+		else:
+			textures.append(['segment2.{:05X}.rgba16'.format(TexLoc+nameOff),TexLoc,'RGBA',16,(32,32)])
+	return textures
+
+Seg2Textures=Seg2Manifest()
+
+#file/star select textures in seg 7
+MenuTextures=[[t[0],t[1],'RGBA',16,t[2]] for t in Seg7Textures]
+
 #name of actor group, bank gfx is in, bank geo is in
 #for gfx it goes:
 #LOAD_MIO0(bank,'_'+str+'_mio0SegmentRomStart',same w/ end)
@@ -2109,7 +2154,7 @@ HelpMsg="""
 ------------------Invalid Input - Error ------------------
 
 Arguments for RM2C are as follows:
-RM2C.py, rom="romname", editor=False, levels=[] , actors=[], Append=[(rom,areaoffset,editor),...] WaterOnly=0 ObjectOnly=0 MusicOnly=0 MusicExtend=0 Text=0 Misc=0 Textures=0 Inherit=0 Upscale=0 Title=0 Sound=0 Objects=0
+RM2C.py, rom="romname", editor=False, levels=[] , actors=[], Append=[(rom,areaoffset,editor),...] WaterOnly=0 ObjectOnly=0 MusicOnly=0 MusicExtend=0 Text=0 Misc=0 Textures=0 Inherit=0 Upscale=0 Title=0 Sound=0 Objects=0 Jobs=1 Incremental=0 OptimizeCol=0
 
 Arguments with equals sign are shown in default state, do not put commas between args.
 Levels accept any list argument or only the string 'all'. Append is for when you want to combine multiple roms. The appended roms will be use the levels of the original rom, but use the areas of the appended rom with an offset. You must have at least one level to export assets because the script needs to read the model load cmds to find pointers to data.
@@ -2122,6 +2167,9 @@ Inherit is a file management arg for when dealing with multiple roms. Normal beh
 Title exports the title screen. This will also be exported if levels='all'
 Sound will export instrument bank and sound sample data. It does not seem to work with custom samples well.
 Upscale is an option to use ESRGAN ai upscaling to increase texture size. The upscaled textures will generate #ifdefs in each model file for non N64 targeting to compile them instead of the original textures.
+Jobs is the number of processes used to export levels, -j N also works. Output is the same as with Jobs=1.
+Incremental only exports levels again if the parts of the rom they read changed since the last Incremental export.
+OptimizeCol cleans up level collision before writing it, welding duplicate verts and merging tris that together form one tri. The surfaces cover the same area.
 
 
 Example input1 (all actor models in BoB):
@@ -0,0 +1,93 @@
+#Reference database of vanilla content, compiled from the ActorCHKSM, BehComp and ColComp
+#data modules. Those stay the source of truth (they are what gets regenerated when
+#collecting new data), this just turns them into sets and fingerprints so each comparison
+#is a single hash lookup. The compiled db is pickled next to this file and keyed on the
+#hashes of the data modules, so it rebuilds itself whenever one of them changes.
+import importlib
+import importlib.util
+import hashlib
+import pickle
+import os
+
+#bump when the layout of the pickled db changes
+DBVersion = 1
+
+Sources = ['ActorCHKSM','BehComp','ColComp']
+
+DBFile = os.path.join(os.path.dirname(os.path.abspath(__file__)),'RefDB.pickle')
+
+#whitespace differs between the stored scripts and what BhvParse writes
+#(tabs for loops, ', ' between args) so it is dropped before hashing
+def Fingerprint(BhvScript):
+    cmds = ["".join(c.split()) for c in BhvScript]
+    return hashlib.sha1("\n".join(cmds).encode()).digest()
+
+def Entries(mod):
+    return {k:v for k,v in mod.__dict__.items() if not k.startswith('__') and type(v)==list}
+
+class RefDB():
+    def __init__(self,ActorCHKSM,BehComp,ColComp):
+        #model id -> set of texture checksums
+        self.Checksums = {k:frozenset(v) for k,v in Entries(ActorCHKSM).items()}
+        #behavior name without the leading space -> fingerprint of its script
+        self.Behaviors = {k:Fingerprint(v) for k,v in Entries(BehComp).items()}
+        #collision id -> (start, end, num verts)
+        self.Collisions = {k:tuple(v) for k,v in Entries(ColComp).items()}
+
+    #0 if every checksum is a known one for this model
+    def NewModel(self,id,crcs):
+        cksm = self.Checksums.get(id)
+        if cksm is None:
+            return 1
+        return int(not cksm.issuperset(crcs))
+
+    #None if the behavior isn't vanilla, otherwise 0/1 for same/edited
+    def NewBehavior(self,bhv,BhvScript):
+        fp = self.Behaviors.get(bhv.strip())
+        if fp is None:
+            return None
+        return int(fp!=Fingerprint(BhvScript))
+
+    #None if the collision isn't vanilla, otherwise 0/1 for same/edited
+    def NewCollision(self,id,ColD):
+        col = self.Collisions.get(id)
+        if col is None:
+            return None
+        return int(col!=tuple(ColD))
+
+def SourceKey():
+    key = [DBVersion]
+    for s in Sources:
+        f = open(importlib.util.find_spec(s).origin,'rb')
+        key.append(hashlib.sha1(f.read()).hexdigest())
+        f.close()
+    return key
+
+def Build():
+    return RefDB(*[importlib.import_module(s) for s in Sources])
+
+DB = None
+
+#loaded on first use, rebuilt from the data modules if they changed
+def Get():
+    global DB
+    if DB:
+        return DB
+    key = SourceKey()
+    try:
+        f = open(DBFile,'rb')
+        [ckey,db] = pickle.load(f)
+        f.close()
+        if ckey==key:
+            DB = db
+            return DB
+    except:
+        pass
+    DB = Build()
+    try:
+        f = open(DBFile,'wb')
+        pickle.dump([key,DB],f,protocol=pickle.HIGHEST_PROTOCOL)
+        f.close()
+    except:
+        pass
+    return DB
@@ -0,0 +1,149 @@
+#Memory mapped rom. The rom used to be read into one big bytes object and then
+#copied around, including into every pool task. This maps the file instead, so
+#only the pages that are actually touched get read. Slicing returns bytes just
+#like before, the typed readers unpack straight out of the map with no copies.
+import mmap
+import hashlib
+import struct
+import os
+
+#precompiled big endian formats, all N64 data is big endian
+U8 = struct.Struct('>B')
+S8 = struct.Struct('>b')
+U16 = struct.Struct('>H')
+S16 = struct.Struct('>h')
+U32 = struct.Struct('>L')
+S32 = struct.Struct('>l')
+F32 = struct.Struct('>f')
+
+Structs = {}
+
+#reads are recorded per page of this many bits, see Track
+PageBits = 12
+
+def GetStruct(fmt):
+    s = Structs.get(fmt)
+    if not s:
+        if fmt[0] not in '<>!=@':
+            fmt = '>'+fmt
+        s = struct.Struct(fmt)
+        Structs[fmt] = s
+    return s
+
+class Rom():
+    def __init__(self,name):
+        self.name = os.path.abspath(name)
+        f = open(self.name,'rb')
+        self.map = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+        f.close()
+        self.view = memoryview(self.map)
+        #pages read since Track, None when nothing is being recorded
+        self.Pages = None
+
+    #rom[x] gives an int and rom[x:y] gives bytes, same as a bytes object
+    def __getitem__(self,key):
+        if self.Pages is not None:
+            #negative indices count from the end, record the pages they really are
+            if type(key)==slice:
+                r = range(*key.indices(len(self)))
+                if r:
+                    self.Read(min(r[0],r[-1]),abs(r[-1]-r[0])+1)
+            else:
+                self.Read(key+len(self) if key<0 else key,1)
+        return self.map[key]
+
+    def __len__(self):
+        return len(self.map)
+
+    #sending the rom to a pool worker reopens the file instead of pickling its contents
+    def __reduce__(self):
+        return (Rom,(self.name,))
+
+    #Start recording which pages of the rom get read. Returns what was being
+    #recorded before, which Untrack needs so recordings can be nested.
+    def Track(self):
+        prev = self.Pages
+        self.Pages = set()
+        return prev
+
+    #stop recording and return the pages read since Track, they also count as read for prev
+    def Untrack(self,prev):
+        pages = self.Pages
+        if prev is not None:
+            prev.update(pages)
+        self.Pages = prev
+        return pages
+
+    def Read(self,off,size):
+        if self.Pages is not None and size>0:
+            self.Pages.update(range(off>>PageBits,((off+size-1)>>PageBits)+1))
+
+    #count pages read somewhere else (e.g. by a cached result) as read now
+    def Touch(self,pages):
+        if self.Pages is not None:
+            self.Pages.update(pages)
+
+    #zero copy window into the rom
+    def View(self,start,size):
+        self.Read(start,size)
+        return self.view[start:start+size]
+
+    def U8(self,off):
+        self.Read(off,1)
+        return self.map[off]
+
+    def S8(self,off):
+        self.Read(off,1)
+        return S8.unpack_from(self.map,off)[0]
+
+    def U16(self,off):
+        self.Read(off,2)
+        return U16.unpack_from(self.map,off)[0]
+
+    def S16(self,off):
+        self.Read(off,2)
+        return S16.unpack_from(self.map,off)[0]
+
+    def U32(self,off):
+        self.Read(off,4)
+        return U32.unpack_from(self.map,off)[0]
+
+    def S32(self,off):
+        self.Read(off,4)
+        return S32.unpack_from(self.map,off)[0]
+
+    def F32(self,off):
+        self.Read(off,4)
+        return F32.unpack_from(self.map,off)[0]
+
+    #one struct at off, fmt is big endian unless it says otherwise
+    def Unpack(self,fmt,off):
+        s = GetStruct(fmt)
+        self.Read(off,s.size)
+        return s.unpack_from(self.map,off)
+
+    #num structs laid out back to back starting at off
+    def Array(self,fmt,off,num):
+        s = GetStruct(fmt)
+        self.Read(off,s.size*num)
+        return list(s.iter_unpack(self.view[off:off+s.size*num]))
+
+    #hash of the given pages, changes if any byte in them does
+    def PageHash(self,pages):
+        h = hashlib.sha1()
+        for p in sorted(pages):
+            h.update(p.to_bytes(4,'big'))
+            h.update(self.view[p<<PageBits:(p+1)<<PageBits])
+        return h.digest()
+
+#peak resident memory of this process in MB, None where it can't be read
+def PeakRSS():
+    try:
+        import resource
+    except ImportError:
+        return None
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #linux reports kB, mac reports bytes
+    if os.uname().sysname=='Darwin':
+        return r/(1024*1024)
+    return r/1024
@@ -0,0 +1,55 @@
+#One pool of worker processes for the whole export. It's made the first time images
+#are written and shared by models, skyboxes and segment 2, instead of every model
+#starting and stopping its own pool. Tasks carry the image data and parameters they
+#need, never the rom. main closes it at the end.
+import multiprocessing as mp
+import Lazy
+import Output
+BinPNG = Lazy.Import('BinPNG')
+
+Pool = None
+
+#the shared pool, None when images should be written in this process
+def Get():
+    global Pool
+    #pool workers can't start pools of their own, levels exported with Jobs>1 write images serially
+    if mp.current_process().daemon or mp.cpu_count()<2:
+        return None
+    if Pool is None:
+        Pool = mp.Pool(mp.cpu_count()-1)
+    return Pool
+
+def Close():
+    global Pool
+    if Pool is not None:
+        Pool.close()
+        Pool.join()
+        Pool = None
+
+#func of every item, in the pool when there is one
+def Map(func,items):
+    p = Get()
+    if not p or not items:
+        return list(map(func,items))
+    return p.map(func,items)
+
+#task = (func,args), calls func(*args[:-1],png) where args[-1] is the png name without
+#the extension. returns the crc of the png and the counts it added to Output.Stats
+def WriteImage(task):
+    func=task[0]
+    args=task[1]
+    stats = list(Output.Stats)
+    img = BinPNG.MakeImage(args[-1])
+    func(*args[:-1],img)
+    img.close()
+    return [BinPNG.GetCHKSM(img.name),[a-b for a,b in zip(Output.Stats,stats)]]
+
+#write the pngs of every task, returns their crcs
+def WriteImages(tasks):
+    p = Get()
+    if not p or not tasks:
+        return [r[0] for r in map(WriteImage,tasks)]
+    res = p.map(WriteImage,tasks)
+    #written by the pool, this process has to know about them or they'd get pruned
+    Output.Mark([t[1][-1]+'.png' for t in tasks],[sum(r[1][i] for r in res) for i in (0,1)])
+    return [r[0] for r in res]